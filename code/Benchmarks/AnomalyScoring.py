@@ -0,0 +1,69 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import SNePCA
+import SNeStreamPCA
+
+import os
+import shutil
+import tempfile
+import time
+
+
+# Builds the Q / Hotelling T^2 AnomalyScorer of every phase range, checks the
+# statistics against an explicit reconstruction, lists the flagged library
+# spectra, and times chunked scoring of a large memory-mapped library made by
+# adding noise to copies of the dataset0 spectra.
+
+datadir = '../../Data/DataProducts/'
+phases = [0, 5, 10, 15]
+ncomp = 5
+alpha = 0.01
+nlarge = 100000
+
+for ph in phases:
+    pcaobj = SNePCA.SNePCA(snid.loadPickle(datadir + 'dataset%d.pickle'%(ph)), ph - 5, ph + 5)
+    pcaobj.snidPCA()
+    scorer = pcaobj.anomalyScorer(ncomp=ncomp, alpha=alpha)
+    Q, T2 = scorer.scores(pcaobj.specMatrix)
+
+    centered = pcaobj.specMatrix - scorer.mean
+    coeffs = np.dot(centered, scorer.evecs.T)
+    Qdirect = np.sum((centered - np.dot(coeffs, scorer.evecs))**2, axis=1)
+    T2direct = np.sum(coeffs**2 / np.var(coeffs, axis=0, ddof=1), axis=1)
+    parametric = pcaobj.anomalyScorer(ncomp=ncomp, alpha=alpha, method='parametric')
+
+    qFlag, t2Flag = scorer.flags(Q, T2)
+    print('dataset%d: max rel err Q %.1e, T2 %.1e; limits Q %.2f (parametric %.2f), T2 %.2f (parametric %.2f)'
+          %(ph, np.max(np.abs(Q - Qdirect) / Qdirect), np.max(np.abs(T2 - T2direct) / T2direct),
+            scorer.qLimit, parametric.qLimit, scorer.t2Limit, parametric.t2Limit))
+    qFlag, t2Flag = parametric.flags(Q, T2)
+    print('    above the parametric limits: Q %s, T2 %s'%(', '.join(pcaobj.pcaNames[qFlag]),
+                                                      ', '.join(pcaobj.pcaNames[t2Flag])))
+
+pcaobj = SNePCA.SNePCA(snid.loadPickle(datadir + 'dataset0.pickle'), -5, 5)
+pcaobj.snidPCA()
+scorer = pcaobj.anomalyScorer(ncomp=ncomp, alpha=alpha)
+tmpdir = tempfile.mkdtemp()
+try:
+    path = os.path.join(tmpdir, 'library.npy')
+    rng = np.random.RandomState(0)
+    store = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                      shape=(nlarge, pcaobj.specMatrix.shape[1]))
+    for start in range(0, nlarge, 10000):
+        rows = rng.randint(len(pcaobj.specMatrix), size=min(10000, nlarge - start))
+        store[start:start + len(rows)] = pcaobj.specMatrix[rows] + 0.05 * rng.randn(len(rows), store.shape[1])
+    store.flush()
+    del store
+    size = os.path.getsize(path)
+
+    for chunksize in [1000, 10000, 50000]:
+        start = time.time()
+        Q, T2 = scorer.scoreChunks(SNeStreamPCA.memmapChunks(path, chunksize))
+        elapsed = time.time() - start
+        qFlag, t2Flag = scorer.flags(Q, T2)
+        print('%d spectra, chunksize %d: %.2f s, %.0f spectra/s, %.0f MB/s, %.1f%% above the Q limit'
+              %(nlarge, chunksize, elapsed, nlarge / elapsed, size / elapsed / 1e6, 100 * np.mean(qFlag)))
+finally:
+    shutil.rmtree(tmpdir)
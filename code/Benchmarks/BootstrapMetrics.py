@@ -0,0 +1,46 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import SNePCA
+import SNeCV
+
+import time
+
+
+# Cross validates the SVM on the (1, 5) projection of the -5 to 5 day phase
+# range, computes the per-type precision, recall and confusion matrix of the
+# test predictions with SNeCV.bootstrapMetrics, checks the accuracy interval
+# against a bootstrap with a Python loop over replicates, and compares their
+# timings.
+
+datadir = '../../Data/DataProducts/'
+nboot = 1000
+
+dataset = snid.loadPickle(datadir + 'dataset0.pickle')
+pcaobj = SNePCA.SNePCA(dataset, -5, 5)
+pcaobj.snidPCA()
+pcaobj.calcPCACoeffs()
+truth, splits, seeds = SNeCV.pcaSplits(pcaobj, 50, 0.3, 0)
+scores, _, predictions = SNeCV.fitSplits(pcaobj.pcaCoeffMatrix[:,[0, 4]], truth, splits, seeds)
+
+start = time.time()
+metrics = SNeCV.bootstrapMetrics(truth, splits, predictions, nboot=nboot, seed=0)
+vectorized = time.time() - start
+
+start = time.time()
+rows = np.concatenate([test for _, test in splits])
+correct = truth[rows] == np.concatenate(predictions)
+tested = np.unique(rows)
+draws = np.random.RandomState(0).randint(len(tested), size=(nboot, len(tested)))
+accuracy = []
+for draw in draws:
+    sel = np.concatenate([np.flatnonzero(rows == tested[u]) for u in draw])
+    accuracy.append(np.mean(correct[sel]))
+looped = time.time() - start
+
+print('accuracy %.3f (%.3f-%.3f), loop (%.3f-%.3f), mean split score %.3f'%(
+    metrics['accuracy'] + tuple(np.percentile(accuracy, [2.5, 97.5])) + (np.mean(scores),)))
+print('%d replicates: vectorized %.3f s, loop %.3f s'%(nboot, vectorized, looped))
+print(metrics['metrics'].round(3).to_string())
+print(metrics['confusion'].round(3).to_string())
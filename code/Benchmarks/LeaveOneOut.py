@@ -0,0 +1,42 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import SNePCA
+from sklearn.decomposition import PCA
+
+import time
+
+
+# Checks the held out coefficients of SNePCA.leaveOneOutCoeffs against brute
+# force refits of the PCA with each SN removed, and compares their timings.
+
+datadir = '../../Data/DataProducts/'
+phases = [0, 5, 10, 15]
+ncomp = 5
+
+for ph in phases:
+    dataset = snid.loadPickle(datadir + 'dataset%d.pickle'%(ph))
+    snidPCA = SNePCA.SNePCA(dataset, ph - 5, ph + 5)
+    snidPCA.snidPCA()
+    fullEvecs = snidPCA.evecs[:ncomp]
+
+    start = time.time()
+    looCoeffs = snidPCA.leaveOneOutCoeffs(ncomp=ncomp)
+    tDowndate = time.time() - start
+
+    start = time.time()
+    snnames = np.array(snidPCA.pcaNames)
+    bruteCoeffs = np.empty(looCoeffs.shape)
+    for snname in np.unique(snnames):
+        heldOut = snnames == snname
+        pca = PCA()
+        pca.fit(snidPCA.specMatrix[np.logical_not(heldOut)])
+        evecs = pca.components_[:ncomp]
+        dots = np.sum(evecs * fullEvecs, axis=1)
+        evecs = evecs * np.where(dots < 0, -1.0, 1.0)[:,None]
+        bruteCoeffs[heldOut] = np.dot(snidPCA.specMatrix[heldOut], evecs.T)
+    tBrute = time.time() - start
+
+    print('dataset%d: %d SNe, downdates %.1f ms, brute force %.1f ms, max |coefficient difference| %.2e'
+          %(ph, len(np.unique(snnames)), 1e3*tDowndate, 1e3*tBrute, np.max(np.abs(looCoeffs - bruteCoeffs))))
@@ -0,0 +1,37 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import pandas as pd
+import SNePhase
+import SNeCV
+
+import time
+
+
+# Builds the pairwise SVM score tables of all four phase ranges with
+# SNeCV.pairwiseScoreTables, reports the timing of the first (uncached) and
+# second (cached) call, and compares the tables with the published tables in
+# Data/DataProducts/svm_score_tables. The published tables used unseeded
+# splits, so agreement is at the level of the score standard deviations.
+
+datadir = '../../Data/DataProducts/'
+cachedir = datadir + 'cache/'
+phases = [0, 5, 10, 15]
+ncomp = 10
+ncv = 50
+
+bundle = SNePhase.PhaseBundle(datadir)
+bundle.fit(cachedir=cachedir)
+
+for label in ['uncached', 'cached']:
+    start = time.time()
+    means_tables, std_tables = SNeCV.pairwiseScoreTables(bundle.pcas, ncomp=ncomp, ncv=ncv, seed=0,
+                                                         n_jobs=-1, cachedir=cachedir)
+    print('%s: %.1f s'%(label, time.time() - start))
+
+for ph, means, stds in zip(phases, means_tables, std_tables):
+    published = pd.read_pickle(datadir + 'svm_score_tables/means_svm_table_%d.pickle'%(ph))
+    diff = np.abs(means.values - published.values)
+    print('phase %d: max |mean score difference| %.3f, median score std %.3f'%(ph, np.max(diff),
+                                                                              np.median(stds.values[stds.values > 0])))
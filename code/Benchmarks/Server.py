@@ -0,0 +1,79 @@
+import sys
+sys.path.append('../')
+import numpy as np
+import SNePhase
+import SNeCV
+import SNeServer
+
+import asyncio
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Starts a SNeServer.ClassificationServer on localhost in a background thread,
+# sends concurrent /classify requests of single spectra plus one .lnw upload,
+# checks the answers against SESNClassifier.classify in this process, and
+# prints the client side throughput and the server counters.
+
+datadir = '../../Data/DataProducts/'
+cachedir = datadir + 'cache/'
+port = 8765
+nrequests = 2000
+nclients = 32
+
+if __name__ == '__main__':
+    bundle = SNePhase.PhaseBundle(datadir)
+    bundle.fit(cachedir=cachedir)
+    clf = SNeCV.trainClassifier(bundle.pcas, ncv=50, seed=0)
+    spectra = np.vstack([pcaobj.specMatrix for pcaobj in bundle.pcas])
+    phases = np.concatenate([(pcaobj.phasemin + pcaobj.phasemax) / 2.0 * np.ones(len(pcaobj.specMatrix))
+                             for pcaobj in bundle.pcas])
+    expected, _ = clf.classify(spectra, phases)
+
+    server = SNeServer.ClassificationServer(clf, maxDelay=0.002)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start(port=port))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.daemon = True
+    thread.start()
+
+    def post(path, body, conn):
+        conn.request('POST', path, body=body, headers={'Content-Type':'application/json'})
+        return json.loads(conn.getresponse().read().decode())
+
+    def client(inds):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        wrong = 0
+        for i in inds:
+            reply = post('/classify', json.dumps({'spectra':[spectra[i].tolist()], 'phases':[phases[i]]}), conn)
+            wrong += reply['types'][0] != expected[i]
+        conn.close()
+        return wrong
+
+    inds = np.arange(nrequests) % len(spectra)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=nclients) as pool:
+        wrong = sum(pool.map(client, np.array_split(inds, nclients)))
+    elapsed = time.time() - start
+    print('%d requests from %d clients in %.2f s (%.0f requests/s), %d mismatches'
+          %(nrequests, nclients, elapsed, nrequests / elapsed, wrong))
+
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    with open('../Tutorial_Data/18gep.lnw') as lnw:
+        start = time.time()
+        reply = post('/classify/lnw', lnw.read(), conn)
+    if 'error' in reply:
+        print('18gep.lnw upload failed: ' + reply['error'])
+    else:
+        print('18gep.lnw upload in %.2f s: '%(time.time() - start) +
+              ', '.join('%.1f d %s'%(ph, tp) for ph, tp in zip(reply['phases'], reply['types'])))
+    conn.request('GET', '/stats')
+    print(json.dumps(json.loads(conn.getresponse().read().decode()), indent=1))
+    conn.close()
+
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
@@ -0,0 +1,80 @@
+import sys
+import time
+sys.path.append('../')
+import numpy as np
+import SNIDsn
+import SNePhase
+import SNeCV
+import SESNClassifier
+
+
+# Checks SESNClassifier.shiftResiduals against least squares fits of shifted
+# copies, and the recovery of pixel shifts by SNePCA.projectShifted and
+# SESNClassifier.classifyShifted for every phase range: unshifted library
+# spectra should come back at shift 0, and library spectra shifted by a few
+# pixels, either on the wider SNID grid or cut to the dataset range, at the
+# injected shift. The vote types of unshifted spectra are compared with
+# SESNClassifier.classify. Last, projectShifted is timed on a batch of 2000
+# spectra.
+
+datadir = '../../Data/DataProducts/'
+cachedir = datadir + 'cache/'
+maxShift = 10
+injected = [3, -7]
+
+bundle = SNePhase.PhaseBundle(datadir)
+bundle.fit(cachedir=cachedir)
+clf = SNeCV.trainClassifier(bundle.pcas, ncv=20)
+snidwvl, _, _ = SNIDsn.snid_wvl_axis()
+
+pcaobj = bundle.pcas[0]
+mean = np.mean(pcaobj.specMatrix, axis=0)
+basis = pcaobj.evecs[:10]
+spectra = pcaobj.specMatrix[:5].copy()
+spectra[1, 50:70] = np.nan
+shifts = np.arange(-4, 5)
+residuals, _ = SESNClassifier.shiftResiduals(spectra, mean, basis, shifts, penalty=0.01)
+maxerr = 0.0
+for i in range(len(spectra)):
+    for k, s in enumerate(shifts):
+        shifted = np.nan * np.ones(spectra.shape[1])
+        src = np.arange(spectra.shape[1]) + s
+        inside = (src >= 0) & (src < spectra.shape[1])
+        shifted[inside] = spectra[i, src[inside]]
+        obs = np.isfinite(shifted)
+        fit = np.linalg.lstsq(basis[:,obs].T, shifted[obs] - mean[obs], rcond=None)[0]
+        direct = np.sum((shifted[obs] - mean[obs] - np.dot(fit, basis[:,obs]))**2) + 0.01 * np.sum(~obs)
+        maxerr = max(maxerr, abs(direct - residuals[i, k]) / direct)
+print('shiftResiduals max rel err vs least squares %.1e'%(maxerr))
+
+for w, pcaobj in enumerate(bundle.pcas):
+    spectra = pcaobj.specMatrix
+    nspec, nwvl = spectra.shape
+    phases = np.repeat(np.mean(clf.windows[w]), nspec)
+    start = np.argmin(np.abs(snidwvl - pcaobj.wavelengths[0]))
+
+    result = pcaobj.projectShifted(spectra, maxShift=maxShift)
+    types, _, bestShift, _ = clf.classifyShifted(spectra, phases, maxShift=maxShift)
+    line = 'window %d: shift 0 %.2f (classifier %.2f, type as classify %.2f)'%(
+        w, np.mean(result['bestShift'] == 0), np.mean(bestShift == 0),
+        np.mean(types == clf.classify(spectra, phases)[0]))
+    for s in injected:
+        wide = np.nan * np.ones((nspec, len(snidwvl)))
+        wide[:, start + s:start + s + nwvl] = spectra
+        cut = np.nan * np.ones((nspec, nwvl))
+        if s > 0:
+            cut[:, s:] = spectra[:, :-s]
+        else:
+            cut[:, :s] = spectra[:, -s:]
+        wideShift = pcaobj.projectShifted(wide, maxShift=maxShift, offset=start)['bestShift']
+        cutShift = pcaobj.projectShifted(cut, maxShift=maxShift)['bestShift']
+        _, _, clfShift, _ = clf.classifyShifted(cut, phases, maxShift=maxShift)
+        line += ', %+d: %.2f wide, %.2f cut (classifier %.2f)'%(s, np.mean(wideShift == s), np.mean(cutShift == s),
+                                                               np.mean(clfShift == s))
+    print(line)
+
+pcaobj = bundle.pcas[0]
+batch = np.repeat(pcaobj.specMatrix, 2000 // len(pcaobj.specMatrix) + 1, axis=0)[:2000]
+start = time.time()
+pcaobj.projectShifted(batch, maxShift=maxShift)
+print('projectShifted of %d spectra: %.2f s'%(len(batch), time.time() - start))
@@ -0,0 +1,43 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import SNePCA
+import SNeStreamPCA
+
+import time
+import tracemalloc
+
+
+# Checks that the out-of-core StreamingPCA reproduces the in-memory SNePCA.snidPCA
+# eigenspectra on the shipped datasets, and reports the fit time and peak memory
+# for a few chunk sizes.
+
+datadir = '../../Data/DataProducts/'
+phases = [0, 5, 10, 15]
+ncheck = 10
+
+for ph in phases:
+    path = datadir + 'dataset%d.pickle'%(ph)
+    dataset = snid.loadPickle(path)
+    snidPCA = SNePCA.SNePCA(dataset, ph - 5, ph + 5)
+    snidPCA.snidPCA()
+
+    for chunksize in [1, 8, 64]:
+        tracemalloc.start()
+        start = time.time()
+        stream = SNeStreamPCA.StreamingPCA()
+        stream.fit(SNeStreamPCA.pickleChunks([path], chunksize))
+        elapsed = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # eigenspectra signs are arbitrary, so compare up to sign
+        overlap = np.abs(np.sum(stream.evecs[:ncheck] * snidPCA.evecs[:ncheck], axis=1))
+        evecErr = np.max(np.abs(np.abs(stream.evecs[:ncheck]) - np.abs(snidPCA.evecs[:ncheck])))
+        evalErr = np.max(np.abs(stream.evals[:ncheck] - snidPCA.evals[:ncheck]))
+        print('dataset%d chunksize=%3d: min |overlap| = %.12f, max evec err = %.2e, '
+              'max evals err = %.2e, %.1f ms, peak %.2f MB'%(ph, chunksize, np.min(overlap), evecErr,
+                                                            evalErr, 1e3*elapsed, peak/1e6))
+        assert np.min(overlap) > 1 - 1e-8
+        assert evalErr < 1e-10
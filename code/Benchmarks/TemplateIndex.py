@@ -0,0 +1,47 @@
+import sys
+sys.path.append('../')
+import numpy as np
+import SNePhase
+
+import time
+
+
+# Builds (or loads from the cache) the TemplateIndex of every phase range,
+# checks its k nearest neighbour answers against a brute force search, and
+# times batched k nearest neighbour and radius queries of the library
+# spectra themselves.
+
+datadir = '../../Data/DataProducts/'
+cachedir = datadir + 'cache/'
+ncomp = 5
+k = 5
+nrepeat = 100
+
+bundle = SNePhase.PhaseBundle(datadir)
+bundle.fit(cachedir=cachedir)
+
+for pcaobj in bundle.pcas:
+    start = time.time()
+    index = pcaobj.templateIndex(ncomp=ncomp, cachedir=cachedir)
+    tLoad = time.time() - start
+    queries = pcaobj.pcaCoeffMatrix[:,:ncomp]
+
+    dist, inds = index.query(queries, k=k)
+    brute = np.sort(np.sqrt(np.sum((queries[:,None,:] - index.coeffs[None,:,:])**2, axis=2)), axis=1)[:,:k]
+
+    start = time.time()
+    for i in range(nrepeat):
+        index.query(queries, k=k)
+    tQuery = (time.time() - start) / nrepeat
+    start = time.time()
+    for i in range(nrepeat):
+        index.queryRadius(queries, np.median(dist[:,-1]))
+    tRadius = (time.time() - start) / nrepeat
+
+    print('phase %d to %d: index %.1f ms, %d-NN query of %d spectra %.3f ms (%.1f us per spectrum), '
+          'radius query %.3f ms, max |distance - brute force| %.1e'
+          %(pcaobj.phasemin, pcaobj.phasemax, 1e3*tLoad, k, len(queries), 1e3*tQuery,
+            1e6*tQuery/len(queries), 1e3*tRadius, np.max(np.abs(dist - brute))))
+    nearest = inds[0,1]
+    print('    nearest template to %s: %s at %.1f d (%s)'%(index.names[0], index.names[nearest],
+                                                            index.phases[nearest], index.types[nearest]))
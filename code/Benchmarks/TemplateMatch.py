@@ -0,0 +1,70 @@
+import sys
+sys.path.append('../')
+import numpy as np
+import SNIDdataset as snid
+import SNIDmatch
+
+import time
+
+
+# Builds a SNIDmatch.TemplateLibrary from the pickled datasets, checks the
+# peak heights against a direct correlation, recovers the redshifts of
+# artificially redshifted library spectra, and times matching single spectra
+# and batches against a library of 5000 templates made by repeating the
+# library.
+
+datadir = '../../Data/DataProducts/'
+ntemplates = 5000
+nspec = 8
+batches = [1, 8, 32]
+
+library = None
+for phase in [0, 5, 10, 15]:
+    dataset = snid.loadPickle(datadir + 'dataset%d.pickle'%(phase))
+    lib = SNIDmatch.TemplateLibrary.fromDataset(dataset)
+    if library is None:
+        library = lib
+        continue
+    library = SNIDmatch.TemplateLibrary(np.vstack([library.fluxes, lib.fluxes]),
+                                        np.concatenate([library.names, lib.names]),
+                                        np.concatenate([library.phases, lib.phases]),
+                                        np.concatenate([library.types, lib.types]))
+print('library of %d spectra'%(len(library.names)))
+
+rng = np.random.RandomState(0)
+rows = rng.choice(len(library.names), nspec, replace=False)
+shifts = rng.randint(0, 400, nspec)
+spectra = np.zeros((nspec, library.nw))
+for i, (row, shift) in enumerate(zip(rows, shifts)):
+    spectra[i, shift:] = library.fluxes[row, :library.nw - shift]
+
+result = library.correlate(spectra)
+logGrid, _, _ = SNIDmatch.logGridFluxes(spectra)
+sffts, snorms = library.transform(logGrid)
+direct = []
+for i, (row, shift) in enumerate(zip(rows, shifts)):
+    s = np.fft.irfft(sffts[i], library.nfft)
+    t = np.fft.irfft(library.ffts[row], library.nfft)
+    direct.append(np.dot(s, np.roll(t, shift)) / (snorms[i] * library.norms[row]))
+zTrue = np.power(10, shifts * library.dwlog) - 1
+zFound = result['z'][np.arange(nspec), rows]
+print('max |z - true z| %.1e (one pixel is dz = %.1e), max |h - direct correlation at the true shift| %.1e'
+      %(np.max(np.abs(zFound - zTrue)), np.log(10) * library.dwlog, np.max(np.abs(result['h'][np.arange(nspec), rows] - direct))))
+
+matches = library.match(spectra, ntop=1)
+# the phase ranges of the datasets overlap, so a spectrum can be in the library twice
+print('best match is the shifted spectrum itself for %d of %d spectra'
+      %(sum((library.names[m.index[0]] == library.names[row]) and (library.phases[m.index[0]] == library.phases[row])
+            for m, row in zip(matches, rows)), nspec))
+
+tiles = int(np.ceil(ntemplates / float(len(library.names))))
+big = SNIDmatch.TemplateLibrary(np.tile(library.fluxes, (tiles, 1))[:ntemplates],
+                                np.tile(library.names, tiles)[:ntemplates],
+                                np.tile(library.phases, tiles)[:ntemplates],
+                                np.tile(library.types, tiles)[:ntemplates])
+batch = np.tile(spectra, (int(np.ceil(max(batches) / float(nspec))), 1))
+for n in batches:
+    start = time.time()
+    big.match(batch[:n])
+    elapsed = time.time() - start
+    print('%d spectra against %d templates: %.3f s (%.3f s per spectrum)'%(n, ntemplates, elapsed, elapsed / n))
@@ -0,0 +1,52 @@
+import sys
+sys.path.append('../')
+import numpy as np
+import SNePhase
+import SNeCV
+from sklearn.svm import LinearSVC
+
+import time
+
+
+# Builds the cross-phase transfer matrix of the four phase ranges with
+# SNeCV.transferMatrix, checks one train/test pair against the out of bag
+# vote of LinearSVC fits scored on a direct projection, and prints the vote
+# accuracies with their bootstrap confidence intervals. The matrix is timed
+# without the cache, filling the cache of out of bag votes, and from it.
+
+datadir = '../../Data/DataProducts/'
+cachedir = datadir + 'cache/'
+ncv = 50
+
+bundle = SNePhase.PhaseBundle(datadir)
+bundle.fit(cachedir=cachedir)
+
+train, test = 0, 2
+trainobj, testobj = bundle.pcas[train], bundle.pcas[test]
+inds = [c - 1 for c in SNeCV.PAPER_COMPONENTS[train]]
+truth, splits, seeds = SNeCV.pcaSplits(trainobj, ncv, 0.3, 0)
+testTruth, _, _ = SNeCV.pcaSplits(testobj, 1)
+X = np.dot(trainobj.evecs[inds], testobj.specMatrix.T).T
+trainNames, testNames = np.asarray(trainobj.pcaNames), np.asarray(testobj.pcaNames)
+votes = np.zeros((len(X), 4))
+for (rows, _), sd in zip(splits, seeds):
+    pred = LinearSVC(random_state=sd).fit(trainobj.pcaCoeffMatrix[rows][:,inds], truth[rows]).predict(X)
+    unseen = np.flatnonzero(~np.isin(testNames, trainNames[rows]))
+    votes[unseen, pred[unseen] - 1] += 1
+scored = np.sum(votes, axis=1) > 0
+direct = np.mean(np.argmax(votes[scored], axis=1) + 1 == testTruth[scored])
+
+for label, cache in [('uncached', None), ('filling the cache', cachedir), ('cached', cachedir)]:
+    start = time.time()
+    scores, lower, upper, support = SNeCV.transferMatrix(bundle.pcas, ncv=ncv, seed=0, n_jobs=-1,
+                                                         cachedir=cache)
+    print('%s: %.2f s'%(label, time.time() - start))
+print('pair (%d, %d): %.4f, direct %.4f'%(train, test, scores.values[train, test], direct))
+table = scores.copy().astype(object)
+for i in range(len(scores)):
+    for j in range(len(scores)):
+        table.iloc[i, j] = '%.2f (%.2f-%.2f)'%(scores.values[i, j], lower.values[i, j], upper.values[i, j])
+print('train (rows) x test (columns) out of bag vote accuracy, 95% bootstrap interval')
+print(table.to_string())
+print('spectra scored')
+print(support.to_string())
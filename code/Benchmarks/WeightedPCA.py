@@ -0,0 +1,43 @@
+import sys
+sys.path.append('../')
+import SNIDdataset as snid
+import numpy as np
+import SNePCA
+
+import time
+
+
+# Times the uncertainty weighted SNePCA.snidWeightedPCA against the unweighted
+# SNePCA.snidPCA on the shipped datasets, and reports the number of iterations,
+# the weighted chi^2 reduction and the overlap of the weighted eigenspectra with
+# the unweighted ones.
+
+datadir = '../../Data/DataProducts/'
+phases = [0, 5, 10, 15]
+ncomp = 10
+nrepeat = 5
+
+for ph in phases:
+    dataset = snid.loadPickle(datadir + 'dataset%d.pickle'%(ph))
+    snidPCA = SNePCA.SNePCA(dataset, ph - 5, ph + 5)
+
+    start = time.time()
+    for i in range(nrepeat):
+        snidPCA.snidPCA()
+    tUnweighted = (time.time() - start) / nrepeat
+    unweighted = np.copy(snidPCA.evecs[:ncomp])
+    unweightedVar = snidPCA.evals_cs[ncomp - 1]
+
+    start = time.time()
+    for i in range(nrepeat):
+        snidPCA.snidPCA()
+        chi2, converged = snidPCA.snidWeightedPCA(ncomp=ncomp)
+    tWeighted = (time.time() - start) / nrepeat - tUnweighted
+
+    overlap = np.abs(np.sum(snidPCA.weightedEvecs * unweighted, axis=1))
+    print('dataset%d: snidPCA %.1f ms, snidWeightedPCA %.1f ms (%d iterations, %s), '
+          'chi2 %.4g -> %.4g'%(ph, 1e3*tUnweighted, 1e3*tWeighted, len(chi2),
+                               'converged' if converged else 'not converged', chi2[0], chi2[-1]))
+    print('    cumulative variance of %d components: unweighted %.3f, weighted %.3f'%(
+        ncomp, unweightedVar, snidPCA.weightedEvals_cs[-1]))
+    print('    |overlap| with unweighted eigenspectra: ' + ' '.join('%.2f'%(o) for o in overlap))
@@ -4,6 +4,7 @@ import SNIDsn
 import SNIDdataset as snid
 import numpy as np
 import SNePCA
+import SNePhase
 
 import plotly.plotly as ply
 import plotly.graph_objs as go
@@ -14,80 +15,43 @@ import matplotlib.pyplot as plt
 import pandas
 
 
-# ### Load preprocessed SNID datasets 
+if __name__ == '__main__':
+    # ### Load preprocessed SNID datasets and run PCA
 
-# datasetX contains the SNID spectra for the phase range X +/- 5 days, where each SNe has only 1 spectrum in this phase range.  The spectrum with phase closest to X is chosen. All of the preprocessing has been applied (wavelength cut, smoothing, phase type, etc)
+    # datasetX contains the SNID spectra for the phase range X +/- 5 days, where each SNe has only 1 spectrum in this phase range.  The spectrum with phase closest to X is chosen. All of the preprocessing has been applied (wavelength cut, smoothing, phase type, etc)
 
-dataset0 = snid.loadPickle('../../Data/DataProducts/dataset0.pickle')
-dataset5 = snid.loadPickle('../../Data/DataProducts/dataset5.pickle')
-dataset10 = snid.loadPickle('../../Data/DataProducts/dataset10.pickle')
-dataset15 = snid.loadPickle('../../Data/DataProducts/dataset15.pickle')
+    bundle = SNePhase.PhaseBundle('../../Data/DataProducts/')
+    bundle.fit(cachedir='../../Data/DataProducts/cache/')
+    snidPCA0, snidPCA5, snidPCA10, snidPCA15 = bundle.pcas
 
 
-# ### Run PCA
+    # Set colors for plots
+    snidPCA0.Ib_color = 'steelblue'
+    snidPCA5.Ib_color = 'steelblue'
+    snidPCA10.Ib_color = 'steelblue'
+    snidPCA15.Ib_color = 'steelblue'
+    snidPCA0.IIb_color = 'limegreen'
+    snidPCA5.IIb_color = 'limegreen'
+    snidPCA10.IIb_color = 'limegreen'
+    snidPCA15.IIb_color = 'limegreen'
+    snidPCA0.IcBL_color = 'darkgrey'
+    snidPCA5.IcBL_color = 'darkgrey'
+    snidPCA10.IcBL_color = 'darkgrey'
+    snidPCA15.IcBL_color = 'darkgrey'
 
-snidPCA0 = SNePCA.SNePCA(dataset0, -5, 5)
-snidPCA5 = SNePCA.SNePCA(dataset5, 0, 10)
-snidPCA10 = SNePCA.SNePCA(dataset10, 5, 15)
-snidPCA15 = SNePCA.SNePCA(dataset15, 10, 20)
 
-snidPCA0.snidPCA()
-snidPCA5.snidPCA()
-snidPCA10.snidPCA()
-snidPCA15.snidPCA()
+    snidPCA0.IIb_ellipse_color = 'green'
+    snidPCA5.IIb_ellipse_color = 'green'
+    snidPCA10.IIb_ellipse_color = 'green'
+    snidPCA15.IIb_ellipse_color = 'green'
+    snidPCA0.IcBL_ellipse_color = 'grey'
+    snidPCA5.IcBL_ellipse_color = 'grey'
+    snidPCA10.IcBL_ellipse_color = 'grey'
+    snidPCA15.IcBL_ellipse_color = 'grey'
 
 
-# Choose the arbitrary signs for the eigenspectra so that they are consistent across phases, and so that the eigenspectra features match H and He absorption features in the mean spectra.
 
-snidPCA10.evecs[0] = -snidPCA10.evecs[0]
+    f, ax = snidPCA15.pcaCumPlot((32,15), fontsize=55)
 
-snidPCA5.evecs[1] = -snidPCA5.evecs[1]
-snidPCA10.evecs[1] = -snidPCA10.evecs[1]
-snidPCA15.evecs[1] = -snidPCA15.evecs[1]
-
-snidPCA0.evecs[2] = -snidPCA0.evecs[2]
-snidPCA5.evecs[2] = -snidPCA5.evecs[2]
-snidPCA15.evecs[2] = -snidPCA15.evecs[2]
-
-snidPCA0.evecs[3] = -snidPCA0.evecs[3]
-snidPCA5.evecs[3] = -snidPCA5.evecs[3]
-snidPCA10.evecs[3] = -snidPCA10.evecs[3]
-
-snidPCA0.evecs[4] = -snidPCA0.evecs[4]
-
-snidPCA0.calcPCACoeffs()
-snidPCA5.calcPCACoeffs()
-snidPCA10.calcPCACoeffs()
-snidPCA15.calcPCACoeffs()
-
-
-# Set colors for plots
-snidPCA0.Ib_color = 'steelblue'
-snidPCA5.Ib_color = 'steelblue'
-snidPCA10.Ib_color = 'steelblue'
-snidPCA15.Ib_color = 'steelblue'
-snidPCA0.IIb_color = 'limegreen'
-snidPCA5.IIb_color = 'limegreen'
-snidPCA10.IIb_color = 'limegreen'
-snidPCA15.IIb_color = 'limegreen'
-snidPCA0.IcBL_color = 'darkgrey'
-snidPCA5.IcBL_color = 'darkgrey'
-snidPCA10.IcBL_color = 'darkgrey'
-snidPCA15.IcBL_color = 'darkgrey'
-
-
-snidPCA0.IIb_ellipse_color = 'green'
-snidPCA5.IIb_ellipse_color = 'green'
-snidPCA10.IIb_ellipse_color = 'green'
-snidPCA15.IIb_ellipse_color = 'green'
-snidPCA0.IcBL_ellipse_color = 'grey'
-snidPCA5.IcBL_ellipse_color = 'grey'
-snidPCA10.IcBL_ellipse_color = 'grey'
-snidPCA15.IcBL_ellipse_color = 'grey'
-
-
-
-f, ax = snidPCA15.pcaCumPlot((32,15), fontsize=55)
-
-f.savefig('Fig1')
+    f.savefig('Fig1')
 
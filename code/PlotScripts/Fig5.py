@@ -4,6 +4,7 @@ import SNIDsn
 import SNIDdataset as snid
 import numpy as np
 import SNePCA
+import SNePhase
 
 import plotly.plotly as ply
 import plotly.graph_objs as go
@@ -14,204 +15,167 @@ import matplotlib.pyplot as plt
 import pandas
 
 
-# ### Load preprocessed SNID datasets 
+if __name__ == '__main__':
+    # ### Load preprocessed SNID datasets and run PCA
 
-# datasetX contains the SNID spectra for the phase range X +/- 5 days, where each SNe has only 1 spectrum in this phase range.  The spectrum with phase closest to X is chosen. All of the preprocessing has been applied (wavelength cut, smoothing, phase type, etc)
+    # datasetX contains the SNID spectra for the phase range X +/- 5 days, where each SNe has only 1 spectrum in this phase range.  The spectrum with phase closest to X is chosen. All of the preprocessing has been applied (wavelength cut, smoothing, phase type, etc)
 
-dataset0 = snid.loadPickle('../../Data/DataProducts/dataset0.pickle')
-dataset5 = snid.loadPickle('../../Data/DataProducts/dataset5.pickle')
-dataset10 = snid.loadPickle('../../Data/DataProducts/dataset10.pickle')
-dataset15 = snid.loadPickle('../../Data/DataProducts/dataset15.pickle')
+    bundle = SNePhase.PhaseBundle('../../Data/DataProducts/')
+    bundle.fit(cachedir='../../Data/DataProducts/cache/')
+    snidPCA0, snidPCA5, snidPCA10, snidPCA15 = bundle.pcas
 
 
-# ### Run PCA
+    # Set colors for plots
+    snidPCA0.Ib_color = 'steelblue'
+    snidPCA5.Ib_color = 'steelblue'
+    snidPCA10.Ib_color = 'steelblue'
+    snidPCA15.Ib_color = 'steelblue'
+    snidPCA0.IIb_color = 'limegreen'
+    snidPCA5.IIb_color = 'limegreen'
+    snidPCA10.IIb_color = 'limegreen'
+    snidPCA15.IIb_color = 'limegreen'
+    snidPCA0.IcBL_color = 'darkgrey'
+    snidPCA5.IcBL_color = 'darkgrey'
+    snidPCA10.IcBL_color = 'darkgrey'
+    snidPCA15.IcBL_color = 'darkgrey'
 
-snidPCA0 = SNePCA.SNePCA(dataset0, -5, 5)
-snidPCA5 = SNePCA.SNePCA(dataset5, 0, 10)
-snidPCA10 = SNePCA.SNePCA(dataset10, 5, 15)
-snidPCA15 = SNePCA.SNePCA(dataset15, 10, 20)
 
-snidPCA0.snidPCA()
-snidPCA5.snidPCA()
-snidPCA10.snidPCA()
-snidPCA15.snidPCA()
+    snidPCA0.IIb_ellipse_color = 'green'
+    snidPCA5.IIb_ellipse_color = 'green'
+    snidPCA10.IIb_ellipse_color = 'green'
+    snidPCA15.IIb_ellipse_color = 'green'
+    snidPCA0.IcBL_ellipse_color = 'grey'
+    snidPCA5.IcBL_ellipse_color = 'grey'
+    snidPCA10.IcBL_ellipse_color = 'grey'
+    snidPCA15.IcBL_ellipse_color = 'grey'
 
 
-# Choose the arbitrary signs for the eigenspectra so that they are consistent across phases, and so that the eigenspectra features match H and He absorption features in the mean spectra.
+    # # Classification
 
-snidPCA10.evecs[0] = -snidPCA10.evecs[0]
+    # The following cells construct a 4 panel plot, where each panel corresponds to a 2D projection of PCA space in a different phase range.
 
-snidPCA5.evecs[1] = -snidPCA5.evecs[1]
-snidPCA10.evecs[1] = -snidPCA10.evecs[1]
-snidPCA15.evecs[1] = -snidPCA15.evecs[1]
 
-snidPCA0.evecs[2] = -snidPCA0.evecs[2]
-snidPCA5.evecs[2] = -snidPCA5.evecs[2]
-snidPCA15.evecs[2] = -snidPCA15.evecs[2]
+    f_all, axs = plt.subplots(2,2,figsize=(35,30),gridspec_kw={'wspace':.2,'hspace':.2})
 
-snidPCA0.evecs[3] = -snidPCA0.evecs[3]
-snidPCA5.evecs[3] = -snidPCA5.evecs[3]
-snidPCA10.evecs[3] = -snidPCA10.evecs[3]
 
-snidPCA0.evecs[4] = -snidPCA0.evecs[4]
 
-snidPCA0.calcPCACoeffs()
-snidPCA5.calcPCACoeffs()
-snidPCA10.calcPCACoeffs()
-snidPCA15.calcPCACoeffs()
+    #Exclude Ib-pec and Ic-pec SNe
+    exclude = ['sn2007uy', 'sn2009er', 'sn2005ek']
 
 
-# Set colors for plots
-snidPCA0.Ib_color = 'steelblue'
-snidPCA5.Ib_color = 'steelblue'
-snidPCA10.Ib_color = 'steelblue'
-snidPCA15.Ib_color = 'steelblue'
-snidPCA0.IIb_color = 'limegreen'
-snidPCA5.IIb_color = 'limegreen'
-snidPCA10.IIb_color = 'limegreen'
-snidPCA15.IIb_color = 'limegreen'
-snidPCA0.IcBL_color = 'darkgrey'
-snidPCA5.IcBL_color = 'darkgrey'
-snidPCA10.IcBL_color = 'darkgrey'
-snidPCA15.IcBL_color = 'darkgrey'
 
+    svmsc=[]
+    f_all,svmsc,av0,std0=snidPCA0.pcaPlot(1,5,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,purity=True,
+                                         excludeSNe=exclude, std_rad=1.0, svm=True, count=3, fig=f_all,
+                                         ax=f_all.axes[0],ncv=50, markOutliers=True)
 
-snidPCA0.IIb_ellipse_color = 'green'
-snidPCA5.IIb_ellipse_color = 'green'
-snidPCA10.IIb_ellipse_color = 'green'
-snidPCA15.IIb_ellipse_color = 'green'
-snidPCA0.IcBL_ellipse_color = 'grey'
-snidPCA5.IcBL_ellipse_color = 'grey'
-snidPCA10.IcBL_ellipse_color = 'grey'
-snidPCA15.IcBL_ellipse_color = 'grey'
 
 
-# # Classification
+    svmsc=[]
+    f_all,svmsc, av5, std5=snidPCA5.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,purity=True, 
+                                           excludeSNe=exclude,std_rad=1.0, svm=True, count=3, 
+                                           fig=f_all, ax=f_all.axes[1], ncv=50, markOutliers=True)
 
-# The following cells construct a 4 panel plot, where each panel corresponds to a 2D projection of PCA space in a different phase range.
 
 
-f_all, axs = plt.subplots(2,2,figsize=(35,30),gridspec_kw={'wspace':.2,'hspace':.2})
+    svmsc=[]
+    f_all,svmsc, av10, std10=snidPCA10.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,
+                                              purity=True,excludeSNe=exclude, std_rad=1.0, svm=True,
+                                              count=3, fig=f_all, ax=f_all.axes[2],ncv=50, markOutliers=True)
 
+    svmsc=[]
+    f_all,svmsc, av15, std15=snidPCA15.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,
+                                              purity=True, excludeSNe=exclude,std_rad=1.0,
+                                              svm=True, count=3, fig=f_all, ax=f_all.axes[3],ncv=50, markOutliers=True)
 
 
-#Exclude Ib-pec and Ic-pec SNe
-exclude = ['sn2007uy', 'sn2009er', 'sn2005ek']
 
 
-
-svmsc=[]
-f_all,svmsc,av0,std0=snidPCA0.pcaPlot(1,5,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,purity=True,
-                                     excludeSNe=exclude, std_rad=1.0, svm=True, count=3, fig=f_all,
-                                     ax=f_all.axes[0],ncv=50, markOutliers=True)
-
-
-
-svmsc=[]
-f_all,svmsc, av5, std5=snidPCA5.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,purity=True, 
-                                       excludeSNe=exclude,std_rad=1.0, svm=True, count=3, 
-                                       fig=f_all, ax=f_all.axes[1], ncv=50, markOutliers=True)
-
-
-
-svmsc=[]
-f_all,svmsc, av10, std10=snidPCA10.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,
-                                          purity=True,excludeSNe=exclude, std_rad=1.0, svm=True,
-                                          count=3, fig=f_all, ax=f_all.axes[2],ncv=50, markOutliers=True)
-
-svmsc=[]
-f_all,svmsc, av15, std15=snidPCA15.pcaPlot(1,3,(10,7),alphamean=.5,alphaell=.1,alphasvm=10,
-                                          purity=True, excludeSNe=exclude,std_rad=1.0,
-                                          svm=True, count=3, fig=f_all, ax=f_all.axes[3],ncv=50, markOutliers=True)
-
-
-
-
-for i,ax in enumerate(f_all.axes):
-    l = ax.get_legend()
-    t = l.get_title()
-    t.set_fontsize(30)
-    ax.tick_params(axis='both',which='major', length=20,direction='inout',labelsize=35)
-    ax.tick_params(axis='both',which='minor', length=10,direction='inout')
-    xmin, xmax = ax.get_xlim()
-    ymin, ymax = ax.get_ylim()
-    if i==0:
+    for i,ax in enumerate(f_all.axes):
         l = ax.get_legend()
         t = l.get_title()
-        l.set_title('')
-        ymax = ymax + 0.5
-        ax.set_ylim((ymin,ymax+0.5))
-        ax.text(xmin + .1,ymax - .3,'$t_{V_{max}} = 0 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av0,std0),fontsize=45)
-        ax.set_ylabel('PC5', fontsize=50)
-        ax.set_xlabel('PC1', fontsize=50)
-    elif i==1:
-        ymax = ymax + 0.5
-        ax.set_ylim((ymin,ymax+0.5))
-        ax.text(xmin + .1,ymax - .2,'$t_{V_{max}} = 5 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av5,std5),fontsize=45)
-        ax.set_ylabel('PC3', fontsize=50)
-        ax.set_xlabel('PC1', fontsize=50)
-        ax.get_legend().remove()
-    elif i==2:
-        ymax = ymax + 0.5
-        ax.set_ylim((ymin,ymax+0.5))
-        ax.text(xmin + .1,ymax - .4,'$t_{V_{max}} = 10 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av10,std10),fontsize=45)
-        ax.set_ylabel('PC3', fontsize=50)
-        ax.set_xlabel('PC1', fontsize=50)
-        ax.get_legend().remove()
-    else:
-        ymax = ymax + 0.5
-        ax.set_ylim((ymin,ymax+0.5))
-        ax.text(xmin + .1,ymax - .4,'$t_{V_{max}} = 15 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av15,std15),fontsize=45)
-        ax.set_ylabel('PC3', fontsize=50)
-        ax.set_xlabel('PC1', fontsize=50)
-        ax.get_legend().remove()
+        t.set_fontsize(30)
+        ax.tick_params(axis='both',which='major', length=20,direction='inout',labelsize=35)
+        ax.tick_params(axis='both',which='minor', length=10,direction='inout')
+        xmin, xmax = ax.get_xlim()
+        ymin, ymax = ax.get_ylim()
+        if i==0:
+            l = ax.get_legend()
+            t = l.get_title()
+            l.set_title('')
+            ymax = ymax + 0.5
+            ax.set_ylim((ymin,ymax+0.5))
+            ax.text(xmin + .1,ymax - .3,'$t_{V_{max}} = 0 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av0,std0),fontsize=45)
+            ax.set_ylabel('PC5', fontsize=50)
+            ax.set_xlabel('PC1', fontsize=50)
+        elif i==1:
+            ymax = ymax + 0.5
+            ax.set_ylim((ymin,ymax+0.5))
+            ax.text(xmin + .1,ymax - .2,'$t_{V_{max}} = 5 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av5,std5),fontsize=45)
+            ax.set_ylabel('PC3', fontsize=50)
+            ax.set_xlabel('PC1', fontsize=50)
+            ax.get_legend().remove()
+        elif i==2:
+            ymax = ymax + 0.5
+            ax.set_ylim((ymin,ymax+0.5))
+            ax.text(xmin + .1,ymax - .4,'$t_{V_{max}} = 10 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av10,std10),fontsize=45)
+            ax.set_ylabel('PC3', fontsize=50)
+            ax.set_xlabel('PC1', fontsize=50)
+            ax.get_legend().remove()
+        else:
+            ymax = ymax + 0.5
+            ax.set_ylim((ymin,ymax+0.5))
+            ax.text(xmin + .1,ymax - .4,'$t_{V_{max}} = 15 \pm 5$ days\nSVM Test Score = %.2f$\pm$%.2f'%(av15,std15),fontsize=45)
+            ax.set_ylabel('PC3', fontsize=50)
+            ax.set_xlabel('PC1', fontsize=50)
+            ax.get_legend().remove()
 
 
 
-#IIb 2std outliers:  ['sn2016gkg' 'sn2011dh']
-#Ib 2std outliers:  ['sn2004gq' 'sn2007uy' 'sn1998dt' 'sn2009er' 'sn2007kj']
-#Ic 2std outliers:  ['sn2005az']
-#IcBL 2std outliers:  ['sn2010bh']
-ax = f_all.axes[0]
+    #IIb 2std outliers:  ['sn2016gkg' 'sn2011dh']
+    #Ib 2std outliers:  ['sn2004gq' 'sn2007uy' 'sn1998dt' 'sn2009er' 'sn2007kj']
+    #Ic 2std outliers:  ['sn2005az']
+    #IcBL 2std outliers:  ['sn2010bh']
+    ax = f_all.axes[0]
 
-ax.text(-.22,1.25,'07uy',fontdict={'color':'k','fontsize':35})
-ax.text(.352,.302,'09er',fontdict={'color':'k','fontsize':35})
-ax.text(.6,-.82,'04gq',fontdict={'color':'k','fontsize':35})
-ax.text(1.45,-0.85,'98dt',fontdict={'color':'k','fontsize':35})
-ax.text(3.3,.69,'07kj',fontdict={'color':'k','fontsize':35})
+    ax.text(-.22,1.25,'07uy',fontdict={'color':'k','fontsize':35})
+    ax.text(.352,.302,'09er',fontdict={'color':'k','fontsize':35})
+    ax.text(.6,-.82,'04gq',fontdict={'color':'k','fontsize':35})
+    ax.text(1.45,-0.85,'98dt',fontdict={'color':'k','fontsize':35})
+    ax.text(3.3,.69,'07kj',fontdict={'color':'k','fontsize':35})
 
-ax.text(1.413,-2.14,'16gkg',fontdict={'color':'k','fontsize':35})
-ax.text(4.15,1.08,'11dh',fontdict={'color':'k','fontsize':35})
+    ax.text(1.413,-2.14,'16gkg',fontdict={'color':'k','fontsize':35})
+    ax.text(4.15,1.08,'11dh',fontdict={'color':'k','fontsize':35})
 
-ax.text(0.25,-0.25,'10bh',fontdict={'color':'k','fontsize':35})
+    ax.text(0.25,-0.25,'10bh',fontdict={'color':'k','fontsize':35})
 
-ax.text(2.9,1.48,'05az',fontdict={'color':'k','fontsize':35})
+    ax.text(2.9,1.48,'05az',fontdict={'color':'k','fontsize':35})
 
 
 
-#IIb 2std outliers:  ['sn2011ei' '10as']
-#Ib 2std outliers:  ['sn1998dt' 'sn2009er' 'sn2007Y']
-#Ic 2std outliers:  ['sn1990B']
-#IcBL 2std outliers:  ['sn2002ap' '16coi']
-ax = f_all.axes[1]
+    #IIb 2std outliers:  ['sn2011ei' '10as']
+    #Ib 2std outliers:  ['sn1998dt' 'sn2009er' 'sn2007Y']
+    #Ic 2std outliers:  ['sn1990B']
+    #IcBL 2std outliers:  ['sn2002ap' '16coi']
+    ax = f_all.axes[1]
 
-ax.text(2.11,-2.5,'11ei',fontdict={'color':'k','fontsize':35})
-ax.text(5.1,1.8,'10as',fontdict={'color':'k','fontsize':35})
+    ax.text(2.11,-2.5,'11ei',fontdict={'color':'k','fontsize':35})
+    ax.text(5.1,1.8,'10as',fontdict={'color':'k','fontsize':35})
 
-ax.text(0.08,-.31,'09er',fontdict={'color':'k','fontsize':35})
-ax.text(4.56,.76,'07Y',fontdict={'color':'k','fontsize':35})
-ax.text(1.58,-1.72,'98dt',fontdict={'color':'k','fontsize':35})
+    ax.text(0.08,-.31,'09er',fontdict={'color':'k','fontsize':35})
+    ax.text(4.56,.76,'07Y',fontdict={'color':'k','fontsize':35})
+    ax.text(1.58,-1.72,'98dt',fontdict={'color':'k','fontsize':35})
 
-ax.text(2.7,-0.8,'90B',fontdict={'color':'k','fontsize':35})
+    ax.text(2.7,-0.8,'90B',fontdict={'color':'k','fontsize':35})
 
-ax.text(.75,.0,'02ap',fontdict={'color':'k','fontsize':35})
-ax.text(.08,-.6,'16coi',fontdict={'color':'k','fontsize':35})
+    ax.text(.75,.0,'02ap',fontdict={'color':'k','fontsize':35})
+    ax.text(.08,-.6,'16coi',fontdict={'color':'k','fontsize':35})
 
-ax.text(-0.16,-1.12,'16gkg',fontdict={'color':'k','fontsize':35})
+    ax.text(-0.16,-1.12,'16gkg',fontdict={'color':'k','fontsize':35})
 
-ax.text(-0.28,.55,'07bg',fontdict={'color':'k','fontsize':35})
+    ax.text(-0.28,.55,'07bg',fontdict={'color':'k','fontsize':35})
 
-ax.text(3.79,.66,'07kj',fontdict={'color':'k','fontsize':35})
+    ax.text(3.79,.66,'07kj',fontdict={'color':'k','fontsize':35})
 
 
 
@@ -219,53 +183,53 @@ ax.text(3.79,.66,'07kj',fontdict={'color':'k','fontsize':35})
 
 
 
-#IIb 2std outliers:  ['sn2011ei']
-#Ib 2std outliers:  ['sn2007uy' 'sn1990U' 'sn1990I']
-#Ic 2std outliers:  ['sn1994I']
-#IcBL 2std outliers:  ['sn2002ap' 'sn2007bg']
-ax = f_all.axes[2]
+    #IIb 2std outliers:  ['sn2011ei']
+    #Ib 2std outliers:  ['sn2007uy' 'sn1990U' 'sn1990I']
+    #Ic 2std outliers:  ['sn1994I']
+    #IcBL 2std outliers:  ['sn2002ap' 'sn2007bg']
+    ax = f_all.axes[2]
 
-ax.text(1.15,-.97,'07uy',fontdict={'color':'k','fontsize':35})
-ax.text(1.39,-1.40,'90I',fontdict={'color':'k','fontsize':35})
-ax.text(4.69,.28, '90U',fontdict={'color':'k','fontsize':35})
+    ax.text(1.15,-.97,'07uy',fontdict={'color':'k','fontsize':35})
+    ax.text(1.39,-1.40,'90I',fontdict={'color':'k','fontsize':35})
+    ax.text(4.69,.28, '90U',fontdict={'color':'k','fontsize':35})
 
 
-ax.text(2.56,-2.0,'11ei',fontdict={'color':'k','fontsize':35})
+    ax.text(2.56,-2.0,'11ei',fontdict={'color':'k','fontsize':35})
 
-ax.text(2.99,-1.40,'94I',fontdict={'color':'k','fontsize':35})
+    ax.text(2.99,-1.40,'94I',fontdict={'color':'k','fontsize':35})
 
-ax.text(1.03,-.33,'02ap',fontdict={'color':'k','fontsize':35})
-ax.text(-1.02,-.95,'07ru',fontdict={'color':'k','fontsize':35})
+    ax.text(1.03,-.33,'02ap',fontdict={'color':'k','fontsize':35})
+    ax.text(-1.02,-.95,'07ru',fontdict={'color':'k','fontsize':35})
 
-ax.text(1.72,-2.40,'99ex',fontdict={'color':'k','fontsize':35})
+    ax.text(1.72,-2.40,'99ex',fontdict={'color':'k','fontsize':35})
 
 
 
 
 
-#IIb 2std outliers:  ['sn2011ei']
-#Ib 2std outliers:  ['sn2007uy' 'sn1990I' 'sn2009er' 'sn2004gq' 'sn2007Y']
-#Ic 2std outliers:  ['sn1994I']
-#IcBL 2std outliers:  ['sn2010ay' '16coi']
-ax = f_all.axes[3]
+    #IIb 2std outliers:  ['sn2011ei']
+    #Ib 2std outliers:  ['sn2007uy' 'sn1990I' 'sn2009er' 'sn2004gq' 'sn2007Y']
+    #Ic 2std outliers:  ['sn1994I']
+    #IcBL 2std outliers:  ['sn2010ay' '16coi']
+    ax = f_all.axes[3]
 
-ax.text(.66,-1.18,'09er',fontdict={'color':'k','fontsize':35})
-ax.text(.95,-1.79,'07uy',fontdict={'color':'k','fontsize':35})
-ax.text(.85,-2.38,'90I',fontdict={'color':'k','fontsize':35})
-ax.text(5.06,0.58,'07Y',fontdict={'color':'k','fontsize':35})
-ax.text(2.08,-3.43,'04gq',fontdict={'color':'k','fontsize':35})
+    ax.text(.66,-1.18,'09er',fontdict={'color':'k','fontsize':35})
+    ax.text(.95,-1.79,'07uy',fontdict={'color':'k','fontsize':35})
+    ax.text(.85,-2.38,'90I',fontdict={'color':'k','fontsize':35})
+    ax.text(5.06,0.58,'07Y',fontdict={'color':'k','fontsize':35})
+    ax.text(2.08,-3.43,'04gq',fontdict={'color':'k','fontsize':35})
 
-ax.text(3.72,-2.09,'11ei',fontdict={'color':'k','fontsize':35})
+    ax.text(3.72,-2.09,'11ei',fontdict={'color':'k','fontsize':35})
 
-ax.text(2.34,-1.85,'94I',fontdict={'color':'k','fontsize':35})
+    ax.text(2.34,-1.85,'94I',fontdict={'color':'k','fontsize':35})
 
-ax.text(-.9,.88,'10ay',fontdict={'color':'k','fontsize':35})
-ax.text(-0.4,-1.3,'16coi',fontdict={'color':'k','fontsize':35})
+    ax.text(-.9,.88,'10ay',fontdict={'color':'k','fontsize':35})
+    ax.text(-0.4,-1.3,'16coi',fontdict={'color':'k','fontsize':35})
 
 
 
 
-f_all.savefig('Fig5')
+    f_all.savefig('Fig5')
 
 
 
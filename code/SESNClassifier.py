@@ -0,0 +1,722 @@
+import numpy as np
+import json
+
+
+SN_TYPES = ['IIb', 'Ib', 'Ic', 'IcBL']
+
+
+def shiftCorrelate(spectra, filters, shifts, offset=0, chunk=256):
+    """
+    Dot products of every filter with every spectrum shifted by each
+    pixel shift, computed for all shifts at once by FFT correlation.
+    On a log wavelength grid a pixel shift is a redshift, so with
+    eigenspectra as filters these are the pca coefficients of the
+    spectra for a range of redshift errors.
+
+    Parameters
+    ----------
+    spectra : np.array
+        (nspec, npix) fluxes. NaN and pixels outside the spectra count
+        as zero.
+    filters : np.array
+        (nfilters, nwvlbins) e.g. eigenspectra.
+    shifts : np.array
+        integer pixel shifts.
+    offset : int
+        pixel of the spectra at the first filter pixel for zero shift,
+        for spectra that extend beyond the filter wavelengths.
+    chunk : int
+        number of spectra correlated at a time, which bounds the memory
+        of the (chunk, nfilters, nfft) cross spectrum.
+
+    Returns
+    -------
+    products : np.array
+        (nspec, nfilters, nshifts), where products[i,j,k] is
+        sum_n spectra[i, n + offset + shifts[k]] * filters[j, n].
+
+    """
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+    filters = np.atleast_2d(np.asarray(filters, dtype=float))
+    lags = offset + np.asarray(shifts, dtype=int)
+    # zero padded so that no lag in (-nwvlbins, npix) wraps around
+    nfft = 1
+    while nfft < spectra.shape[1] + filters.shape[1]:
+        nfft = 2 * nfft
+    filtFFT = np.conj(np.fft.rfft(filters, nfft, axis=1))
+    products = np.zeros((len(spectra), len(filters), len(lags)))
+    for start in range(0, len(spectra), chunk):
+        block = spectra[start:start + chunk]
+        specFFT = np.fft.rfft(np.where(np.isfinite(block), block, 0.0), nfft, axis=1)
+        corr = np.fft.irfft(specFFT[:,None,:] * filtFFT[None,:,:], nfft, axis=2)
+        products[start:start + chunk] = corr[:,:,lags % nfft]
+    products[:,:,(lags <= -filters.shape[1]) | (lags >= spectra.shape[1])] = 0.0
+    return products
+
+
+def shiftResiduals(spectra, mean, basis, shifts, offset=0, penalty=0.0, chunk=256):
+    """
+    Squared residuals of spectra off the training mean plus basis
+    eigenspectra for every pixel shift, for choosing the shift. At each
+    shift only the pixels observed at that shift are fit, with the mean
+    subtracted there and the basis coefficients from a least squares fit
+    to those pixels, so partial overlaps are fit without bias. Each pixel
+    of the eigenspectra's wavelength range that the shifted spectrum does
+    not cover is charged penalty, e.g. the per pixel variance of the
+    training spectra about their mean, so shifting poorly fit pixels out
+    of the range is not rewarded. The spectra are processed chunk at a
+    time, and for every shift the Gram matrices of the basis over the
+    observed pixels are one matrix multiply of the observed masks with
+    the pairwise basis products.
+
+    Parameters
+    ----------
+    spectra : np.array
+        (nspec, npix) fluxes. NaN and pixels outside the spectra are not
+        observed.
+    mean : np.array
+        (nwvlbins,) mean spectrum of the training set.
+    basis : np.array
+        (nbasis, nwvlbins) eigenspectra of the centered training set.
+    shifts : np.array
+        integer pixel shifts.
+    offset : int
+        see shiftCorrelate.
+    penalty : float
+        residual charged for every pixel not covered.
+    chunk : int
+        number of spectra fit at a time.
+
+    Returns
+    -------
+    residuals : np.array
+        (nspec, nshifts) squared residuals over the observed pixels plus
+        the overlap penalty.
+    nobs : np.array
+        (nspec, nshifts) number of observed pixels.
+
+    """
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+    mean = np.asarray(mean, dtype=float)
+    basis = np.atleast_2d(np.asarray(basis, dtype=float))
+    nbasis, nwvl = basis.shape
+    nspec, npix = spectra.shape
+    lags = offset + np.asarray(shifts, dtype=int)
+    # NaN padding so that the spectra cover the pixels of every lag
+    left = max(0, -np.min(lags))
+    right = max(0, np.max(lags) + nwvl - npix)
+    upper = np.triu_indices(nbasis)
+    products = (basis[upper[0]] * basis[upper[1]]).T
+    # a small ridge keeps the fits of shifts with little overlap well posed
+    ridge = 1e-8 * np.eye(nbasis)
+
+    residuals = np.zeros((nspec, len(lags)))
+    nobs = np.zeros((nspec, len(lags)))
+    for start in range(0, nspec, chunk):
+        block = np.pad(spectra[start:start + chunk], ((0, 0), (left, right)), mode='constant',
+                       constant_values=np.nan)
+        gram = np.zeros((len(block), nbasis, nbasis))
+        for k, lag in enumerate(lags):
+            window = block[:, left + lag:left + lag + nwvl]
+            observed = np.isfinite(window)
+            centered = np.where(observed, window - mean, 0.0)
+            proj = np.dot(centered, basis.T)
+            pairs = np.dot(observed.astype(float), products)
+            gram[:, upper[0], upper[1]] = pairs
+            gram[:, upper[1], upper[0]] = pairs
+            fit = np.linalg.solve(gram + ridge, proj[:,:,None])[:,:,0]
+            residuals[start:start + chunk, k] = np.clip(np.sum(centered**2, axis=1) - np.sum(fit * proj, axis=1),
+                                                        0, None)
+            nobs[start:start + chunk, k] = np.sum(observed, axis=1)
+    return residuals + penalty * (nwvl - nobs), nobs
+
+
+def gappyFit(spectra, mean, basis, weights=None):
+    """
+    Masked, weighted least squares fit of spectra as the mean plus basis
+    eigenspectra over their observed pixels, with all spectra solved at
+    once as stacked (nbasis, nbasis) systems. NaN pixels and pixels of
+    zero weight are missing.
+
+    Parameters
+    ----------
+    spectra : np.array
+        (nspec, nwvlbins) fluxes, NaN where missing.
+    mean : np.array
+        (nwvlbins,) mean spectrum.
+    basis : np.array
+        (nbasis, nwvlbins) eigenspectra.
+    weights : np.array
+        (nspec, nwvlbins) inverse variance weights. Observed pixels are
+        weighted equally if None.
+
+    Returns
+    -------
+    coeffs : np.array
+        (nspec, nbasis) coefficients of the basis. Rows of spectra with
+        fewer observed pixels than nbasis are NaN.
+    nobs : np.array
+        (nspec,) number of observed pixels.
+
+    """
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+    basis = np.atleast_2d(np.asarray(basis, dtype=float))
+    observed = np.isfinite(spectra)
+    if weights is None:
+        weights = observed.astype(float)
+    else:
+        weights = np.where(observed, weights, 0.0)
+        observed = weights > 0
+    centered = np.where(observed, spectra - mean, 0.0)
+
+    A = np.matmul(weights[:,None,:] * basis[None,:,:], basis.T)
+    b = np.dot(weights * centered, basis.T)
+    nobs = np.sum(observed, axis=1)
+    solvable = nobs >= len(basis)
+    coeffs = np.nan * np.ones((len(spectra), len(basis)))
+    if np.any(solvable):
+        coeffs[solvable] = np.linalg.solve(A[solvable], b[solvable][:,:,None])[:,:,0]
+    return coeffs, nobs
+
+
+def shiftWeights(residuals, dof, noise=None, prior=None):
+    """
+    Posterior weights of the pixel shifts from the squared residuals of
+    the fits at each shift, exp(-residual / (2 noise^2)) times the prior.
+
+    Parameters
+    ----------
+    residuals : np.array
+        (nspec, nshifts) squared residual norms.
+    dof : np.array
+        (nspec,) degrees of freedom of the fits.
+    noise : float or np.array
+        per pixel flux noise. If None it is estimated for every spectrum
+        from its best fit, i.e. the best fit has a reduced chi^2 of one.
+    prior : np.array
+        (nshifts,) prior of the shifts. Uniform if None.
+
+    Returns
+    -------
+    weights : np.array
+        (nspec, nshifts) normalized weights.
+    noise : np.array
+        (nspec,) noise used.
+
+    """
+    residuals = np.atleast_2d(residuals)
+    if noise is None:
+        noise = np.sqrt(np.min(residuals, axis=1) / np.asarray(dof, dtype=float))
+    noise = np.broadcast_to(np.asarray(noise, dtype=float), (len(residuals),))
+    logw = -0.5 * residuals / np.where(noise > 0, noise, np.finfo(float).tiny)[:,None]**2
+    if prior is not None:
+        with np.errstate(divide='ignore'):
+            logw = logw + np.log(np.asarray(prior, dtype=float))[None,:]
+    weights = np.exp(logw - np.max(logw, axis=1)[:,None])
+    return weights / np.sum(weights, axis=1)[:,None], noise
+
+
+def encodeParams(params):
+    """
+    Converts LinearSVC keyword arguments to JSON. A dict class_weight is
+    stored as [label, weight] pairs, since JSON object keys are strings
+    and the integer class labels would not survive the round trip.
+    """
+    encoded = dict(params)
+    if isinstance(encoded.get('class_weight'), dict):
+        encoded['class_weight'] = {'pairs':[[label.item() if hasattr(label, 'item') else label, float(weight)]
+                                            for label, weight in encoded['class_weight'].items()]}
+    return encoded
+
+
+def decodeParams(encoded):
+    """
+    Inverse of encodeParams.
+    """
+    params = dict(encoded)
+    if isinstance(params.get('class_weight'), dict):
+        params['class_weight'] = dict((label, weight) for label, weight in params['class_weight']['pairs'])
+    return params
+
+
+class SVMEnsemble:
+    """
+    Linear classifiers of the same features, e.g. the LinearSVC models of
+    every CV split, stacked into one (nfeatures, nmodels * nclasses)
+    weight matrix. The decision functions of a batch of points for all
+    models are one matrix multiply, and the prediction is the class with
+    the most votes.
+    """
+
+    def __init__(self, coefs, intercepts, classes):
+        """
+        Parameters
+        ----------
+        coefs : np.array
+            (nmodels, nclasses, nfeatures)
+        intercepts : np.array
+            (nmodels, nclasses). -inf for classes a model never predicts.
+        classes : np.array
+            (nclasses,) class labels.
+
+        """
+        self.coefs = np.asarray(coefs, dtype=float)
+        self.intercepts = np.asarray(intercepts, dtype=float)
+        self.classes = np.asarray(classes)
+        self.nmodels, self.nclasses, self.nfeatures = self.coefs.shape
+        self.weights = self.coefs.reshape(-1, self.nfeatures).T
+        self.biases = self.intercepts.ravel()
+        return
+
+    @classmethod
+    def fromModels(cls, models, classes=None):
+        """
+        Stacks the coef_ and intercept_ of fitted linear classifiers.
+        Binary models get a mirrored second row, and models that did not
+        see a class in training never predict it.
+
+        Parameters
+        ----------
+        models : list
+            fitted linear classifiers, e.g. from SNeCV.cross_validate_svm.
+        classes : np.array
+            class labels in any order. Defaults to all labels seen by the
+            models.
+
+        Returns
+        -------
+        ensemble : SVMEnsemble
+
+        Raises
+        ------
+        ValueError
+            if a model has a label that is not in classes.
+
+        """
+        if classes is None:
+            classes = np.unique(np.concatenate([np.asarray(mdl.classes_) for mdl in models]))
+        classes = np.asarray(classes)
+        rowOf = dict((label, row) for row, label in enumerate(classes.tolist()))
+        nfeatures = np.atleast_2d(models[0].coef_).shape[1]
+        coefs = np.zeros((len(models), len(classes), nfeatures))
+        intercepts = -np.inf * np.ones((len(models), len(classes)))
+        for m, mdl in enumerate(models):
+            W = np.atleast_2d(mdl.coef_)
+            b = np.atleast_1d(mdl.intercept_)
+            if len(W) == 1:
+                W = np.vstack((-W, W))
+                b = np.hstack((-b, b))
+            labels = np.asarray(mdl.classes_).tolist()
+            missing = [label for label in labels if label not in rowOf]
+            if len(missing) > 0:
+                raise ValueError('labels %s are not in classes'%(missing))
+            rows = [rowOf[label] for label in labels]
+            coefs[m, rows] = W
+            intercepts[m, rows] = b
+        return cls(coefs, intercepts, classes)
+
+    def decisionScores(self, points):
+        """
+        Parameters
+        ----------
+        points : np.array
+            (npoints, nfeatures)
+
+        Returns
+        -------
+        scores : np.array
+            (npoints, nmodels, nclasses)
+
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        scores = np.dot(points, self.weights) + self.biases
+        return scores.reshape(len(points), self.nmodels, self.nclasses)
+
+    def voteCounts(self, points):
+        """
+        Returns the (npoints, nclasses) number of models predicting each
+        class.
+        """
+        winners = np.argmax(self.decisionScores(points), axis=2)
+        rows = np.repeat(np.arange(len(winners)), self.nmodels)
+        counts = np.bincount(rows * self.nclasses + winners.ravel(), minlength=len(winners) * self.nclasses)
+        return counts.reshape(len(winners), self.nclasses)
+
+    def classify(self, points, xlim=None, ylim=None, npix=300):
+        """
+        Classifies a batch of points by majority vote. For 2 features, if
+        xlim and ylim are given, the vote map of the ensemble on an
+        (npix, npix) raster is evaluated in the same matrix multiply, for
+        plotting the aggregated decision regions.
+
+        Parameters
+        ----------
+        points : np.array
+            (npoints, nfeatures), may be empty.
+        xlim : tuple
+        ylim : tuple
+        npix : int
+
+        Returns
+        -------
+        labels : np.array
+            (npoints,) class with the most votes.
+        fractions : np.array
+            (npoints, nclasses) vote fractions, columns ordered as
+            self.classes.
+        votes : np.array
+            (npix, npix, nclasses) votes on the raster, with rows along
+            y. None without xlim and ylim.
+
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, self.nfeatures)
+        npoints = len(points)
+        if xlim is not None and ylim is not None:
+            xx, yy = np.meshgrid(np.linspace(xlim[0], xlim[1], npix), np.linspace(ylim[0], ylim[1], npix))
+            points = np.vstack((points, np.c_[xx.ravel(), yy.ravel()]))
+        counts = self.voteCounts(points)
+        votes = None
+        if len(points) > npoints:
+            votes = counts[npoints:].reshape(npix, npix, self.nclasses)
+        counts = counts[:npoints]
+        return self.classes[np.argmax(counts, axis=1)], counts / float(self.nmodels), votes
+
+
+class SESNClassifier:
+    """
+    Trained SESN classifier. For every phase window it bundles the
+    eigenspectra used for the projection with an ensemble of linear SVMs,
+    e.g. the models of every CV split. classify projects each spectrum on
+    the eigenspectra of its window, after filling its gaps with a fit of
+    the window's training mean and basis, and counts the votes of that
+    window's SVMEnsemble. For the decision functions of every window at once, the
+    projection and all SVMs are also folded into one
+    (nwvlbins, nwindows * nmodels * nclasses) matrix. Only
+    numpy is needed to load and run a saved classifier. Classifiers are
+    trained with SNeCV.trainClassifier.
+    """
+
+    def __init__(self, wavelengths, windows, evecs, coefs, intercepts, classes=(1, 2, 3, 4),
+                 typeNames=SN_TYPES, components=None, scores=None, svmParams=None, means=None, basis=None,
+                 pixelVariances=None):
+        """
+        Parameters
+        ----------
+        wavelengths : np.array
+            (nwvlbins,) wavelength grid of the spectra.
+        windows : list
+            (phasemin, phasemax) of every phase window.
+        evecs : list
+            (ncomp, nwvlbins) eigenspectra used by each window's SVMs.
+        coefs : list
+            (nmodels, nclasses, ncomp) SVM coefficients of each window.
+        intercepts : list
+            (nmodels, nclasses) SVM intercepts of each window.
+        classes : tuple
+            class labels of the SVM rows.
+        typeNames : list
+            SN type name of every class.
+        components : list
+            eigenspectrum numbers (starting at 1) used in each window.
+        scores : list
+            (mean, std) CV score of each window.
+        svmParams : list
+            LinearSVC keyword arguments (e.g. C and class_weight) the
+            SVMs of each window were trained with.
+        means : list
+            (nwvlbins,) training mean spectrum of each window.
+        basis : list
+            (nbasis, nwvlbins) eigenspectra of each window for the
+            residuals of classifyShifted.
+        pixelVariances : list
+            per pixel variance of each window's training spectra about
+            their mean, the overlap penalty of classifyShifted.
+
+        """
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.windows = np.asarray(windows, dtype=float)
+        self.centers = np.mean(self.windows, axis=1)
+        self.classes = np.asarray(classes)
+        self.typeNames = np.asarray(typeNames)
+        self.components = components
+        self.scores = scores
+        self.svmParams = svmParams
+
+        self.nmodels = len(coefs[0])
+        self.nclasses = len(self.classes)
+        # fold the projection into the SVMs: spectra . evecs^T . coef^T
+        self.weights = np.hstack([np.dot(np.asarray(coef).reshape(-1, len(evec)), evec).T
+                                  for evec, coef in zip(evecs, coefs)])
+        self.biases = np.hstack([np.asarray(b).ravel() for b in intercepts])
+        self.evecs = [np.asarray(evec, dtype=float) for evec in evecs]
+        self.coefs = [np.asarray(coef, dtype=float) for coef in coefs]
+        self.intercepts = [np.asarray(b, dtype=float) for b in intercepts]
+        self.ensembles = [SVMEnsemble(coef, b, self.classes) for coef, b in zip(self.coefs, self.intercepts)]
+        self.means = None if means is None else [np.asarray(m, dtype=float) for m in means]
+        self.basis = None if basis is None else [np.asarray(b, dtype=float) for b in basis]
+        self.pixelVariances = None if pixelVariances is None else np.asarray(pixelVariances, dtype=float)
+        return
+
+    def windowIndex(self, phases):
+        """
+        Returns the index of the phase window whose center is closest to
+        each phase, among the windows whose range contains it.
+
+        Parameters
+        ----------
+        phases : float or np.array
+
+        Returns
+        -------
+        inds : np.array
+            -1 for phases outside every window.
+
+        """
+        phases = np.atleast_1d(np.asarray(phases, dtype=float))
+        inside = (phases[:,None] >= self.windows[None,:,0]) & (phases[:,None] <= self.windows[None,:,1])
+        dist = np.where(inside, np.abs(self.centers[None,:] - phases[:,None]), np.inf)
+        return np.where(np.any(inside, axis=1), np.argmin(dist, axis=1), -1)
+
+    def usableSpectra(self, spectra, phases):
+        """
+        Finds the spectra classify can classify: those with a phase in one
+        of the windows and at least as many observed pixels as the basis
+        eigenspectra that fill the gaps. Without a stored basis only
+        spectra without gaps are usable.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes, NaN where missing.
+        phases : np.array
+            (nspec,) phases relative to V-band maximum.
+
+        Returns
+        -------
+        windows : np.array
+            (nspec,) window of every spectrum, see windowIndex.
+        usable : np.array
+            (nspec,) Boolean.
+
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        windows = self.windowIndex(phases)
+        if len(windows) != len(spectra):
+            raise ValueError('%d phases given for %d spectra'%(len(windows), len(spectra)))
+        nobs = np.sum(np.isfinite(spectra), axis=1)
+        if self.basis is None:
+            needed = np.repeat(spectra.shape[1], len(self.windows))
+        else:
+            needed = np.array([len(b) for b in self.basis])
+        return windows, (windows >= 0) & (nobs >= needed[windows])
+
+    def decisionScores(self, spectra):
+        """
+        Calculates the SVM decision functions of every window and every
+        model for a batch of spectra with one matrix multiply. As in
+        SNePCA.calcPCACoeffs the spectra are not mean subtracted.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes on self.wavelengths.
+
+        Returns
+        -------
+        scores : np.array
+            (nspec, nwindows, nmodels, nclasses)
+
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        scores = np.dot(spectra, self.weights) + self.biases
+        return scores.reshape(len(spectra), len(self.windows), self.nmodels, self.nclasses)
+
+    def classify(self, spectra, phases):
+        """
+        Classifies a batch of spectra. Each spectrum is projected on the
+        eigenspectra of the phase window closest to its phase and
+        classified by that window's SVMEnsemble only, and the
+        probabilities are the fractions of the ensemble voting for each
+        type. NaN or infinite pixels, e.g. gaps flagged by
+        SNIDdataset.snidsetNAN, are missing: they are filled with the
+        gappyFit of the window's training mean and basis to the observed
+        pixels before the projection, so spectra do not need to go
+        through SNIDdataset.interpGaps. Spectra without gaps are projected
+        as they are. Spectra that usableSpectra rejects, i.e. with a phase
+        outside every window or too few observed pixels, raise ValueError.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes, preprocessed like the training
+            datasets, NaN where missing.
+        phases : np.array
+            (nspec,) phases relative to V-band maximum.
+
+        Returns
+        -------
+        types : np.array
+            (nspec,) SN type with the most votes.
+        probs : np.array
+            (nspec, nclasses) vote fractions, columns ordered as
+            self.typeNames.
+
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        windows, usable = self.usableSpectra(spectra, phases)
+        if not np.all(usable):
+            raise ValueError('spectra %s are outside every phase window or have too few observed pixels'
+                             %(np.flatnonzero(~usable).tolist()))
+        probs = np.zeros((len(spectra), self.nclasses))
+        for w in np.unique(windows):
+            rows = np.flatnonzero(windows == w)
+            winSpectra = spectra[rows]
+            gappy = ~np.all(np.isfinite(winSpectra), axis=1)
+            if np.any(gappy):
+                fit, _ = gappyFit(winSpectra[gappy], self.means[w], self.basis[w])
+                filled = self.means[w] + np.dot(fit, self.basis[w])
+                winSpectra[gappy] = np.where(np.isfinite(winSpectra[gappy]), winSpectra[gappy], filled)
+            coeffs = np.dot(winSpectra, self.evecs[w].T)
+            probs[rows] = self.ensembles[w].voteCounts(coeffs) / float(self.nmodels)
+        return self.typeNames[np.argmax(probs, axis=1)], probs
+
+    def classifyShifted(self, spectra, phases, maxShift=10, offset=0, noise=None, prior=None):
+        """
+        Classifies a batch of spectra marginalized over redshift errors.
+        On the SNID log wavelength grid a small redshift error is a pixel
+        shift, so the projections of each spectrum on its window's
+        eigenspectra are evaluated for every shift in -maxShift..maxShift
+        at once with shiftCorrelate. The vote fractions at each shift are
+        averaged with the shift weights of shiftWeights, which follow from
+        the shiftResiduals of the spectra off the window's training mean
+        plus basis eigenspectra, with self.pixelVariances as the overlap
+        penalty. A positive shift means the spectrum is redder than
+        assumed, i.e. its redshift was underestimated by a factor
+        10**(shift * dwlog) in 1+z. Needs a classifier trained with the
+        means and basis, see SNeCV.trainClassifier.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, npix) fluxes. npix is nwvlbins unless the spectra
+            extend beyond self.wavelengths, see offset.
+        phases : np.array
+            (nspec,) phases relative to V-band maximum.
+        maxShift : int
+        offset : int
+            pixel of the spectra at self.wavelengths[0], see
+            shiftCorrelate.
+        noise : float or np.array
+            per pixel flux noise, see shiftWeights.
+        prior : np.array
+            (2 * maxShift + 1,) prior of the shifts.
+
+        Returns
+        -------
+        types : np.array
+            (nspec,) SN type with the most marginalized votes.
+        probs : np.array
+            (nspec, nclasses) vote fractions marginalized over shifts.
+        bestShift : np.array
+            (nspec,) shift with the largest weight.
+        weights : np.array
+            (nspec, nshifts) shift weights.
+
+        """
+        if self.means is None or self.basis is None or self.pixelVariances is None:
+            raise ValueError('classifier has no training means and basis, retrain it with SNeCV.trainClassifier')
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        shifts = np.arange(-maxShift, maxShift + 1)
+        nspec, nwvl = len(spectra), len(self.wavelengths)
+        coeffs = shiftCorrelate(spectra, np.vstack(self.evecs), shifts, offset).transpose(0, 2, 1)
+        bounds = np.cumsum([0] + [len(evec) for evec in self.evecs])
+
+        windows = self.windowIndex(phases)
+        if len(windows) != nspec:
+            raise ValueError('%d phases given for %d spectra'%(len(windows), nspec))
+        if np.any(windows < 0):
+            raise ValueError('spectra %s are outside every phase window'%(np.flatnonzero(windows < 0).tolist()))
+        residuals = np.zeros((nspec, len(shifts)))
+        dof = np.zeros(nspec)
+        shiftProbs = np.zeros((nspec, len(shifts), self.nclasses))
+        for w in np.unique(windows):
+            rows = windows == w
+            winCoeffs = coeffs[rows][:,:,bounds[w]:bounds[w + 1]]
+            residuals[rows], _ = shiftResiduals(spectra[rows], self.means[w], self.basis[w], shifts, offset,
+                                                self.pixelVariances[w])
+            dof[rows] = nwvl - len(self.basis[w])
+            scores = np.einsum('isk,mck->ismc', winCoeffs, self.coefs[w]) + self.intercepts[w]
+            winners = np.argmax(scores, axis=3)
+            for k in range(self.nclasses):
+                shiftProbs[rows,:,k] = np.mean(winners == k, axis=2)
+
+        weights, _ = shiftWeights(residuals, dof, noise, prior)
+        probs = np.sum(weights[:,:,None] * shiftProbs, axis=1)
+        bestShift = shifts[np.argmax(weights, axis=1)]
+        return self.typeNames[np.argmax(probs, axis=1)], probs, bestShift, weights
+
+    def save(self, path):
+        """
+        Saves the classifier as a compressed .npz file of plain arrays.
+
+        Parameters
+        ----------
+        path : string
+
+        Returns
+        -------
+
+        """
+        arrays = {'wavelengths':self.wavelengths, 'windows':self.windows,
+                  'classes':self.classes, 'typeNames':self.typeNames}
+        for i in range(len(self.windows)):
+            arrays['evecs%d'%(i)] = self.evecs[i]
+            arrays['coefs%d'%(i)] = self.coefs[i]
+            arrays['intercepts%d'%(i)] = self.intercepts[i]
+        # windows may use different numbers of components
+        if self.components is not None:
+            arrays['components'] = np.array(json.dumps([[int(c) for c in comps] for comps in self.components]))
+        if self.svmParams is not None:
+            arrays['svmParams'] = np.array(json.dumps([encodeParams(params) for params in self.svmParams]))
+        if self.scores is not None:
+            arrays['scores'] = np.asarray(self.scores)
+        if self.means is not None:
+            for i in range(len(self.windows)):
+                arrays['means%d'%(i)] = self.means[i]
+                arrays['basis%d'%(i)] = self.basis[i]
+            arrays['pixelVariances'] = self.pixelVariances
+        np.savez_compressed(path, **arrays)
+        return
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a classifier saved with save.
+
+        Parameters
+        ----------
+        path : string
+
+        Returns
+        -------
+        clf : SESNClassifier
+
+        """
+        with np.load(path) as arrays:
+            nwin = len(arrays['windows'])
+            components = None
+            if 'components' in arrays:
+                components = arrays['components']
+                components = json.loads(str(components)) if components.ndim == 0 else components.tolist()
+            clf = cls(arrays['wavelengths'], arrays['windows'],
+                      [arrays['evecs%d'%(i)] for i in range(nwin)],
+                      [arrays['coefs%d'%(i)] for i in range(nwin)],
+                      [arrays['intercepts%d'%(i)] for i in range(nwin)],
+                      classes=arrays['classes'], typeNames=arrays['typeNames'],
+                      components=components, scores=arrays['scores'].tolist() if 'scores' in arrays else None,
+                      svmParams=[decodeParams(params) for params in json.loads(str(arrays['svmParams']))]
+                      if 'svmParams' in arrays else None,
+                      means=[arrays['means%d'%(i)] for i in range(nwin)] if 'means0' in arrays else None,
+                      basis=[arrays['basis%d'%(i)] for i in range(nwin)] if 'basis0' in arrays else None,
+                      pixelVariances=arrays['pixelVariances'] if 'pixelVariances' in arrays else None)
+        return clf
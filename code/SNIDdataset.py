@@ -3,6 +3,9 @@ import numpy as np
 import SNIDsn as snid
 import matplotlib.pyplot as plt
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
 import pickle
 
 def savePickle(path, dataset, protocol=2):
@@ -172,6 +175,45 @@ def numSpec(dataset):
         numSpec = numSpec + len(snobj.getSNCols())
     return numSpec
 
+def datasetSpecMatrix(dataset):
+    """
+    Collects every spectrum in dataset into one matrix, in dataset order.
+
+    Parameters
+    ----------
+    dataset : SNIDdataset object
+
+    Returns
+    -------
+    specMatrix : np.array
+        (nspec, nwvlbins) fluxes
+    names : np.array
+        SN name of each spectrum
+    phasekeys : np.array
+        phase column name of each spectrum
+    phases : np.array
+        phase of each spectrum
+
+    """
+    nspec = numSpec(dataset)
+    snnames = list(dataset.keys())
+    nwvlbins = len(dataset[snnames[0]].wavelengths)
+
+    specMatrix = np.ndarray((nspec, nwvlbins))
+    names = []
+    phasekeys = []
+    phases = []
+    count = 0
+    for snname in snnames:
+        snobj = dataset[snname]
+        for ph, phk in zip(snobj.phases, snobj.getSNCols()):
+            specMatrix[count,:] = snobj.data[phk]
+            count = count + 1
+            names.append(snname)
+            phasekeys.append(phk)
+            phases.append(ph)
+    return specMatrix, np.array(names), np.array(phasekeys), np.array(phases, dtype=float)
+
 def preprocess(dataset):
     """
     Applies SNIDsn preprocessing to every SN in dataset.
@@ -461,3 +503,94 @@ def getDiagnostics(dataset):
  
     return snnames, snphases, snid_type_pair, snid_type_str, snphasetype
 
+
+def datasetHash(dataset):
+    """
+    Returns a hash of the contents of a SNIDdataset. Two datasets with the
+    same SNe, types, phases, wavelengths and fluxes have the same hash, so
+    the hash can be used as a key for caching data products on disk.
+
+    Parameters
+    ----------
+    dataset : SNIDdataset object
+
+    Returns
+    -------
+    digest : string
+        hex digest of the dataset contents.
+
+    """
+    h = hashlib.sha1()
+    for snname in list(dataset.keys()):
+        snobj = dataset[snname]
+        h.update(str(snname).encode())
+        h.update(str(snobj.type).encode())
+        h.update(np.asarray(snobj.phases, dtype=float).tobytes())
+        h.update(np.asarray(snobj.wavelengths, dtype=float).tobytes())
+        h.update(str(snobj.getSNCols()).encode())
+        h.update(np.ascontiguousarray(snobj.data).tobytes())
+    return h.hexdigest()
+
+def cacheKey(*parts):
+    """
+    Returns a short hash of the repr of parts, for naming cache files.
+
+    Parameters
+    ----------
+    parts : objects with a deterministic repr (strings, numbers, tuples)
+
+    Returns
+    -------
+    key : string
+
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+def numWorkers(n_jobs):
+    """
+    Converts an n_jobs argument to a number of worker processes. None
+    means 1, and negative values count back from the number of cores
+    (-1 uses all cores).
+
+    Parameters
+    ----------
+    n_jobs : int
+
+    Returns
+    -------
+    nworkers : int
+
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+def parallelMap(func, tasks, n_jobs=None):
+    """
+    Applies func to every task, using a pool of worker processes if
+    n_jobs is not 1. Results are returned in the order of tasks. func
+    must be a module level function so that it can be pickled.
+
+    Parameters
+    ----------
+    func : function
+    tasks : iterable
+        arguments passed to func, one per call.
+    n_jobs : int
+        Number of worker processes, see numWorkers. None or 1 runs
+        serially in this process.
+
+    Returns
+    -------
+    results : list
+
+    """
+    tasks = list(tasks)
+    n_jobs = min(numWorkers(n_jobs), len(tasks))
+    if n_jobs <= 1:
+        return [func(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(pool.map(func, tasks))
+    return results
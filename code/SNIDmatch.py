@@ -0,0 +1,329 @@
+import SNIDsn
+import SNIDdataset as snid
+
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+def bandpass(nfreq, k1, k2, k3, k4):
+    """
+    SNID style band pass filter of the Fourier modes: zero below k1, a
+    cosine ramp up to one between k1 and k2, one between k2 and k3 and a
+    cosine ramp down to zero between k3 and k4.
+
+    Parameters
+    ----------
+    nfreq : int
+        number of rfft modes.
+    k1, k2, k3, k4 : float
+        filter edges in rfft mode numbers.
+
+    Returns
+    -------
+    filt : np.array
+        (nfreq,)
+
+    """
+    k = np.arange(nfreq, dtype=float)
+    filt = np.zeros(nfreq)
+    filt[(k >= k2) & (k <= k3)] = 1.0
+    rise = (k >= k1) & (k < k2)
+    filt[rise] = 0.5 * (1 - np.cos(np.pi * (k[rise] - k1) / (k2 - k1)))
+    fall = (k > k3) & (k <= k4)
+    filt[fall] = 0.5 * (1 + np.cos(np.pi * (k[fall] - k3) / (k4 - k3)))
+    return filt
+
+
+def logGridFluxes(fluxes, wavelengths=None, apodizePercent=5.0):
+    """
+    Places continuum removed fluxes on the full SNID log wavelength grid
+    from SNIDsn.snid_wvl_axis, zeros their mean over the range with data
+    and apodizes the ends of that range with SNIDsn.apodize. Pixels
+    without data (zero or NaN) are zero.
+
+    Parameters
+    ----------
+    fluxes : np.array
+        (nspec, nwvlbins) continuum removed fluxes, e.g. from .lnw
+        templates or SNIDsn.removeContinuum.
+    wavelengths : np.array
+        (nwvlbins,) wavelengths of the fluxes. Must be the SNID grid or a
+        contiguous part of it, as in the datasets cut with
+        SNIDdataset.datasetWavelengthRange. None means the full grid.
+    apodizePercent : float
+        percentage of the grid apodized at each end of the data.
+
+    Returns
+    -------
+    grid : np.array
+        (nspec, 1024) fluxes on the SNID grid.
+    l1 : np.array
+        (nspec,) first pixel with data.
+    l2 : np.array
+        (nspec,) last pixel with data.
+
+    """
+    snidwvl, _, _ = SNIDsn.snid_wvl_axis()
+    nw = len(snidwvl)
+    fluxes = np.atleast_2d(np.asarray(fluxes, dtype=float))
+    if wavelengths is None:
+        wavelengths = snidwvl
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    start = np.argmin(np.abs(snidwvl - wavelengths[0]))
+    if fluxes.shape[1] != len(wavelengths) or start + len(wavelengths) > nw or \
+            not np.allclose(snidwvl[start:start + len(wavelengths)], wavelengths, rtol=1e-4):
+        raise ValueError('fluxes must be on the SNID log wavelength grid, see SNIDsn.removeContinuum')
+
+    grid = np.zeros((len(fluxes), nw))
+    grid[:, start:start + len(wavelengths)] = np.where(np.isfinite(fluxes), fluxes, 0.0)
+    l1 = np.zeros(len(grid), dtype=int)
+    l2 = np.zeros(len(grid), dtype=int)
+    for i in range(len(grid)):
+        nonzero = np.flatnonzero(grid[i])
+        if len(nonzero) == 0:
+            l1[i], l2[i] = 0, -1
+            continue
+        l1[i], l2[i] = nonzero[0], nonzero[-1]
+        grid[i, l1[i]:l2[i] + 1] -= np.mean(grid[i, l1[i]:l2[i] + 1])
+        grid[i] = SNIDsn.apodize(nw, l1[i], l2[i], grid[i], apodizePercent)
+    return grid, l1, l2
+
+
+class TemplateLibrary:
+    """
+    SNID style cross-correlation matcher. The band pass filtered FFTs of
+    all library templates on the SNID log wavelength grid are computed
+    once, so a batch of input spectra, each transformed once, is
+    correlated against the whole library with one product of the Fourier
+    modes the band pass keeps and one batched inverse FFT per chunk of
+    (spectrum, template) pairs. On the log grid a redshift is a pixel
+    shift, so the correlation peak of every template gives its redshift,
+    and, following Tonry & Davis (1979) and Blondin & Tonry (2007), its
+    height h, r = h / (sqrt(2) sigma_a) with sigma_a the rms of the
+    antisymmetric part of the correlation about the peak, the overlap lap
+    in ln(wavelength) and rlap = r * lap. Unlike SNID the templates are
+    not trimmed to the overlap and correlated a second time.
+    """
+
+    def __init__(self, fluxes, names, phases, types, wavelengths=None, apodizePercent=5.0,
+                 filt=(1, 4, 85, 102)):
+        """
+        Parameters
+        ----------
+        fluxes : np.array
+            (ntemplates, nwvlbins) continuum removed template fluxes.
+        names : np.array
+            SN name of every template.
+        phases : np.array
+            phase of every template.
+        types : np.array
+            SN type of every template.
+        wavelengths : np.array
+            wavelengths of the fluxes, see logGridFluxes.
+        apodizePercent : float
+        filt : tuple
+            (k1, k2, k3, k4) band pass edges in Fourier modes of the
+            1024 pixel grid, see bandpass. The defaults are SNID's.
+
+        """
+        snidwvl, _, dwlog = SNIDsn.snid_wvl_axis()
+        self.dwlog = dwlog
+        self.nw = len(snidwvl)
+        # zero padded to twice the grid, so that correlations do not wrap
+        self.nfft = 2 * self.nw
+        self.apodizePercent = apodizePercent
+        scale = self.nfft / float(self.nw)
+        self.filt = bandpass(self.nfft // 2 + 1, *[scale * k for k in filt])
+        # the modes above the band pass are zero and left out of the products
+        self.nmodes = np.flatnonzero(self.filt)[-1] + 1
+
+        self.names = np.asarray(names)
+        self.phases = np.asarray(phases, dtype=float)
+        self.types = np.asarray(types)
+        self.fluxes, self.l1, self.l2 = logGridFluxes(fluxes, wavelengths, apodizePercent)
+        self.ffts, self.norms = self.transform(self.fluxes)
+        return
+
+    @classmethod
+    def fromDataset(cls, dataset, **kwargs):
+        """
+        Builds a library from every spectrum of a SNIDdataset, e.g. the
+        pickled datasets in Data/DataProducts or one loaded with
+        SNIDdataset.loadDataset. Keyword arguments are passed to
+        TemplateLibrary.
+
+        Returns
+        -------
+        library : TemplateLibrary
+
+        """
+        specMatrix, names, _, phases = snid.datasetSpecMatrix(dataset)
+        types = [dataset[name].type for name in names]
+        wavelengths = dataset[names[0]].wavelengths
+        return cls(specMatrix, names, phases, types, wavelengths=wavelengths, **kwargs)
+
+    @classmethod
+    def fromLnw(cls, paths, **kwargs):
+        """
+        Builds a library from SNID .lnw template files.
+
+        Parameters
+        ----------
+        paths : list
+            paths of .lnw files.
+
+        Returns
+        -------
+        library : TemplateLibrary
+
+        """
+        dataset = OrderedDict()
+        for path in paths:
+            snobj = SNIDsn.SNIDsn()
+            snobj.loadSNIDlnw(path)
+            dataset[snobj.header['SN']] = snobj
+        return cls.fromDataset(dataset, **kwargs)
+
+    def transform(self, fluxes):
+        """
+        Band pass filtered rfft of fluxes on the SNID grid and the norm of
+        the filtered fluxes.
+
+        Parameters
+        ----------
+        fluxes : np.array
+            (nspec, 1024) output of logGridFluxes.
+
+        Returns
+        -------
+        ffts : np.array
+            (nspec, nfft / 2 + 1)
+        norms : np.array
+            (nspec,)
+
+        """
+        ffts = np.fft.rfft(fluxes, self.nfft, axis=1) * self.filt
+        norms = np.sqrt(np.sum(np.fft.irfft(ffts, self.nfft, axis=1)**2, axis=1))
+        return ffts, norms
+
+    def correlate(self, fluxes, wavelengths=None, zmin=-0.01, zmax=1.2, chunk=1024):
+        """
+        Correlates a batch of spectra against every library template. The
+        peak is searched in the inverse FFT of every pair, and sigma_a
+        follows from the Fourier modes without gathering the correlation
+        about the peak: sum_k (c(p+k) - c(p-k))^2 over k = 1..nfft/2-1 is
+        E - A(2p), with E the energy of the correlation c, a matrix product
+        of the power spectra, and A(2p) = sum_k c(k) c(2p-k) its
+        autoconvolution at twice the peak lag p.
+
+        Parameters
+        ----------
+        fluxes : np.array
+            (nspec, nwvlbins) continuum removed fluxes, see logGridFluxes.
+        wavelengths : np.array
+            see logGridFluxes.
+        zmin : float
+        zmax : float
+            redshift range searched for the correlation peak.
+        chunk : int
+            number of (spectrum, template) pairs per batched inverse FFT,
+            which bounds the memory to about chunk * 2048 floats.
+
+        Returns
+        -------
+        result : dict
+            (nspec, ntemplates) arrays 'z', 'h', 'r', 'lap' and 'rlap'.
+
+        """
+        spectra, l1, l2 = logGridFluxes(fluxes, wavelengths, self.apodizePercent)
+        sffts, snorms = self.transform(spectra)
+        nspec, ntemp, nfft = len(spectra), len(self.ffts), self.nfft
+        # normalized so that the correlations are those of unit norm fluxes
+        S = sffts[:, :self.nmodes] / np.where(snorms > 0, snorms, np.inf)[:, None]
+        T = np.conj(self.ffts[:, :self.nmodes]) / np.where(self.norms > 0, self.norms, np.inf)[:, None]
+        # weights of the rfft modes in sums over the full spectrum
+        weights = 2.0 * np.ones(self.nmodes)
+        weights[0] = 1.0
+        if self.nmodes == nfft // 2 + 1:
+            weights[-1] = 1.0
+        energy = np.dot(np.abs(S)**2 * weights, (np.abs(T)**2).T) / nfft
+        modes = np.arange(self.nmodes)
+        roots = np.exp(2j * np.pi * np.arange(nfft) / nfft)
+
+        lagmin = int(np.ceil(np.log10(1 + zmin) / self.dwlog))
+        lagmax = int(np.floor(np.log10(1 + zmax) / self.dwlog))
+
+        shift = np.zeros((nspec, ntemp))
+        height = np.zeros((nspec, ntemp))
+        sigma = np.zeros((nspec, ntemp))
+        step = max(1, chunk // nspec)
+        for start in range(0, ntemp, step):
+            stop = min(start + step, ntemp)
+            # corr[i, j, k] = sum_n s_i(n) t_j(n - k) / (|s_i| |t_j|)
+            X = S[:, None, :] * T[None, start:stop, :]
+            corr = np.fft.irfft(X, nfft, axis=2)
+            # lags lagmin..lagmax, the negative ones wrapped to the end
+            if lagmin < 0:
+                searched = np.concatenate((corr[:, :, nfft + lagmin:], corr[:, :, :lagmax + 1]), axis=2)
+            else:
+                searched = corr[:, :, lagmin:lagmax + 1]
+            peak = lagmin + np.argmax(searched, axis=2)
+
+            # parabola through the peak and its neighbours for the sub pixel shift
+            c0, cm, cp = [np.take_along_axis(corr, ((peak + d) % nfft)[..., None], axis=2)[..., 0]
+                          for d in (0, -1, 1)]
+            curv = cm - 2 * c0 + cp
+            offset = np.where(curv < 0, 0.5 * (cm - cp) / np.where(curv < 0, curv, -1.0), 0.0)
+            offset = np.clip(offset, -0.5, 0.5)
+            shift[:, start:stop] = peak + offset
+            height[:, start:stop] = c0 - 0.25 * (cm - cp) * offset
+
+            autoconv = np.real(np.sum(weights * X**2 * roots[(2 * peak[..., None] * modes) % nfft], axis=2)) / nfft
+            sigma[:, start:stop] = np.sqrt(np.clip(energy[:, start:stop] - autoconv, 0, None) / (2.0 * nfft))
+
+        r = height / (np.sqrt(2) * np.where(sigma > 0, sigma, np.inf))
+        # a template pixel p matches input pixel p + shift
+        overlap = np.minimum(l2[:, None], self.l2[None, :] + shift) - np.maximum(l1[:, None], self.l1[None, :] + shift)
+        lap = np.clip(overlap, 0, None) * self.dwlog * np.log(10)
+        z = np.power(10, shift * self.dwlog) - 1
+        return {'z':z, 'h':height, 'r':r, 'lap':lap, 'rlap':r * lap}
+
+    def match(self, fluxes, wavelengths=None, ntop=10, zmin=-0.01, zmax=1.2, lapmin=0.4, chunk=1024):
+        """
+        Finds the best matching templates of a batch of spectra, ranked by
+        rlap. Templates that overlap an input by less than lapmin are
+        left out, as in SNID.
+
+        Parameters
+        ----------
+        fluxes : np.array
+            (nspec, nwvlbins) continuum removed fluxes, see logGridFluxes.
+        wavelengths : np.array
+        ntop : int
+        zmin : float
+        zmax : float
+        lapmin : float
+        chunk : int
+            see correlate.
+
+        Returns
+        -------
+        matches : list
+            one DataFrame per spectrum with the columns name, phase, type,
+            z, h, r, lap and rlap of the ntop best templates, indexed by
+            template row.
+
+        """
+        result = self.correlate(fluxes, wavelengths, zmin, zmax, chunk)
+        ranks = np.where(result['lap'] >= lapmin, result['rlap'], -np.inf)
+        matches = []
+        for i in range(len(ranks)):
+            rows = np.argsort(-ranks[i])[:ntop]
+            rows = rows[np.isfinite(ranks[i, rows])]
+            table = pd.DataFrame(OrderedDict([('name', self.names[rows]), ('phase', self.phases[rows]),
+                                              ('type', self.types[rows])]
+                                             + [(key, result[key][i, rows]) for key in ['z', 'h', 'r', 'lap', 'rlap']]),
+                                 index=rows)
+            matches.append(table)
+        return matches
@@ -0,0 +1,1084 @@
+import SNIDdataset as snid
+import SESNClassifier
+
+import hashlib
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.svm import LinearSVC
+from sklearn.model_selection import train_test_split
+
+
+# eigenspectra of the 2D projections in Figure 5 of Williamson et al. (2019)
+PAPER_COMPONENTS = [(1, 5), (1, 3), (1, 3), (1, 3)]
+
+
+def splitSeeds(seed, nsplits):
+    """
+    Draws one random seed per cross validation split from seed, so that
+    every split is reproducible on its own regardless of how the splits
+    are distributed over worker processes.
+
+    Parameters
+    ----------
+    seed : int
+        Master seed. None draws fresh seeds, as with an unseeded
+        train_test_split.
+    nsplits : int
+
+    Returns
+    -------
+    seeds : np.array
+
+    """
+    return np.random.RandomState(seed).randint(np.iinfo(np.int32).max, size=nsplits)
+
+
+def cvSplits(truth, groups=None, stratify=False, ncv=10, test_size=0.3, nfolds=None, seed=None):
+    """
+    Draws seeded cross validation splits. Without nfolds these are ncv
+    random train/test splits holding out test_size of the data (repeated
+    hold out). With nfolds they are ncv repeats of nfolds-fold CV. With
+    groups, all spectra of a group (e.g. SNePCA.pcaNames, so that no SN is
+    in both the training and the test set) are kept on the same side of
+    every split, and with stratify the type fractions of truth are kept in
+    every test set, counting groups rather than spectra if grouped. Every
+    repeat draws from its own RandomState seeded by splitSeeds, and every
+    split gets its own seed for the fit, so the splits do not depend on how
+    they are later distributed over worker processes. Ungrouped,
+    unstratified hold out splits are the splits of train_test_split with
+    the seeds of splitSeeds(seed, ncv).
+
+    Parameters
+    ----------
+    truth : np.array
+        (nspec,) labels.
+    groups : np.array
+        (nspec,) group of every spectrum. None puts every spectrum in its
+        own group.
+    stratify : Boolean
+    ncv : int
+        Number of hold out splits, or of k-fold repeats.
+    test_size : float
+        Fraction of the groups held out in hold out splits, i.e. of the
+        spectra if groups is None.
+    nfolds : int
+        Number of folds. None for hold out splits.
+    seed : int
+        Master seed. None draws fresh seeds.
+
+    Returns
+    -------
+    splits : list
+        (train, test) row arrays of every split.
+    seeds : np.array
+        seed of every split, e.g. for the random_state of the fit.
+
+    """
+    truth = np.asarray(truth)
+    if groups is None:
+        units = np.arange(len(truth))
+    else:
+        _, units = np.unique(np.asarray(groups), return_inverse=True)
+    nunits = np.max(units) + 1
+    unitTruth = np.zeros(nunits, dtype=truth.dtype)
+    unitTruth[units] = truth
+
+    def rows(unitList):
+        # spectra of the units, in the order of unitList
+        rank = -np.ones(nunits, dtype=int)
+        rank[unitList] = np.arange(len(unitList))
+        inds = np.flatnonzero(rank[units] >= 0)
+        return inds[np.argsort(rank[units[inds]], kind='mergesort')]
+
+    splits = []
+    seeds = []
+    for sd in splitSeeds(seed, ncv):
+        if nfolds is None:
+            trainU, testU = train_test_split(np.arange(nunits), test_size=test_size, random_state=sd,
+                                             stratify=unitTruth if stratify else None)
+            splits.append((rows(trainU), rows(testU)))
+            seeds.append(sd)
+            continue
+        # deal the shuffled units of every stratum to the folds in turn
+        rng = np.random.RandomState(sd)
+        strata = unitTruth if stratify else np.zeros(nunits, dtype=int)
+        folds = np.zeros(nunits, dtype=int)
+        dealt = 0
+        for stratum in np.unique(strata):
+            members = rng.permutation(np.flatnonzero(strata == stratum))
+            folds[members] = (dealt + np.arange(len(members))) % nfolds
+            dealt += len(members)
+        for fold in range(nfolds):
+            splits.append((rows(np.flatnonzero(folds != fold)), rows(np.flatnonzero(folds == fold))))
+        seeds.extend(rng.randint(np.iinfo(np.int32).max, size=nfolds))
+    return splits, np.array(seeds)
+
+
+def _fitSplits(task):
+    """
+    Worker for fitSplits. Fits a LinearSVC on the training set of every
+    split in a block of splits and scores it on the test set.
+
+    Parameters
+    ----------
+    task : tuple
+        (pcs, truth, splits, seeds, svmParams)
+
+    Returns
+    -------
+    scores : list
+    models : list
+        fitted LinearSVC objects
+    predictions : list
+        predicted labels of every test set
+
+    """
+    pcs, truth, splits, seeds, svmParams = task
+    scores = []
+    models = []
+    predictions = []
+    for (train, test), sd in zip(splits, seeds):
+        linsvm = LinearSVC(random_state=sd, **svmParams)
+        linsvm.fit(pcs[train], truth[train])
+        pred = linsvm.predict(pcs[test])
+        scores.append(np.mean(pred == truth[test]))
+        models.append(linsvm)
+        predictions.append(pred)
+    return scores, models, predictions
+
+
+def fitSplits(pcs, truth, splits, seeds, n_jobs=None, svmParams=None):
+    """
+    Fits and scores a LinearSVC on every split of cvSplits, with the
+    splits distributed over a pool of worker processes in contiguous
+    blocks. Each fit only depends on its split and seed, so the results
+    are identical for any n_jobs.
+
+    Parameters
+    ----------
+    pcs : np.array
+        (nspec, ncomp) PCA coefficients.
+    truth : np.array
+        (nspec,) labels.
+    splits : list
+    seeds : np.array
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    svmParams : dict
+        keyword arguments of LinearSVC, e.g. C and class_weight.
+
+    Returns
+    -------
+    scores : np.array
+        (nsplits,) test accuracy of every split.
+    models : list
+    predictions : list
+        predicted labels of the test rows of every split.
+
+    """
+    pcs = np.asarray(pcs, dtype=float)
+    if pcs.ndim == 1:
+        pcs = pcs[:,None]
+    truth = np.asarray(truth)
+    nblocks = max(1, min(snid.numWorkers(n_jobs), len(splits)))
+    svmParams = {} if svmParams is None else svmParams
+    tasks = [(pcs, truth, [splits[i] for i in block], seeds[block], svmParams)
+             for block in np.array_split(np.arange(len(splits)), nblocks)]
+    results = snid.parallelMap(_fitSplits, tasks, n_jobs=n_jobs)
+    scores = np.array([sc for res in results for sc in res[0]])
+    models = [mdl for res in results for mdl in res[1]]
+    predictions = [pred for res in results for pred in res[2]]
+    return scores, models, predictions
+
+
+def bootstrapMetrics(truth, splits, predictions, classes=None, groups=None, nboot=1000, alpha=0.05, seed=None):
+    """
+    Per-class precision and recall, accuracy and the confusion matrix of
+    the test predictions of cross validation splits, pooled over the
+    splits, with bootstrap confidence intervals. The units resampled are
+    the spectra, or the groups if given (e.g. SNePCA.pcaNames, to resample
+    SNe), each with all of its test predictions, so that a spectrum tested
+    in many splits is not counted as independent evidence. The pooled
+    confusion counts of every unit come from one bincount, the draws of
+    all nboot replicates are one (nboot, nunits) integer matrix whose unit
+    multiplicities are another bincount, and the confusion counts of all
+    replicates are their product, so there is no loop over replicates.
+
+    Parameters
+    ----------
+    truth : np.array
+        (nspec,) labels.
+    splits : list
+        (train, test) row arrays, see cvSplits.
+    predictions : list
+        predicted labels of the test rows of every split, see fitSplits.
+    classes : np.array
+        class labels, in the order of the outputs. Must contain every
+        label in truth and predictions, which is the default.
+    groups : np.array
+        (nspec,) group of every spectrum. None resamples spectra.
+    nboot : int
+        Number of bootstrap replicates.
+    alpha : float
+        the confidence intervals are the alpha/2 and 1 - alpha/2
+        percentiles of the replicates.
+    seed : int
+        Seed of the bootstrap draws.
+
+    Returns
+    -------
+    metrics : dict
+        'metrics', a pandas table indexed by class with the columns
+        precision, precisionLower, precisionUpper, recall, recallLower,
+        recallUpper and support (number of test predictions); 'counts',
+        the pooled confusion counts with true classes as rows and
+        predicted classes as columns; 'confusion', 'confusionLower' and
+        'confusionUpper', the confusion matrix normalized by the true
+        class counts and its intervals; 'accuracy', (accuracy, lower,
+        upper).
+
+    """
+    truth = np.asarray(truth)
+    rows = np.concatenate([np.asarray(test, dtype=int) for _, test in splits])
+    pred = np.concatenate([np.asarray(p) for p in predictions])
+    if classes is None:
+        classes = np.unique(np.concatenate((truth[rows], pred)))
+    classes = np.asarray(classes)
+    nclass = len(classes)
+    # position of every label in classes, looked up once per distinct label
+    index = dict((label, k) for k, label in enumerate(classes.tolist()))
+    labels, inverse = np.unique(np.concatenate((truth[rows], pred)), return_inverse=True)
+    missing = [label for label in labels.tolist() if label not in index]
+    if len(missing) > 0:
+        raise ValueError('labels %s are not in classes'%(missing))
+    positions = np.array([index[label] for label in labels.tolist()], dtype=int)[inverse]
+    codes = positions[:len(rows)] * nclass + positions[len(rows):]
+
+    # units that were tested at least once, and their pooled confusion counts
+    if groups is None:
+        _, units = np.unique(rows, return_inverse=True)
+    else:
+        _, groupInds = np.unique(np.asarray(groups), return_inverse=True)
+        _, units = np.unique(groupInds[rows], return_inverse=True)
+    nunits = np.max(units) + 1
+    unitCounts = np.bincount(units * nclass**2 + codes, minlength=nunits * nclass**2).reshape(nunits, nclass**2)
+
+    draws = np.random.RandomState(seed).randint(nunits, size=(nboot, nunits))
+    draws += np.arange(nboot)[:,None] * nunits
+    multiplicity = np.bincount(draws.ravel(), minlength=nboot * nunits).reshape(nboot, nunits)
+    counts = np.vstack((unitCounts.sum(axis=0), np.dot(multiplicity, unitCounts))).reshape(-1, nclass, nclass)
+
+    # the first row is the pooled estimate, the others the replicates
+    diag = counts[:, np.arange(nclass), np.arange(nclass)]
+    support = counts.sum(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recall = diag / support.astype(float)
+        precision = diag / counts.sum(axis=1).astype(float)
+        confusion = counts / support[:,:,None].astype(float)
+        accuracy = diag.sum(axis=1) / support.sum(axis=1).astype(float)
+
+    def interval(values):
+        return (np.nanpercentile(values[1:], 100 * alpha / 2.0, axis=0),
+                np.nanpercentile(values[1:], 100 * (1 - alpha / 2.0), axis=0))
+
+    precLower, precUpper = interval(precision)
+    recLower, recUpper = interval(recall)
+    confLower, confUpper = interval(confusion)
+    accLower, accUpper = interval(accuracy)
+    table = pd.DataFrame({'precision':precision[0], 'precisionLower':precLower, 'precisionUpper':precUpper,
+                          'recall':recall[0], 'recallLower':recLower, 'recallUpper':recUpper,
+                          'support':support[0]}, index=classes,
+                         columns=['precision', 'precisionLower', 'precisionUpper', 'recall', 'recallLower',
+                                  'recallUpper', 'support'])
+    return {'metrics':table,
+            'counts':pd.DataFrame(counts[0], index=classes, columns=classes),
+            'confusion':pd.DataFrame(confusion[0], index=classes, columns=classes),
+            'confusionLower':pd.DataFrame(confLower, index=classes, columns=classes),
+            'confusionUpper':pd.DataFrame(confUpper, index=classes, columns=classes),
+            'accuracy':(float(accuracy[0]), float(accLower), float(accUpper))}
+
+
+def cross_validate_svm(pcs, truth, ncv=10, test_size=0.3, seed=None, n_jobs=None, groups=None,
+                       stratify=False, nfolds=None, metrics=False, nboot=1000, alpha=0.05):
+    """
+    Cross validates a linear SVM classifier on PCA coefficients. By
+    default these are ncv random train/test splits, see cvSplits for the
+    grouped, stratified and k-fold splits. The splits are fit in a pool of
+    worker processes and nothing is plotted. Each split is seeded from
+    seed, so a fixed seed gives the same scores and models for any n_jobs.
+
+    Parameters
+    ----------
+    pcs : np.array
+        (nspec, ncomp) PCA coefficients, e.g. columns of
+        SNePCA.pcaCoeffMatrix.
+    truth : np.array
+        (nspec,) SN type labels.
+    ncv : int
+        Number of cross validation splits, or of k-fold repeats.
+    test_size : float
+        Fraction held out in every hold out split. With groups it is the
+        fraction of the groups, so the fraction of the spectra held out
+        varies from split to split with the sizes of the held out groups.
+        Not used with nfolds.
+    seed : int
+        Master seed for the splits. None gives unseeded splits.
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    groups : np.array
+        group of every spectrum, e.g. SNePCA.pcaNames.
+    stratify : Boolean
+    nfolds : int
+    metrics : Boolean
+        Also returns the bootstrapMetrics of the test predictions,
+        resampling the groups if given.
+    nboot : int
+    alpha : float
+        see bootstrapMetrics.
+
+    Returns
+    -------
+    scores : np.array
+        test scores of every split
+    avgsc : float
+        average CV SVM score
+    stdsc : float
+        CV SVM score standard deviation
+    models : list
+        fitted LinearSVC of every split
+    metrics : dict
+        only if metrics is True, see bootstrapMetrics.
+
+    """
+    splits, seeds = cvSplits(truth, groups, stratify, ncv, test_size, nfolds, seed)
+    scores, models, predictions = fitSplits(pcs, truth, splits, seeds, n_jobs)
+    if metrics:
+        cvMetrics = bootstrapMetrics(truth, splits, predictions, groups=groups, nboot=nboot, alpha=alpha,
+                                     seed=seed)
+        return scores, np.mean(scores), np.std(scores), models, cvMetrics
+    return scores, np.mean(scores), np.std(scores), models
+
+
+def pcaSplits(pcaobj, ncv=10, test_size=0.3, seed=None, groupSNe=False, stratify=False, nfolds=None):
+    """
+    cvSplits of the spectra of a SNePCA object, stratified by SN type and
+    grouped by SN name on request.
+
+    Returns
+    -------
+    truth : np.array
+        (nspec,) type labels 1 (IIb) to 4 (IcBL).
+    splits : list
+    seeds : np.array
+
+    """
+    IIbMask, IbMask, IcMask, IcBLMask = pcaobj.getSNeTypeMasks()
+    truth = 1*IIbMask + 2*IbMask + 3*IcMask + 4*IcBLMask
+    groups = pcaobj.pcaNames if groupSNe else None
+    splits, seeds = cvSplits(truth, groups, stratify, ncv, test_size, nfolds, seed)
+    return truth, splits, seeds
+
+
+def _fitPCASplits(task):
+    """
+    Worker for cvReconstructionErrors. Fits the PCA on the training set of
+    every split in a block of splits and measures the reconstruction
+    residuals of the test spectra.
+    """
+    specMatrix, splits, ncomp = task
+    results = []
+    for train, test in splits:
+        pca = PCA(n_components=ncomp)
+        pca.fit(specMatrix[train])
+        centered = specMatrix[test] - pca.mean_
+        coeffs = np.dot(centered, pca.components_.T)
+        sqres = np.sum(centered**2, axis=1)[:,None] - np.column_stack((np.zeros(len(test)),
+                                                                      np.cumsum(coeffs**2, axis=1)))
+        results.append(np.mean(np.clip(sqres, 0, None), axis=0))
+    return results
+
+
+def cvReconstructionErrors(pcaobj, ncomp=10, ncv=1, nfolds=5, seed=0, groupSNe=True, n_jobs=None):
+    """
+    Cross validates the PCA itself: the eigenspectra are fit without the
+    test spectra of every split, and the test spectra are reconstructed
+    from the training mean and k = 0..ncomp training eigenspectra, as in
+    SNePCA.reconstructionErrors. Grouping by SN keeps the other spectra of
+    a test SN out of the fit.
+
+    Parameters
+    ----------
+    pcaobj : SNePCA object
+    ncomp : int
+    ncv : int
+        Number of k-fold repeats, or of hold out splits if nfolds is None.
+    nfolds : int
+    seed : int
+    groupSNe : Boolean
+    n_jobs : int
+
+    Returns
+    -------
+    sqres : np.array
+        (nsplits, ncomp+1) mean squared residual norm of the test spectra
+        of every split for k = 0..ncomp eigenspectra.
+
+    """
+    _, splits, _ = pcaSplits(pcaobj, ncv=ncv, seed=seed, groupSNe=groupSNe, nfolds=nfolds)
+    nblocks = max(1, min(snid.numWorkers(n_jobs), len(splits)))
+    tasks = [(pcaobj.specMatrix, [splits[i] for i in block], ncomp)
+             for block in np.array_split(np.arange(len(splits)), nblocks)]
+    results = snid.parallelMap(_fitPCASplits, tasks, n_jobs=n_jobs)
+    return np.array([res for block in results for res in block])
+
+
+def _scorePairs(task):
+    """
+    Worker for pairwiseScoreTables. Cross validates the SVM on every pair
+    of components in a block of pairs, serially within the worker.
+
+    Parameters
+    ----------
+    task : tuple
+        (coeffs, truth, pairs, splits, seeds)
+
+    Returns
+    -------
+    results : list
+        (mean, std) score for every pair
+
+    """
+    coeffs, truth, pairs, splits, seeds = task
+    results = []
+    for i, j in pairs:
+        scores, _, _ = _fitSplits((coeffs[:,[i,j]], truth, splits, seeds, {}))
+        results.append((np.mean(scores), np.std(scores)))
+    return results
+
+
+def pairwiseScoreTables(pcas, ncomp=10, ncv=50, test_size=0.3, seed=0, n_jobs=-1, cachedir=None,
+                        groupSNe=False, stratify=False, nfolds=None):
+    """
+    Calculates the tables of mean and standard deviation SVM scores for
+    every 2D projection onto a pair of eigenspectra, for every phase range,
+    without plotting. This is the headless equivalent of
+    SNePCA.cornerplotPCA(svm=True). All pairs of all phase ranges are
+    cross validated in one pool of worker processes. Every pair uses the
+    same splits, drawn from seed with pcaSplits. If cachedir is given the
+    tables of each phase range are memoized there, keyed by the dataset
+    contents, the PCA coefficients and the other arguments.
+
+    Parameters
+    ----------
+    pcas : list
+        SNePCA objects with PCA coefficients, e.g. PhaseBundle.pcas.
+    ncomp : int
+        Number of eigenspectra in the tables.
+    ncv : int
+        Number of cross validation splits per pair.
+    test_size : float
+    seed : int
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    cachedir : string
+        Directory for the on disk cache. No caching if None.
+    groupSNe : Boolean
+        keeps all spectra of a SN on the same side of every split.
+    stratify : Boolean
+    nfolds : int
+        see cvSplits.
+
+    Returns
+    -------
+    means_tables : list
+        pandas tables of mean SVM scores for every phase range, indexed
+        by eigenspectrum number 1..ncomp, with zeros on the diagonal.
+    std_tables : list
+        pandas tables of the SVM score standard deviations.
+
+    """
+    pairs = [(i, j) for i in range(ncomp) for j in range(i)]
+    nblocks = max(1, min(snid.numWorkers(n_jobs), len(pairs)))
+
+    paths = []
+    tables = []
+    tasks = []
+    taskPhase = []
+    for ind, pcaobj in enumerate(pcas):
+        truth, splits, seeds = pcaSplits(pcaobj, ncv, test_size, seed, groupSNe, stratify, nfolds)
+        coeffs = np.ascontiguousarray(pcaobj.pcaCoeffMatrix[:,:ncomp])
+
+        path = None
+        if cachedir is not None:
+            coeffHash = hashlib.sha1(coeffs.tobytes()).hexdigest()
+            key = snid.cacheKey(snid.datasetHash(pcaobj.snidset), coeffHash, ncomp, ncv, test_size, seed,
+                                groupSNe, stratify, nfolds)
+            path = os.path.join(cachedir, 'svmtables_%s.pickle'%(key))
+        paths.append(path)
+        if path is not None and os.path.exists(path):
+            tables.append(snid.loadPickle(path))
+            continue
+        tables.append(None)
+        for block in np.array_split(np.arange(len(pairs)), nblocks):
+            tasks.append((coeffs, truth, [pairs[k] for k in block], splits, seeds))
+            taskPhase.append(ind)
+
+    results = snid.parallelMap(_scorePairs, tasks, n_jobs=n_jobs)
+    pairResults = {}
+    for ind, res in zip(taskPhase, results):
+        pairResults.setdefault(ind, []).extend(res)
+
+    means_tables = []
+    std_tables = []
+    labels = np.arange(1, ncomp + 1)
+    for ind in range(len(pcas)):
+        if tables[ind] is None:
+            means = np.zeros((ncomp, ncomp))
+            stds = np.zeros((ncomp, ncomp))
+            for (i, j), (score, std) in zip(pairs, pairResults[ind]):
+                means[i,j] = means[j,i] = score
+                stds[i,j] = stds[j,i] = std
+            tables[ind] = (means, stds)
+            if paths[ind] is not None:
+                if not os.path.isdir(cachedir):
+                    os.makedirs(cachedir)
+                snid.savePickle(paths[ind], tables[ind])
+        means, stds = tables[ind]
+        means_tables.append(pd.DataFrame(means, index=labels, columns=labels))
+        std_tables.append(pd.DataFrame(stds, index=labels, columns=labels))
+    return means_tables, std_tables
+
+
+def saveScoreTables(outdir, phases, means_tables, std_tables):
+    """
+    Pickles SVM score tables in the layout of
+    Data/DataProducts/svm_score_tables, i.e. as
+    means_svm_table_<phase>.pickle and std_svm_table_<phase>.pickle.
+
+    Parameters
+    ----------
+    outdir : string
+    phases : list
+        phase of every table, used in the file names.
+    means_tables : list
+    std_tables : list
+
+    Returns
+    -------
+
+    """
+    for ph, means, stds in zip(phases, means_tables, std_tables):
+        snid.savePickle(os.path.join(outdir, 'means_svm_table_%d.pickle'%(ph)), means)
+        snid.savePickle(os.path.join(outdir, 'std_svm_table_%d.pickle'%(ph)), stds)
+    return
+
+
+def _scoreSubsets(task):
+    """
+    Worker for bestSubsets. Cross validates the SVM on every subset of
+    components in a block of subsets, reusing the precomputed splits.
+
+    Parameters
+    ----------
+    task : tuple
+        (coeffs, truth, subsets, splits, seeds)
+
+    Returns
+    -------
+    results : list
+        (mean, std, seconds) for every subset
+
+    """
+    coeffs, truth, subsets, splits, seeds = task
+    results = []
+    for subset in subsets:
+        start = time.time()
+        scores, _, _ = _fitSplits((coeffs[:,list(subset)], truth, splits, seeds, {}))
+        results.append((np.mean(scores), np.std(scores), time.time() - start))
+    return results
+
+
+def bestSubsets(pcaobj, ncomp=10, kmin=2, kmax=5, beam=8, ncv=50, test_size=0.3, seed=0,
+                n_jobs=-1, cachedir=None, groupSNe=False, stratify=False, nfolds=None):
+    """
+    Searches for the subsets of the first ncomp eigenspectra whose PCA
+    coefficients give the best cross validated LinearSVC accuracy, for
+    subset sizes kmin..kmax. All subsets of size kmin are scored. Each
+    larger size only extends the beam best subsets of the previous size by
+    one component, so the subset lattice is searched greedily instead of
+    being enumerated. The splits are drawn once with pcaSplits and shared
+    by every subset, matching the splits of cross_validate_svm for the same
+    seed. Subsets of each level are scored in a pool of worker processes.
+    If cachedir is given, subset scores are memoized there, so repeated
+    searches and overlapping beams reuse earlier fits.
+
+    Parameters
+    ----------
+    pcaobj : SNePCA object
+        with PCA coefficients.
+    ncomp : int
+        Number of leading eigenspectra to choose from.
+    kmin : int
+        Smallest subset size, scored exhaustively.
+    kmax : int
+        Largest subset size.
+    beam : int
+        Number of subsets of each size that are extended.
+    ncv : int
+        Number of cross validation splits.
+    test_size : float
+    seed : int
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    cachedir : string
+        Directory for the on disk cache. No caching if None.
+    groupSNe : Boolean
+    stratify : Boolean
+    nfolds : int
+        see pcaSplits.
+
+    Returns
+    -------
+    ranked : pandas table
+        one row per scored subset with columns k, components (eigenspectrum
+        numbers starting at 1), mean, std and seconds (fit time of the
+        subset, 0 if cached), sorted by mean score.
+    elapsed : float
+        wall time of the search in seconds.
+
+    """
+    start = time.time()
+    truth, splits, seeds = pcaSplits(pcaobj, ncv, test_size, seed, groupSNe, stratify, nfolds)
+    coeffs = np.ascontiguousarray(pcaobj.pcaCoeffMatrix[:,:ncomp])
+
+    path = None
+    cache = {}
+    if cachedir is not None:
+        coeffHash = hashlib.sha1(coeffs.tobytes()).hexdigest()
+        key = snid.cacheKey(snid.datasetHash(pcaobj.snidset), coeffHash, ncv, test_size, seed,
+                            groupSNe, stratify, nfolds)
+        path = os.path.join(cachedir, 'subsets_%s.pickle'%(key))
+        if os.path.exists(path):
+            cache = snid.loadPickle(path)
+
+    scored = {}
+    level = list(itertools.combinations(range(ncomp), kmin))
+    for k in range(kmin, kmax + 1):
+        todo = [subset for subset in level if subset not in cache]
+        if len(todo) > 0:
+            nblocks = max(1, min(snid.numWorkers(n_jobs), len(todo)))
+            tasks = [(coeffs, truth, [todo[i] for i in block], splits, seeds)
+                     for block in np.array_split(np.arange(len(todo)), nblocks)]
+            results = snid.parallelMap(_scoreSubsets, tasks, n_jobs=n_jobs)
+            for subset, res in zip(todo, [res for block in results for res in block]):
+                cache[subset] = res[:2]
+                scored[subset] = res
+        for subset in level:
+            if subset not in scored:
+                scored[subset] = cache[subset] + (0.0,)
+
+        best = sorted(level, key=lambda subset: -scored[subset][0])[:beam]
+        level = sorted(set(tuple(sorted(subset + (c,))) for subset in best
+                           for c in range(ncomp) if c not in subset))
+
+    if path is not None:
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        snid.savePickle(path, cache)
+
+    ranked = pd.DataFrame([(len(subset), tuple(c + 1 for c in subset)) + scored[subset] for subset in scored],
+                          columns=['k', 'components', 'mean', 'std', 'seconds'])
+    ranked = ranked.sort_values('mean', ascending=False).reset_index(drop=True)
+    return ranked, time.time() - start
+
+
+def _fitGrid(task):
+    """
+    Worker for gridSearch. Fits every configuration on a block of splits.
+    The configurations are sorted by components, so each projection is
+    sliced once and reused for all values of class_weight and C, and the C
+    path of a split is fit back to back.
+
+    Parameters
+    ----------
+    task : tuple
+        (coeffs, truth, splits, seeds, configs), configs being
+        (components, class_weight, C) tuples.
+
+    Returns
+    -------
+    scores : np.array
+        (nconfigs, nsplits)
+
+    """
+    coeffs, truth, splits, seeds, configs = task
+    scores = np.zeros((len(configs), len(splits)))
+    projection = (None, None)
+    for c, (comps, cw, C) in enumerate(configs):
+        if projection[0] != comps:
+            projection = (comps, coeffs[:,[k - 1 for k in comps]])
+        X = projection[1]
+        for s, ((train, test), sd) in enumerate(zip(splits, seeds)):
+            linsvm = LinearSVC(C=C, class_weight=cw, random_state=sd)
+            linsvm.fit(X[train], truth[train])
+            scores[c, s] = np.mean(linsvm.predict(X[test]) == truth[test])
+    return scores
+
+
+def gridSearch(pcas, Cs=(0.01, 0.1, 1.0, 10.0, 100.0), classWeights=(None, 'balanced'), ncomps=(2, 3, 4, 5),
+               components=None, niter=None, ncv=10, test_size=0.3, seed=0, n_jobs=-1, cachedir=None,
+               groupSNe=False, stratify=False, nfolds=None):
+    """
+    Grid or random search over the LinearSVC C and class_weight and over
+    the PCA components, for every phase window. Every configuration of a
+    window is scored on the same splits from pcaSplits, and the splits of
+    all windows run in one pool of worker processes, in blocks of splits
+    that each fit every configuration. liblinear can not be warm started,
+    so instead each block slices the projection of a component choice once
+    and fits all its class weights and C values on it. If cachedir is
+    given the scores of each window are memoized there.
+
+    Parameters
+    ----------
+    pcas : list
+        SNePCA objects with PCA coefficients, e.g. PhaseBundle.pcas.
+    Cs : tuple
+    classWeights : tuple
+        LinearSVC class_weight values.
+    ncomps : tuple
+        numbers of leading eigenspectra to try. Ignored if components is
+        given.
+    components : list
+        eigenspectrum number tuples (starting at 1) to try, e.g. from
+        bestSubsets.
+    niter : int
+        Number of configurations drawn at random from the grid, with the
+        same draw for every window. The full grid if None.
+    ncv : int
+    test_size : float
+    seed : int
+        Seed of the splits and of the random search.
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    cachedir : string
+        Directory for the on disk cache. No caching if None.
+    groupSNe : Boolean
+    stratify : Boolean
+    nfolds : int
+        see pcaSplits.
+
+    Returns
+    -------
+    table : pandas table
+        one row per window and configuration with columns phasemin,
+        phasemax, components, ncomp, C, class_weight, mean and std,
+        sorted by window and mean score.
+    best : list
+        best configuration of each window as a dict of components, C,
+        class_weight, mean and std. Smaller models win ties. Pass it to
+        trainClassifier(best=best) to train and save a classifier with
+        these settings.
+
+    """
+    if components is None:
+        components = [tuple(range(1, k + 1)) for k in ncomps]
+    configs = [(tuple(comps), cw, float(C)) for comps in components for cw in classWeights for C in sorted(Cs)]
+    if niter is not None and niter < len(configs):
+        draw = np.random.RandomState(seed).choice(len(configs), niter, replace=False)
+        configs = [configs[i] for i in sorted(draw)]
+    maxcomp = max(max(comps) for comps, _, _ in configs)
+
+    paths = []
+    windowScores = []
+    tasks = []
+    taskWindow = []
+    for ind, pcaobj in enumerate(pcas):
+        truth, splits, seeds = pcaSplits(pcaobj, ncv, test_size, seed, groupSNe, stratify, nfolds)
+        coeffs = np.ascontiguousarray(pcaobj.pcaCoeffMatrix[:,:maxcomp])
+
+        path = None
+        if cachedir is not None:
+            coeffHash = hashlib.sha1(coeffs.tobytes()).hexdigest()
+            key = snid.cacheKey(snid.datasetHash(pcaobj.snidset), coeffHash, configs, ncv, test_size, seed,
+                                groupSNe, stratify, nfolds)
+            path = os.path.join(cachedir, 'gridsearch_%s.pickle'%(key))
+        paths.append(path)
+        if path is not None and os.path.exists(path):
+            windowScores.append(snid.loadPickle(path))
+            continue
+        windowScores.append(None)
+        nblocks = max(1, min(snid.numWorkers(n_jobs), len(splits)))
+        for block in np.array_split(np.arange(len(splits)), nblocks):
+            tasks.append((coeffs, truth, [splits[i] for i in block], seeds[block], configs))
+            taskWindow.append(ind)
+
+    results = snid.parallelMap(_fitGrid, tasks, n_jobs=n_jobs)
+    blocks = {}
+    for ind, res in zip(taskWindow, results):
+        blocks.setdefault(ind, []).append(res)
+
+    rows = []
+    best = []
+    for ind, pcaobj in enumerate(pcas):
+        if windowScores[ind] is None:
+            windowScores[ind] = np.hstack(blocks[ind])
+            if paths[ind] is not None:
+                if not os.path.isdir(cachedir):
+                    os.makedirs(cachedir)
+                snid.savePickle(paths[ind], windowScores[ind])
+        means = np.mean(windowScores[ind], axis=1)
+        stds = np.std(windowScores[ind], axis=1)
+        for (comps, cw, C), mean, std in zip(configs, means, stds):
+            rows.append((pcaobj.phasemin, pcaobj.phasemax, comps, len(comps), C, cw, mean, std))
+        order = sorted(range(len(configs)), key=lambda c: (-means[c], len(configs[c][0]), configs[c][2]))
+        comps, cw, C = configs[order[0]]
+        best.append({'components':comps, 'C':C, 'class_weight':cw, 'mean':float(means[order[0]]),
+                     'std':float(stds[order[0]])})
+
+    table = pd.DataFrame(rows, columns=['phasemin', 'phasemax', 'components', 'ncomp', 'C', 'class_weight',
+                                        'mean', 'std'])
+    table = table.sort_values(['phasemin', 'mean'], ascending=[True, False]).reset_index(drop=True)
+    return table, best
+
+
+def _transferVotes(task):
+    """
+    Worker for transferMatrix. Fits the LinearSVC of every split in a block
+    of splits of one training window and counts the votes of the block's
+    ensemble for every spectrum of every window, with one matrix multiply
+    per window. A model only votes for spectra of SNe outside its training
+    set.
+
+    Parameters
+    ----------
+    task : tuple
+        (coeffs, truth, names, splits, seeds, svmParams, classes, targets),
+        targets being (coeffs, names) of every window, projected onto the
+        training window's eigenspectra.
+
+    Returns
+    -------
+    votes : list
+        (nspec, nclasses) vote counts for the spectra of every window.
+
+    """
+    coeffs, truth, names, splits, seeds, svmParams, classes, targets = task
+    _, models, _ = _fitSplits((coeffs, truth, splits, seeds, svmParams))
+    ensemble = SESNClassifier.SVMEnsemble.fromModels(models, classes)
+    nclass = len(classes)
+    votes = []
+    for X, testNames in targets:
+        winners = np.argmax(ensemble.decisionScores(X), axis=2)
+        unseen = np.column_stack([~np.isin(testNames, names[train]) for train, _ in splits])
+        codes = np.arange(len(X))[:,None] * nclass + winners
+        votes.append(np.bincount(codes[unseen], minlength=len(X) * nclass).reshape(len(X), nclass))
+    return votes
+
+
+def transferMatrix(pcas, components=PAPER_COMPONENTS, ncv=50, test_size=0.3, seed=0, n_jobs=-1,
+                   cachedir=None, groupSNe=False, stratify=False, nfolds=None, svmParams=None, nboot=1000,
+                   alpha=0.05):
+    """
+    Cross-phase transfer scores. For every training window the LinearSVC
+    ensemble of trainClassifier is fit on the CV splits of pcaSplits, and
+    the spectra of every window, projected onto the training window's
+    eigenspectra as in SNePCA.calcPCACoeffs, are classified by the
+    majority vote of the models that did not see their SN in training
+    (out of bag). Every cell, the diagonal included, is thus scored on SNe
+    unseen by the voting models, and is the accuracy of those votes, with
+    a bootstrap interval resampling the SNe (bootstrapMetrics). Spectra
+    that no model could vote for are not scored. The splits of all
+    training windows run in one pool of worker processes, from the pcas
+    loaded once, e.g. with SNePhase.PhaseBundle. If cachedir is given the
+    out of bag vote counts of every training window, which need the
+    LinearSVC fits of all its splits, are memoized there, keyed by the
+    datasets, the training eigenspectra and the CV and SVM settings. The
+    projections are cheap and always recomputed.
+
+    Parameters
+    ----------
+    pcas : list
+        SNePCA objects with PCA coefficients on the same wavelengths, e.g.
+        PhaseBundle.pcas.
+    components : list
+        eigenspectrum numbers (starting at 1) used in each training window.
+    ncv : int
+    test_size : float
+    seed : int
+        Seed of the splits and of the bootstrap.
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    cachedir : string
+        Directory for the on disk cache. No caching if None.
+    groupSNe : Boolean
+    stratify : Boolean
+    nfolds : int
+        see pcaSplits.
+    svmParams : list
+        LinearSVC keyword arguments of each training window, see
+        trainClassifier.
+    nboot : int
+    alpha : float
+        see bootstrapMetrics.
+
+    Returns
+    -------
+    scores : pandas table
+        accuracy of the out of bag votes, indexed by training window
+        (rows) and test window (columns), labelled '[phasemin, phasemax]'.
+    lower : pandas table
+    upper : pandas table
+        1 - alpha bootstrap confidence interval of the accuracy.
+    support : pandas table
+        number of spectra scored.
+
+    """
+    for pcaobj in pcas[1:]:
+        if not np.allclose(pcaobj.wavelengths, pcas[0].wavelengths):
+            raise ValueError('all phase windows must have the same wavelengths')
+    classes = np.arange(1, len(SESNClassifier.SN_TYPES) + 1)
+    if svmParams is None:
+        svmParams = [{} for pcaobj in pcas]
+    cv = [pcaSplits(pcaobj, ncv, test_size, seed, groupSNe, stratify, nfolds) for pcaobj in pcas]
+    names = [np.asarray(pcaobj.pcaNames) for pcaobj in pcas]
+    nblocks = max(1, min(snid.numWorkers(n_jobs), len(cv[0][1])))
+    if cachedir is not None:
+        datasetHashes = tuple(snid.datasetHash(pcaobj.snidset) for pcaobj in pcas)
+
+    paths = []
+    votes = []
+    tasks = []
+    taskWindow = []
+    for ind, (pcaobj, comps, params) in enumerate(zip(pcas, components, svmParams)):
+        inds = [c - 1 for c in comps]
+        evecs = np.ascontiguousarray(pcaobj.evecs[inds])
+        coeffs = pcaobj.pcaCoeffMatrix[:,inds]
+
+        path = None
+        if cachedir is not None:
+            key = snid.cacheKey(datasetHashes, ind, hashlib.sha1(evecs.tobytes()).hexdigest(), ncv, test_size,
+                                seed, groupSNe, stratify, nfolds, sorted(params.items()))
+            path = os.path.join(cachedir, 'transfervotes_%s.pickle'%(key))
+        paths.append(path)
+        if path is not None and os.path.exists(path):
+            votes.append(snid.loadPickle(path))
+            continue
+        votes.append([0] * len(pcas))
+
+        targets = []
+        for tind, testobj in enumerate(pcas):
+            X = coeffs if tind == ind else np.dot(evecs, testobj.specMatrix.T).T
+            targets.append((X, names[tind]))
+        truth, splits, seeds = cv[ind]
+        for block in np.array_split(np.arange(len(splits)), nblocks):
+            tasks.append((coeffs, truth, names[ind], [splits[i] for i in block], seeds[block], params,
+                          classes, targets))
+            taskWindow.append(ind)
+
+    results = snid.parallelMap(_transferVotes, tasks, n_jobs=n_jobs)
+    for ind, res in zip(taskWindow, results):
+        for tind in range(len(pcas)):
+            votes[ind][tind] = votes[ind][tind] + res[tind]
+    for ind in sorted(set(taskWindow)):
+        if paths[ind] is not None:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            snid.savePickle(paths[ind], votes[ind])
+
+    tables = np.nan * np.ones((4, len(pcas), len(pcas)))
+    for ind in range(len(pcas)):
+        for tind in range(len(pcas)):
+            scored = np.flatnonzero(np.sum(votes[ind][tind], axis=1) > 0)
+            tables[3, ind, tind] = len(scored)
+            if len(scored) == 0:
+                continue
+            pred = classes[np.argmax(votes[ind][tind][scored], axis=1)]
+            metrics = bootstrapMetrics(cv[tind][0], [(None, scored)], [pred], classes=classes,
+                                       groups=names[tind], nboot=nboot, alpha=alpha, seed=seed)
+            tables[:3, ind, tind] = metrics['accuracy']
+    labels = ['[%g, %g]'%(pcaobj.phasemin, pcaobj.phasemax) for pcaobj in pcas]
+    scores, lower, upper, support = [pd.DataFrame(table, index=labels, columns=labels) for table in tables]
+    return scores, lower, upper, support.astype(int)
+
+
+def trainClassifier(pcas, components=PAPER_COMPONENTS, ncv=50, test_size=0.3, seed=0, n_jobs=-1,
+                    groupSNe=False, stratify=False, nfolds=None, svmParams=None, nbasis=None, best=None):
+    """
+    Trains a SESNClassifier from fitted SNePCA objects, one per phase
+    window. For each window the LinearSVC models of all CV splits on the
+    chosen components are kept as the window's ensemble.
+
+    Parameters
+    ----------
+    pcas : list
+        SNePCA objects with PCA coefficients, e.g. PhaseBundle.pcas.
+    components : list
+        eigenspectrum numbers (starting at 1) used in each window. The
+        default is the choice of Figure 5 of Williamson et al. (2019).
+    ncv : int
+        Number of CV splits, i.e. ensemble size, or of k-fold repeats.
+    test_size : float
+    seed : int
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    groupSNe : Boolean
+    stratify : Boolean
+    nfolds : int
+        see pcaSplits.
+    svmParams : list
+        LinearSVC keyword arguments (C, class_weight) of each window,
+        e.g. from gridSearch. They are stored in the classifier. LinearSVC
+        defaults if None.
+    nbasis : int
+        number of eigenspectra stored with the training mean of each
+        window for SESNClassifier.classifyShifted. Defaults to those
+        explaining 99% of the variance of each window.
+    best : list
+        best configuration of each window from gridSearch. If given it
+        replaces components and svmParams, so the classifier is trained
+        and saved with the chosen components, C and class_weight.
+
+    Returns
+    -------
+    clf : SESNClassifier
+
+    """
+    if best is not None:
+        components = [tuple(b['components']) for b in best]
+        svmParams = [{'C':b['C'], 'class_weight':b['class_weight']} for b in best]
+    classes = np.arange(1, len(SESNClassifier.SN_TYPES) + 1)
+    windows = []
+    evecs = []
+    coefs = []
+    intercepts = []
+    scores = []
+    means = []
+    basis = []
+    pixelVariances = []
+    if svmParams is None:
+        svmParams = [{} for pcaobj in pcas]
+    for pcaobj, comps, params in zip(pcas, components, svmParams):
+        inds = [c - 1 for c in comps]
+        truth, splits, seeds = pcaSplits(pcaobj, ncv, test_size, seed, groupSNe, stratify, nfolds)
+        cvScores, models, _ = fitSplits(pcaobj.pcaCoeffMatrix[:,inds], truth, splits, seeds, n_jobs, params)
+
+        ensemble = SESNClassifier.SVMEnsemble.fromModels(models, classes)
+
+        windows.append((pcaobj.phasemin, pcaobj.phasemax))
+        evecs.append(pcaobj.evecs[inds])
+        coefs.append(ensemble.coefs)
+        intercepts.append(ensemble.intercepts)
+        scores.append((float(np.mean(cvScores)), float(np.std(cvScores))))
+        nb = int(np.searchsorted(pcaobj.evals_cs, 0.99)) + 1 if nbasis is None else nbasis
+        means.append(np.mean(pcaobj.specMatrix, axis=0))
+        basis.append(pcaobj.evecs[:nb])
+        pixelVariances.append(np.mean(np.var(pcaobj.specMatrix, axis=0)))
+    return SESNClassifier.SESNClassifier(pcas[0].wavelengths, windows, evecs, coefs, intercepts,
+                                         classes=classes, components=list(components),
+                                         scores=scores, svmParams=list(svmParams), means=means,
+                                         basis=basis, pixelVariances=pixelVariances)
@@ -1,9 +1,13 @@
 import SNIDsn
 import SNIDdataset as snid
+import SNeCV
+import SESNClassifier
+import SNeStreamPCA
 
 import numpy as np
 import scipy
 
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 sns.set_color_codes('colorblind')
@@ -22,10 +26,13 @@ import sklearn
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 from scipy.spatial import distance
+from scipy.spatial import cKDTree
 from sklearn.svm import LinearSVC
 from sklearn.model_selection import train_test_split
 
 import pickle
+import os
+import hashlib
 
 from scipy.io.idl import readsav
 import pylab as pl
@@ -90,9 +97,122 @@ def make_meshgrid(x, y, h=.02):
     return xx, yy
 
 
-def plot_contours(ax, clf, xx, yy, alphasvm):
+SVM_TYPE_COLORS = {1:'g', 2:'mediumorchid', 3:'r', 4:'gray'}
+
+
+def linearScores(models, points):
+    """
+    Evaluates the decision functions of linear classifiers (e.g. LinearSVC)
+    directly from coef_ and intercept_, and returns the predicted class of
+    every point for every model. Models fit on different CV splits may have
+    seen different classes, so predictions are returned as labels.
+
+    Parameters
+    ----------
+    models : list
+        fitted linear classifiers
+    points : np.array
+        (npoints, nfeatures)
+
+    Returns
+    -------
+    labels : np.array
+        (nmodels, npoints) predicted class labels
+
+    """
+    labels = np.empty((len(models), len(points)), dtype=np.asarray(models[0].classes_).dtype)
+    for i, clf in enumerate(models):
+        scores = np.dot(points, clf.coef_.T) + clf.intercept_
+        if scores.shape[1] == 1:
+            labels[i] = clf.classes_[(scores[:,0] > 0).astype(int)]
+        else:
+            labels[i] = clf.classes_[np.argmax(scores, axis=1)]
+    return labels
+
+
+def linearRegions(clf, xlim, ylim):
+    """
+    Computes the decision regions of a linear classifier in 2D as polygons,
+    by clipping the plotting box with the half planes where each class has
+    the largest decision function. No mesh is evaluated.
+
+    Parameters
+    ----------
+    clf : fitted linear classifier with 2 features
+    xlim : tuple
+    ylim : tuple
+
+    Returns
+    -------
+    regions : list
+        (class label, (nvertices, 2) polygon) for every class with a
+        non-empty region.
+
+    """
+    W = np.atleast_2d(clf.coef_)
+    b = np.atleast_1d(clf.intercept_)
+    if len(W) == 1:
+        W = np.vstack((-W, W))
+        b = np.hstack((-b, b))
+    box = np.array([[xlim[0], ylim[0]], [xlim[1], ylim[0]], [xlim[1], ylim[1]], [xlim[0], ylim[1]]])
+
+    regions = []
+    for c in range(len(W)):
+        poly = box
+        for d in range(len(W)):
+            if d == c or len(poly) == 0:
+                continue
+            # keep (W[c] - W[d]).x + b[c] - b[d] >= 0
+            val = np.dot(poly, W[c] - W[d]) + b[c] - b[d]
+            clipped = []
+            for k in range(len(poly)):
+                p, q = poly[k], poly[(k + 1) % len(poly)]
+                vp, vq = val[k], val[(k + 1) % len(poly)]
+                if vp >= 0:
+                    clipped.append(p)
+                if (vp >= 0) != (vq >= 0):
+                    clipped.append(p + (q - p) * vp / (vp - vq))
+            poly = np.array(clipped)
+        if len(poly) >= 3:
+            regions.append((clf.classes_[c], poly))
+    return regions
+
+
+def voteMap(models, xlim, ylim, npix=300):
     """
-    Plot the decision boundaries for a classifier.
+    Aggregates the predictions of several linear classifiers (e.g. the
+    models of every CV split) into one vote map on a coarse raster. The
+    models are stacked into a SESNClassifier.SVMEnsemble, so the map is
+    one matrix multiply.
+
+    Parameters
+    ----------
+    models : list
+        fitted linear classifiers with 2 features
+    xlim : tuple
+    ylim : tuple
+    npix : int
+        raster size along each axis.
+
+    Returns
+    -------
+    classes : np.array
+        class labels
+    votes : np.array
+        (npix, npix, nclasses) number of models predicting each class,
+        with rows along y.
+
+    """
+    ensemble = SESNClassifier.SVMEnsemble.fromModels(models)
+    _, _, votes = ensemble.classify(np.empty((0, 2)), xlim, ylim, npix)
+    return ensemble.classes, votes
+
+
+def plot_contours(ax, clf, xx, yy, alphasvm, colors=SVM_TYPE_COLORS):
+    """
+    Plot the decision boundaries for a classifier. The regions of linear
+    classifiers are drawn as polygons computed from coef_ and intercept_,
+    other classifiers are evaluated on the mesh.
 
     Parameters
     ----------
@@ -101,30 +221,254 @@ def plot_contours(ax, clf, xx, yy, alphasvm):
     xx : meshgrid ndarray
     yy : meshgrid ndarray
     alphasvm : float
+    colors : dict
+        {class label: color}
     """
-    Z = clf.predict(np.c_[xx.ravel(), yy.ravel()])
+    if hasattr(clf, 'coef_') and np.atleast_2d(clf.coef_).shape[1] == 2:
+        out = []
+        for tp, poly in linearRegions(clf, (xx.min(), xx.max()), (yy.min(), yy.max())):
+            patch = mpatches.Polygon(poly, closed=True, color=colors[tp], alpha=alphasvm, linewidth=0)
+            out.append(ax.add_patch(patch))
+        return out
 
-    IIbZ = len(Z[Z==1])
-    IbZ = len(Z[Z==2])
-    IcZ = len(Z[Z==3])
-    IcBLZ = len(Z[Z==4])
-    colors = []
-    if IIbZ != 0:
-        colors.append(self.IIb_color)
-    if IbZ != 0:
-        colors.append(self.Ib_color)
-    if IcZ != 0:
-        colors.append(self.Ic_color)
-    if IcBLZ != 0:
-        colors.append(self.IcBL_color)
-    nbins = len(colors)
-    cmap_name = 'mymap'
-    cm = LinearSegmentedColormap.from_list(cmap_name, colors, N=nbins)
+    Z = clf.predict(np.c_[xx.ravel(), yy.ravel()])
+    present = [tp for tp in sorted(colors) if np.any(Z == tp)]
+    cm = LinearSegmentedColormap.from_list('mymap', [colors[tp] for tp in present], N=len(present))
     Z = Z.reshape(xx.shape)
     out = ax.contourf(xx, yy, Z, cmap=cm, alpha=alphasvm)
     return out
 
 
+def _fitResamples(task):
+    """
+    Worker for SNePCA.bootstrapEigenspectra. Refits the eigenspectra for
+    a block of bootstrap or jackknife replicates and aligns their signs
+    with the reference eigenspectra.
+
+    Parameters
+    ----------
+    task : tuple
+        (specMatrix, groups, replicates, ncomp, method, seed, refEvecs),
+        where groups holds the row indices of every SN and replicates
+        the replicate numbers in this block.
+
+    Returns
+    -------
+    evecs : np.array
+        (nrep, ncomp, nwvlbins) eigenspectra
+    evals_cs : np.array
+        (nrep, ncomp) cumulative explained variance ratios
+
+    """
+    specMatrix, groups, replicates, ncomp, method, seed, refEvecs = task
+    evecsList = []
+    evalsList = []
+    for rep in replicates:
+        if method == 'jackknife':
+            drawn = [g for i, g in enumerate(groups) if i != rep]
+        else:
+            # seeding per replicate makes the draws independent of n_jobs
+            rng = np.random.RandomState([seed, rep])
+            drawn = [groups[i] for i in rng.randint(len(groups), size=len(groups))]
+        sample = specMatrix[np.concatenate(drawn)]
+        centered = sample - np.mean(sample, axis=0)
+        _, sv, vt = np.linalg.svd(centered, full_matrices=False)
+        evecs = vt[:ncomp]
+        dots = np.sum(evecs * refEvecs, axis=1)
+        evecsList.append(evecs * np.where(dots < 0, -1.0, 1.0)[:,None])
+        evalsList.append(np.cumsum(sv[:ncomp]**2) / np.sum(sv**2))
+    return np.array(evecsList), np.array(evalsList)
+
+
+class TypeRegions:
+    """
+    Regions of the SN types in the space of a set of PCA components, each
+    described by a centroid and either per-component radii (an axis
+    aligned ellipse) or a scaled covariance (Mahalanobis distance).
+    Distances are in units of the region radius, so a distance below 1
+    is inside the region. Scoring a spectrum costs O(ntypes * ncomp^2)
+    independent of the dataset size.
+    """
+
+    def __init__(self, typeNames, components, centroids, radii=None, covariances=None):
+        """
+        Parameters
+        ----------
+        typeNames : list
+        components : list
+            eigenspectrum numbers (starting at 1) of the coefficients.
+        centroids : np.array
+            (ntypes, ncomp)
+        radii : np.array
+            (ntypes, ncomp) ellipse radii.
+        covariances : np.array
+            (ntypes, ncomp, ncomp) covariances for the Mahalanobis
+            distance, used instead of radii if given.
+
+        """
+        self.typeNames = np.asarray(typeNames)
+        self.components = list(components)
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.radii = None if radii is None else np.asarray(radii, dtype=float)
+        self.covariances = None
+        self.precisions = None
+        if covariances is not None:
+            self.covariances = np.asarray(covariances, dtype=float)
+            self.precisions = np.linalg.inv(self.covariances)
+        return
+
+    def distances(self, coeffs):
+        """
+        Calculates the distance of every spectrum to every type region.
+
+        Parameters
+        ----------
+        coeffs : np.array
+            (nspec, ncomp) PCA coefficients of self.components.
+
+        Returns
+        -------
+        dist : np.array
+            (nspec, ntypes) distances in units of the region radius.
+
+        """
+        diff = np.atleast_2d(coeffs)[:,None,:] - self.centroids[None,:,:]
+        if self.precisions is None:
+            dist2 = np.sum((diff / self.radii[None,:,:])**2, axis=2)
+        else:
+            dist2 = np.einsum('ntk,tkl,ntl->nt', diff, self.precisions, diff)
+        return np.sqrt(dist2)
+
+    def evaluate(self, coeffs, truth, outlierRadius=2.0):
+        """
+        Scores spectra of known type against the regions.
+
+        Parameters
+        ----------
+        coeffs : np.array
+            (nspec, ncomp) PCA coefficients of self.components.
+        truth : np.array
+            (nspec,) index into self.typeNames of each spectrum's type, or
+            -1 for spectra of other types.
+        outlierRadius : float
+            spectra further than outlierRadius from the region of their
+            own type are flagged as outliers.
+
+        Returns
+        -------
+        result : dict
+            distances (nspec, ntypes), inside (nspec, ntypes) mask,
+            outliers (nspec,) mask, and per type ninside, ncorrect,
+            purity (ncorrect / ninside) and completeness (ncorrect /
+            number of spectra of the type).
+
+        """
+        truth = np.asarray(truth)
+        dist = self.distances(coeffs)
+        inside = dist < 1
+        member = truth[:,None] == np.arange(len(self.typeNames))[None,:]
+        ninside = np.sum(inside, axis=0)
+        ncorrect = np.sum(inside & member, axis=0)
+        ntype = np.sum(member, axis=0)
+        ownDist = np.where(truth >= 0, dist[np.arange(len(truth)), np.clip(truth, 0, None)], np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            purity = ncorrect / ninside.astype(float)
+            completeness = ncorrect / ntype.astype(float)
+        return {'distances':dist, 'inside':inside, 'outliers':ownDist >= outlierRadius,
+                'ninside':ninside, 'ncorrect':ncorrect, 'purity':purity, 'completeness':completeness}
+
+
+class TemplateIndex:
+    """
+    KD-tree over the PCA coefficients of the library spectra, for finding
+    the templates closest to new spectra in PCA space. The SN name, phase
+    and type of every library spectrum are kept with the tree. Indexes are
+    pickled with save and built or loaded by SNePCA.templateIndex.
+    """
+
+    def __init__(self, coeffs, names, phases, types, components):
+        """
+        Parameters
+        ----------
+        coeffs : np.array
+            (nspec, ncomp) PCA coefficients of the library spectra.
+        names : np.array
+            SN name of every spectrum.
+        phases : np.array
+            phase of every spectrum.
+        types : np.array
+            SN type of every spectrum.
+        components : list
+            eigenspectrum numbers (starting at 1) of the coefficients.
+
+        """
+        self.coeffs = np.asarray(coeffs, dtype=float)
+        self.names = np.asarray(names)
+        self.phases = np.asarray(phases, dtype=float)
+        self.types = np.asarray(types)
+        self.components = list(components)
+        self.tree = cKDTree(self.coeffs)
+        return
+
+    def query(self, coeffs, k=5):
+        """
+        Finds the k nearest library spectra of every projection.
+
+        Parameters
+        ----------
+        coeffs : np.array
+            (nquery, ncomp) PCA coefficients of self.components.
+        k : int
+
+        Returns
+        -------
+        dist : np.array
+            (nquery, k) euclidean distances in PCA space.
+        inds : np.array
+            (nquery, k) rows of the library spectra. The matching names,
+            phases and types are self.names[inds], self.phases[inds] and
+            self.types[inds].
+
+        """
+        dist, inds = self.tree.query(np.atleast_2d(coeffs), k=k)
+        if k == 1:
+            dist, inds = dist[:,None], inds[:,None]
+        return dist, inds
+
+    def queryRadius(self, coeffs, r):
+        """
+        Finds all library spectra within distance r of every projection.
+
+        Parameters
+        ----------
+        coeffs : np.array
+            (nquery, ncomp)
+        r : float
+
+        Returns
+        -------
+        inds : list
+            row array of the library spectra for every projection, sorted
+            by distance.
+
+        """
+        coeffs = np.atleast_2d(coeffs)
+        found = self.tree.query_ball_point(coeffs, r)
+        inds = []
+        for c, rows in zip(coeffs, found):
+            rows = np.array(rows, dtype=int)
+            order = np.argsort(np.sum((self.coeffs[rows] - c)**2, axis=1))
+            inds.append(rows[order])
+        return inds
+
+    def save(self, path):
+        """
+        Pickles the index, including the tree, to path.
+        """
+        snid.savePickle(path, self)
+        return
+
+
 class SNePCA:
 
     def __init__(self, snidset, phasemin, phasemax):
@@ -144,26 +488,12 @@ class SNePCA:
         self.Ic_ellipse_color = 'r'
         self.IcBL_ellipse_color = 'gray'
         
-        nspec = snid.numSpec(self.snidset)
         snnames = list(self.snidset.keys())
-        tmpobj = self.snidset[snnames[0]]
-        nwvlbins = len(tmpobj.wavelengths)
-        self.wavelengths = tmpobj.wavelengths
-
-        specMatrix = np.ndarray((nspec, nwvlbins))
-        pcaNames = []
-        pcaPhases = []
-        count = 0
-        for snname in snnames:
-            snobj = self.snidset[snname]
-            phasekeys = snobj.getSNCols()
-            for phk in phasekeys:
-                specMatrix[count,:] = snobj.data[phk]
-                count = count + 1
-                pcaNames.append(snname)
-                pcaPhases.append(phk)
-        self.pcaNames = np.array(pcaNames)
-        self.pcaPhases = np.array(pcaPhases)
+        self.wavelengths = self.snidset[snnames[0]].wavelengths
+
+        specMatrix, pcaNames, pcaPhases, _ = snid.datasetSpecMatrix(self.snidset)
+        self.pcaNames = pcaNames
+        self.pcaPhases = pcaPhases
         self.specMatrix = specMatrix
 
         return
@@ -224,6 +554,175 @@ class SNePCA:
         self.evals_cs = self.evals.cumsum()
         return
 
+    def getUncertaintyMatrix(self):
+        """
+        Collects the per-pixel smoothing uncertainties stored in
+        SNIDsn.smooth_uncertainty into a matrix matching self.specMatrix.
+        Spectra without a stored uncertainty are given NaN rows.
+
+        Returns
+        -------
+        uncMatrix : np.array
+            (nspec, nwvlbins) uncertainties
+
+        """
+        uncMatrix = np.nan * np.ones(self.specMatrix.shape)
+        for i, (snname, phk) in enumerate(zip(self.pcaNames, self.pcaPhases)):
+            unc = self.snidset[snname].smooth_uncertainty.get(phk)
+            if unc is not None:
+                uncMatrix[i] = unc
+        return uncMatrix
+
+    def snidWeightedPCA(self, ncomp=10, maxiter=100, tol=1e-6, uncFloor=0.1):
+        """
+        Calculates inverse variance weighted PCA eigenspectra using the
+        smoothing uncertainties, and stores them in self.weightedEvecs, with
+        self.weightedEvals, self.weightedEvals_cs and the weighted mean
+        spectrum self.weightedMean. self.evecs is left unchanged; assign
+        self.evecs = self.weightedEvecs to use them for calcPCACoeffs or
+        the plots. The low rank
+        model is fit by alternating weighted least squares, solving for the
+        coefficients of all spectra and then the eigenspectra at all pixels
+        as stacked (ncomp, ncomp) systems. The iteration is warm started
+        from the unweighted eigenspectra and stops when the fractional
+        change of the weighted chi^2 is below tol, or after maxiter
+        iterations. The final eigenspectra are orthonormalized, ordered by
+        variance captured and signed to match the unweighted eigenspectra.
+        The weightedEvals are the variances captured by the weighted model
+        as fractions of the unweighted total variance of the spectra about
+        the weighted mean, so that they compare directly with self.evals
+        from snidPCA.
+
+        Parameters
+        ----------
+        ncomp : int
+            Number of eigenspectra to fit.
+        maxiter : int
+            Maximum number of iterations.
+        tol : float
+            Convergence tolerance on the fractional chi^2 change.
+        uncFloor : float
+            Uncertainties are floored at uncFloor times the median
+            uncertainty of the dataset, so that pixels with a vanishing
+            smoothing residual do not dominate the fit. Spectra without
+            stored uncertainties get the median uncertainty.
+
+        Returns
+        -------
+        chi2 : list
+            weighted chi^2 after every iteration.
+        converged : Boolean
+            False if maxiter was reached before the tolerance.
+
+        """
+        unc = self.getUncertaintyMatrix()
+        medUnc = np.nanmedian(unc)
+        unc[np.isnan(unc)] = medUnc
+        weights = 1.0 / np.power(np.maximum(unc, uncFloor * medUnc), 2)
+
+        pcaMean = np.sum(weights * self.specMatrix, axis=0) / np.sum(weights, axis=0)
+        centered = self.specMatrix - pcaMean
+
+        # warm start from the unweighted solution
+        if hasattr(self, 'evecs') and len(self.evecs) >= ncomp:
+            unweighted = self.evecs[:ncomp]
+        else:
+            unweighted = np.linalg.svd(centered, full_matrices=False)[2][:ncomp]
+        basis = unweighted
+
+        wcentered = weights * centered
+        chi2 = []
+        converged = False
+        for it in range(maxiter):
+            # (nspec, ncomp, ncomp) normal equations for the coefficients
+            A = np.matmul(weights[:,None,:] * basis[None,:,:], basis.T)
+            b = np.dot(wcentered, basis.T)
+            coeffs = np.linalg.solve(A, b[:,:,None])[:,:,0]
+
+            # (nwvlbins, ncomp, ncomp) normal equations for the eigenspectra
+            A = np.matmul(weights.T[:,None,:] * coeffs.T[None,:,:], coeffs)
+            b = np.dot(wcentered.T, coeffs)
+            basis = np.linalg.solve(A, b[:,:,None])[:,:,0].T
+
+            resid = centered - np.dot(coeffs, basis)
+            chi2.append(np.sum(weights * resid**2))
+            if it > 0 and np.abs(chi2[-2] - chi2[-1]) <= tol * chi2[-2]:
+                converged = True
+                break
+
+        # rotate the low rank model onto orthonormal eigenspectra
+        _, sv, vt = np.linalg.svd(np.dot(coeffs, basis), full_matrices=False)
+        evecs = vt[:ncomp]
+        dots = np.sum(evecs * unweighted, axis=1)
+        self.weightedEvecs = evecs * np.where(dots < 0, -1.0, 1.0)[:,None]
+        self.weightedEvals = sv[:ncomp]**2 / np.sum(centered**2)
+        self.weightedEvals_cs = self.weightedEvals.cumsum()
+        self.weightedMean = pcaMean
+        return chi2, converged
+
+    def bootstrapEigenspectra(self, ncomp=5, nboot=200, method='bootstrap',
+                              percentiles=(16, 50, 84), seed=0, n_jobs=-1):
+        """
+        Estimates the uncertainty of the eigenspectra and of evals_cs by
+        refitting the PCA on resampled datasets. Resampling is done at the
+        SN level, so all spectra of a SN are drawn or left out together.
+        The replicates are refit in a pool of worker processes, and each
+        replicate draws from its own seed so that the results only depend
+        on seed. Replicate eigenspectra are signed to match self.evecs
+        before percentiles are taken. The replicates are stored in
+        self.bootEvecs and self.bootEvalsCs.
+
+        Parameters
+        ----------
+        ncomp : int
+            Number of eigenspectra.
+        nboot : int
+            Number of bootstrap replicates. Ignored for the jackknife,
+            which leaves out every SN once.
+        method : string
+            'bootstrap' or 'jackknife'. Jackknife replicates are spread
+            about their mean by sqrt(nSN - 1) before taking percentiles,
+            so the bands have the width of the jackknife error.
+        percentiles : tuple
+        seed : int
+        n_jobs : int
+            Number of worker processes, see SNIDdataset.numWorkers.
+
+        Returns
+        -------
+        evecsBands : np.array
+            (len(percentiles), ncomp, nwvlbins) eigenspectra percentiles
+        evalsCsBands : np.array
+            (len(percentiles), ncomp) evals_cs percentiles
+
+        """
+        if method not in ('bootstrap', 'jackknife'):
+            raise ValueError("method must be 'bootstrap' or 'jackknife'")
+        if not hasattr(self, 'evecs'):
+            self.snidPCA()
+
+        snnames = np.array(self.pcaNames)
+        groups = [np.where(snnames == snname)[0] for snname in np.unique(snnames)]
+        if method == 'jackknife':
+            nboot = len(groups)
+
+        nblocks = max(1, min(snid.numWorkers(n_jobs), nboot))
+        tasks = [(self.specMatrix, groups, block, ncomp, method, seed, self.evecs[:ncomp])
+                 for block in np.array_split(np.arange(nboot), nblocks)]
+        results = snid.parallelMap(_fitResamples, tasks, n_jobs=n_jobs)
+        self.bootEvecs = np.concatenate([res[0] for res in results])
+        self.bootEvalsCs = np.concatenate([res[1] for res in results])
+
+        bootEvecs = self.bootEvecs
+        bootEvalsCs = self.bootEvalsCs
+        if method == 'jackknife':
+            scale = np.sqrt(nboot - 1.0)
+            bootEvecs = bootEvecs.mean(axis=0) + scale * (bootEvecs - bootEvecs.mean(axis=0))
+            bootEvalsCs = bootEvalsCs.mean(axis=0) + scale * (bootEvalsCs - bootEvalsCs.mean(axis=0))
+        evecsBands = np.percentile(bootEvecs, percentiles, axis=0)
+        evalsCsBands = np.percentile(bootEvalsCs, percentiles, axis=0)
+        return evecsBands, evalsCsBands
+
     def calcPCACoeffs(self):
         """
         Calculates the pca coefficients for all spectra and stores
@@ -239,9 +738,287 @@ class SNePCA:
             snobj.pcaCoeffs = self.pcaCoeffMatrix[i,:]
         return
 
+    def leaveOneOutCoeffs(self, ncomp=5):
+        """
+        Calculates held out pca coefficients for every spectrum in
+        self.specMatrix, where the eigenspectra used for each spectrum are
+        fit without any spectra of its SN. Rather than refitting the PCA
+        once per SN, removing the m spectra of a SN is a rank m+1 downdate
+        of the scatter matrix that stays inside the row space of the full
+        decomposition. The downdated eigenproblems are solved there in one
+        stacked call. Held out eigenspectra are signed to match the
+        eigenspectra of the full dataset, and the coefficients follow the
+        convention of calcPCACoeffs. They are stored in
+        self.looCoeffMatrix.
 
+        Parameters
+        ----------
+        ncomp : int
+            Number of eigenspectra.
 
+        Returns
+        -------
+        looCoeffMatrix : np.array
+            (nspec, ncomp) held out coefficients
 
+        """
+        if not hasattr(self, 'evecs'):
+            self.snidPCA()
+        X = self.specMatrix
+        nspec = len(X)
+        datasetMean = np.mean(X, axis=0)
+        _, sv, vt = np.linalg.svd(X - datasetMean, full_matrices=False)
+        scores = np.dot(X - datasetMean, vt.T)
+        fullEvecs = self.evecs[:ncomp]
+
+        snnames = np.array(self.pcaNames)
+        groups = [np.where(snnames == snname)[0] for snname in np.unique(snnames)]
+        downdated = np.empty((len(groups), len(sv), len(sv)))
+        for i, rows in enumerate(groups):
+            m = len(rows)
+            G = scores[rows]
+            g = np.mean(G, axis=0)
+            downdated[i] = np.diag(sv**2) - np.dot(G.T, G) - (m**2 / float(nspec - m)) * np.outer(g, g)
+
+        _, W = np.linalg.eigh(downdated)
+        W = W[:,:,::-1][:,:,:ncomp]
+        looCoeffMatrix = np.empty((nspec, ncomp))
+        for i, rows in enumerate(groups):
+            evecs = np.dot(W[i].T, vt)
+            dots = np.sum(evecs * fullEvecs, axis=1)
+            evecs = evecs * np.where(dots < 0, -1.0, 1.0)[:,None]
+            looCoeffMatrix[rows] = np.dot(X[rows], evecs.T)
+        self.looCoeffMatrix = looCoeffMatrix
+        return looCoeffMatrix
+
+    def templateIndex(self, ncomp=5, cachedir=None):
+        """
+        Returns a TemplateIndex over the first ncomp PCA coefficients of
+        the library spectra. If cachedir is given the index is pickled
+        there, keyed by the dataset contents and the coefficients, and
+        loaded instead of rebuilt on later calls.
+
+        Parameters
+        ----------
+        ncomp : int
+        cachedir : string
+            Directory for the on disk cache. No caching if None.
+
+        Returns
+        -------
+        index : TemplateIndex
+
+        """
+        coeffs = np.ascontiguousarray(self.pcaCoeffMatrix[:,:ncomp])
+        path = None
+        if cachedir is not None:
+            key = snid.cacheKey(snid.datasetHash(self.snidset), hashlib.sha1(coeffs.tobytes()).hexdigest())
+            path = os.path.join(cachedir, 'templateindex_%s.pickle'%(key))
+            if os.path.exists(path):
+                return snid.loadPickle(path)
+
+        _, _, _, phases = snid.datasetSpecMatrix(self.snidset)
+        types = np.array([self.snidset[snname].type for snname in self.pcaNames])
+        index = TemplateIndex(coeffs, self.pcaNames, phases, types, list(range(1, ncomp + 1)))
+        if path is not None:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            index.save(path)
+        return index
+
+    def anomalyScorer(self, ncomp=5, alpha=0.01, method='empirical'):
+        """
+        Builds a SNeStreamPCA.AnomalyScorer for Q (reconstruction residual)
+        and Hotelling T^2 scoring with the first ncomp eigenspectra, with
+        thresholds calibrated on self.specMatrix.
+
+        Parameters
+        ----------
+        ncomp : int
+        alpha : float
+            expected fraction of normal spectra above each threshold.
+        method : string
+            'empirical' or 'parametric', see AnomalyScorer.calibrate.
+
+        Returns
+        -------
+        scorer : AnomalyScorer
+
+        """
+        datasetMean = np.mean(self.specMatrix, axis=0)
+        nspec = len(self.specMatrix)
+        variances = np.linalg.svd(self.specMatrix - datasetMean, compute_uv=False)**2 / (nspec - 1)
+        scorer = SNeStreamPCA.AnomalyScorer(datasetMean, self.evecs, variances, ncomp, nspec)
+        scorer.calibrate([self.specMatrix], alpha, method)
+        return scorer
+
+    def projectGappy(self, spectra, ncomp=None, uncertainties=None):
+        """
+        Calculates the pca coefficients of spectra with missing pixels by
+        masked, weighted least squares. NaN pixels (e.g. gaps flagged by
+        SNIDdataset.snidsetNAN) are treated as missing, so the spectra
+        do not need to go through SNIDdataset.interpGaps first. The spectra
+        are fit as the dataset mean plus ncomp eigenspectra over their
+        observed pixels, with all spectra solved at once as stacked
+        (ncomp, ncomp) systems (SESNClassifier.gappyFit). The coefficients
+        follow the convention of calcPCACoeffs, and for spectra without
+        gaps they are identical to np.dot(self.evecs[:ncomp], spectrum).
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes on self.wavelengths, NaN where missing.
+        ncomp : int
+            Number of eigenspectra to fit. Defaults to all.
+        uncertainties : np.array
+            (nspec, nwvlbins) flux uncertainties used as inverse variance
+            weights. Pixels are weighted equally if None.
+
+        Returns
+        -------
+        pcaCoeffs : np.array
+            (nspec, ncomp) coefficients. Rows of spectra with fewer
+            observed pixels than ncomp are NaN.
+        coverage : np.array
+            fraction of observed pixels in each spectrum.
+
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        if ncomp is None:
+            ncomp = len(self.evecs)
+        evecs = self.evecs[:ncomp]
+        datasetMean = np.mean(self.specMatrix, axis=0)
+
+        weights = None
+        if uncertainties is not None:
+            uncertainties = np.atleast_2d(np.asarray(uncertainties, dtype=float))
+            observed = np.isfinite(uncertainties) & (uncertainties > 0)
+            weights = np.zeros(spectra.shape)
+            weights[observed] = 1.0 / uncertainties[observed]**2
+        pcaCoeffs, nobs = SESNClassifier.gappyFit(spectra, datasetMean, evecs, weights)
+        pcaCoeffs = pcaCoeffs + np.dot(evecs, datasetMean)
+        return pcaCoeffs, nobs / float(spectra.shape[1])
+
+    def projectShifted(self, spectra, ncomp=5, maxShift=10, offset=0, noise=None, prior=None, nbasis=None):
+        """
+        Calculates the pca coefficients of spectra for every pixel shift in
+        -maxShift..maxShift at once. On the SNID log wavelength grid a small
+        redshift error is a pixel shift, so instead of assuming a perfect
+        redshift the coefficients are marginalized over the shifts. The
+        coefficients at all shifts come from FFT correlations of the spectra
+        with the eigenspectra (SESNClassifier.shiftCorrelate). The shifts
+        are weighted (SESNClassifier.shiftWeights) by the residual of each
+        spectrum off the dataset mean plus nbasis eigenspectra, fit to the
+        pixels observed at each shift, with every pixel of
+        self.wavelengths left uncovered charged the mean per pixel variance
+        of self.specMatrix (SESNClassifier.shiftResiduals). Pixels shifted
+        in from outside the spectra, or NaN, are not observed, so spectra
+        on a wider range of the grid than self.wavelengths (see offset)
+        make the most of the larger shifts. Library spectra, and injected
+        shifts of them, are recovered; for spectra the basis fits
+        less well the weights are broader. A positive shift means the
+        spectrum is redder than
+        assumed. The coefficients follow the convention of calcPCACoeffs,
+        so at zero shift they are np.dot(self.evecs[:ncomp], spectrum).
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, npix) fluxes on the log wavelength grid of
+            self.wavelengths.
+        ncomp : int
+        maxShift : int
+        offset : int
+            pixel of the spectra at self.wavelengths[0], for spectra on a
+            wider range of the same grid.
+        noise : float or np.array
+            per pixel flux noise. Estimated from the best fit of each
+            spectrum if None.
+        prior : np.array
+            (2 * maxShift + 1,) prior of the shifts. Uniform if None.
+        nbasis : int
+            number of eigenspectra in the residual that weights the shifts.
+            Defaults to those explaining 99% of the variance.
+
+        Returns
+        -------
+        result : dict
+            'shifts' (nshifts,), 'coeffsByShift' (nspec, nshifts, ncomp),
+            'residuals' and 'weights' (nspec, nshifts), 'bestShift',
+            'bestCoeffs' at the best shift, 'coeffs' and 'coeffStd', the
+            weighted mean and standard deviation over the shifts, and
+            'dz', the redshift error 10**(bestShift * dwlog) - 1.
+
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=float))
+        evecs = self.evecs[:ncomp]
+        if nbasis is None:
+            nbasis = int(np.searchsorted(self.evals_cs, 0.99)) + 1
+        basis = self.evecs[:nbasis]
+        datasetMean = np.mean(self.specMatrix, axis=0)
+        shifts = np.arange(-maxShift, maxShift + 1)
+        nwvl = len(evecs[0])
+
+        coeffsByShift = SESNClassifier.shiftCorrelate(spectra, evecs, shifts, offset).transpose(0, 2, 1)
+        penalty = np.mean(np.var(self.specMatrix, axis=0))
+        residuals, _ = SESNClassifier.shiftResiduals(spectra, datasetMean, basis, shifts, offset, penalty)
+        weights, _ = SESNClassifier.shiftWeights(residuals, np.repeat(nwvl - len(basis), len(spectra)), noise, prior)
+
+        best = np.argmax(weights, axis=1)
+        coeffs = np.sum(weights[:,:,None] * coeffsByShift, axis=1)
+        coeffStd = np.sqrt(np.sum(weights[:,:,None] * (coeffsByShift - coeffs[:,None,:])**2, axis=1))
+        dwlog = np.log10(self.wavelengths[1] / self.wavelengths[0])
+        return {'shifts':shifts, 'coeffsByShift':coeffsByShift, 'residuals':residuals, 'weights':weights,
+                'bestShift':shifts[best], 'bestCoeffs':coeffsByShift[np.arange(len(spectra)), best],
+                'coeffs':coeffs, 'coeffStd':coeffStd, 'dz':np.power(10, shifts[best] * dwlog) - 1}
+
+    def reconstructionErrors(self, ncomp=None, perPixel=False):
+        """
+        Calculates the reconstruction residuals of every spectrum in
+        self.specMatrix for k = 0..ncomp eigenspectra in one pass. The
+        k = 0 reconstruction is the dataset mean. Instead of performing
+        a separate reconstruction for each k, the projected components
+        are accumulated with cumulative sums.
+
+        Parameters
+        ----------
+        ncomp : int
+            Maximum number of eigenspectra to include. Defaults to all
+            eigenspectra in self.evecs.
+        perPixel : Boolean
+            Also returns the per-pixel residuals if True.
+
+        Returns
+        -------
+        resNorm : np.array
+            (nspec, ncomp+1) array of residual norms, where resNorm[i,k]
+            is the norm of spectrum i minus its k component reconstruction.
+        residuals : np.array
+            (nspec, ncomp+1, nwvlbins) array of per-pixel residuals. Only
+            returned if perPixel is True.
+
+        """
+        if ncomp is None:
+            ncomp = len(self.evecs)
+        evecs = self.evecs[:ncomp]
+        datasetMean = np.mean(self.specMatrix, axis=0)
+        centered = self.specMatrix - datasetMean
+        pcaCoeff = np.dot(centered, evecs.T)
+
+        # The eigenspectra are orthonormal, so the squared residual norm
+        # drops by pcaCoeff**2 for every component added.
+        sqnorm = np.sum(centered**2, axis=1)
+        cumCoeff = np.cumsum(pcaCoeff**2, axis=1)
+        sqres = sqnorm[:,None] - np.column_stack((np.zeros(len(sqnorm)), cumCoeff))
+        resNorm = np.sqrt(np.clip(sqres, 0, None))
+        if not perPixel:
+            return resNorm
+
+        components = pcaCoeff[:,:,None] * evecs[None,:,:]
+        residuals = np.empty((len(centered), ncomp + 1, centered.shape[1]))
+        residuals[:,0,:] = centered
+        residuals[:,1:,:] = centered[:,None,:] - np.cumsum(components, axis=1)
+        return resNorm, residuals
 
 
     def reconstructSpectrumGrid(self, figsize, snname, phasekey,
@@ -529,7 +1306,8 @@ class SNePCA:
 
     def pcaPlot(self, pcax, pcay, figsize, alphamean, alphaell, alphasvm,
                 purity=False, excludeSNe=[], std_rad=None, svm=False,
-                fig=None, ax=None, count=1, svmsc=[], ncv=10, markOutliers=False):
+                fig=None, ax=None, count=1, svmsc=[], ncv=10, markOutliers=False,
+                seed=None, n_jobs=None, groupSNe=False, stratify=False):
         """
 
         Parameters
@@ -552,7 +1330,12 @@ class SNePCA:
         std_rad : float
             putiry within std_rad number of radii
         svm : Boolean
-            Plots SVM regions if True
+            Plots SVM regions if True. The models of all CV splits are
+            kept in self.svmEnsemble, a SESNClassifier.SVMEnsemble, and
+            the per-type precision, recall and confusion matrix of their
+            test predictions with bootstrap intervals in self.svmMetrics,
+            see SNeCV.bootstrapMetrics (types 1 to 4 are IIb, Ib, Ic and
+            IcBL).
         fig : plt.figure
         ax : figure axis
         count : int
@@ -562,6 +1345,15 @@ class SNePCA:
             Number of cross validation runs
         markOutliers : Boolean
             Marks outliers if True
+        seed : int
+            Seed for the cross validation splits, see
+            SNeCV.cross_validate_svm. None gives unseeded splits.
+        n_jobs : int
+            Number of worker processes for the cross validation.
+        groupSNe : Boolean
+            Keeps all spectra of a SN on the same side of every split.
+        stratify : Boolean
+            Keeps the type fractions in every test set.
 
         Returns
         -------
@@ -591,165 +1383,52 @@ class SNePCA:
         x = self.pcaCoeffMatrix[:,pcax-1]
         y = self.pcaCoeffMatrix[:,pcay-1]
 
-        #centroids
-        nameMask = self.getSNeNameMask(excludeSNe)
-        #print(np.array(list(self.snidset.keys()))[nameMask])
-        #print('IIb')
-        IIbxmean = np.mean(x[np.logical_and(IIbMask, nameMask)])
-        IIbymean = np.mean(y[np.logical_and(IIbMask, nameMask)])
-        #print('IIb - x: ',x[np.logical_and(IIbMask, nameMask)])
-        #print('IIb - y: ',y[np.logical_and(IIbMask, nameMask)])
-        #print('mean = ',(IIbxmean, IIbymean))
-
-        #print('Ib')
-        Ibxmean = np.mean(x[np.logical_and(IbMask, nameMask)])
-        #print(x[np.logical_and(IbMask, nameMask)].shape)
-        #print(x[IbMask].shape)
-        Ibymean = np.mean(y[np.logical_and(IbMask, nameMask)])
-        #print('Ib - x: ',x[np.logical_and(IbMask, nameMask)])
-        #print('Ib - y: ',y[np.logical_and(IbMask, nameMask)])
-        #print('mean = ',(Ibxmean, Ibymean))
-
-        #print('Ic')
-        Icxmean = np.mean(x[np.logical_and(IcMask, nameMask)])
-        Icymean = np.mean(y[np.logical_and(IcMask, nameMask)])
-        #print('Ic - x: ',x[np.logical_and(IcMask, nameMask)])
-        #print('Ic - y: ',y[np.logical_and(IcMask, nameMask)])
-        #print("mask mean: ",Ibxmean, Ibymean)
-        #print("no mask mean: ", np.mean(x[IbMask]), np.mean(y[IbMask]))
-        #print('mean = ',(Icxmean, Icymean))
-
-        #print('IcBL')
-        #print('IcBL - x: ',x[np.logical_and(IcBLMask, nameMask)])
-        #print('IcBL - y: ',y[np.logical_and(IcBLMask, nameMask)])
-        IcBLxmean = np.mean(x[np.logical_and(IcBLMask, nameMask)])
-        IcBLymean = np.mean(y[np.logical_and(IcBLMask, nameMask)])
-        #print('mean = ',(IcBLxmean, IcBLymean))
-
-
         if svm:
             truth = 1*IIbMask + 2*IbMask + 3*IcMask + 4*IcBLMask
             dat = np.column_stack((x,y))
-            linsvm = LinearSVC()
-
-            ncv_scores=[]
-            for i in range(ncv):
-                trainX, testX, trainY, testY = train_test_split(dat, truth, test_size=0.3)
-                linsvm.fit(trainX, trainY)
-                score = linsvm.score(testX, testY)
-                ncv_scores.append(score)
-            
-                mesh_x, mesh_y = make_meshgrid(x, y, h=0.02)
-
-
-                Z = linsvm.predict(np.c_[mesh_x.ravel(), mesh_y.ravel()])
-
-                IIbZ = len(Z[Z==1])
-                IbZ = len(Z[Z==2])
-                IcZ = len(Z[Z==3])
-                IcBLZ = len(Z[Z==4])
-                colors = []
-                if IIbZ != 0:
-                    colors.append(self.IIb_color)
-                if IbZ != 0:
-                    colors.append(self.Ib_color)
-                if IcZ != 0:
-                    colors.append(self.Ic_color)
-                if IcBLZ != 0:
-                    colors.append(self.IcBL_color)
-                print(colors)
-                nbins = len(colors)
-                cmap_name = 'mymap'
-                cm = LinearSegmentedColormap.from_list(cmap_name, colors, N=nbins)
-                Z = Z.reshape(mesh_x.shape)
-                out = ax.contourf(mesh_x, mesh_y, Z, cmap=cm, alpha=0.2/alphasvm)
-                svmsc.append(score)
+            ncv_scores, avgsc, stdsc, models, self.svmMetrics = SNeCV.cross_validate_svm(
+                dat, truth, ncv=ncv, test_size=0.3, seed=seed, n_jobs=n_jobs,
+                groups=self.pcaNames if groupSNe else None, stratify=stratify, metrics=True)
+            svmsc.extend(ncv_scores)
+
+            # The regions of the ncv models are aggregated into one vote map.
+            # Each pixel shows the majority class at the opacity that ncv
+            # stacked layers of alpha 0.2/alphasvm would give it.
+            xlim = (x.min() - 3, x.max() + 3)
+            ylim = (y.min() - 3, y.max() + 3)
+            self.svmEnsemble = SESNClassifier.SVMEnsemble.fromModels(models)
+            _, _, votes = self.svmEnsemble.classify(np.empty((0, 2)), xlim, ylim, npix=300)
+            classes = self.svmEnsemble.classes
+            colors = {1:self.IIb_color, 2:self.Ib_color, 3:self.Ic_color, 4:self.IcBL_color}
+            rgba = np.zeros(votes.shape[:2] + (4,))
+            winner = np.argmax(votes, axis=2)
+            for ind, tp in enumerate(classes):
+                if tp in colors:
+                    rgba[winner == ind, :3] = matplotlib.colors.to_rgb(colors[tp])
+            layerAlpha = min(0.2/alphasvm, 1.0)
+            nvotes = np.max(votes, axis=2)
+            rgba[:,:,3] = np.where(np.isin(classes[winner], list(colors)), 1.0 - (1.0 - layerAlpha)**nvotes, 0.0)
+            out = ax.imshow(rgba, extent=(xlim[0], xlim[1], ylim[0], ylim[1]), origin='lower',
+                            aspect='auto', interpolation='nearest')
+        if purity or markOutliers:
+            regions, result = self.typeRegions([pcax, pcay], std_rad, radius='std', excludeSNe=excludeSNe)
+            typeNames, truth = self.typeTruth()
+            outliers = result['outliers']
         if purity:
-            nameMask = self.getSNeNameMask(excludeSNe)
-            #print('rad namemask: ',nameMask)
-            IIb_rad_x = np.std(x[np.logical_and(IIbMask, nameMask)]) * std_rad
-            Ib_rad_x = np.std(x[np.logical_and(IbMask, nameMask)]) * std_rad
-            Ic_rad_x = np.std(x[np.logical_and(IcMask, nameMask)]) * std_rad
-            IcBL_rad_x = np.std(x[np.logical_and(IcBLMask, nameMask)]) * std_rad
-
-            IIb_rad_y = np.std(y[np.logical_and(IIbMask, nameMask)]) * std_rad
-            Ib_rad_y = np.std(y[np.logical_and(IbMask, nameMask)]) * std_rad
-            Ic_rad_y = np.std(y[np.logical_and(IcMask, nameMask)]) * std_rad
-            IcBL_rad_y = np.std(y[np.logical_and(IcBLMask, nameMask)]) * std_rad
-
-
-
-            #print('IIb radx, rady',(IIb_rad_x, IIb_rad_y))
-            #print('Ib radx, rady',(Ib_rad_x, Ib_rad_y))
-            #print('Ic radx, rady',(Ic_rad_x, Ic_rad_y))
-            #print('IcBL radx, rady',(IcBL_rad_x, IcBL_rad_y))
-
-
-            #print("rad mask: ",Ib_rad_x, Ib_rad_y)
-            #print("rad all: ",np.std(x[IbMask]), np.std(y[IbMask]))
-           # print('names all: ',np.array(list(self.snidset.keys()))[IbMask])
-
-            #names = np.array(list(self.snidset.keys()))
-            names = self.pcaNames
-            IIbnames = names[IIbMask]
-            dist_x = np.power(x[IIbMask] - IIbxmean, 2)/np.power(2*IIb_rad_x, 2)
-            dist_y = np.power(y[IIbMask] - IIbymean, 2)/np.power(2*IIb_rad_y, 2)
-            IIb_outliers_mask = dist_x + dist_y >= 1
-            #print('IIb 2std outliers: ', IIbnames[outliers_mask])
-            #IIb_out_only_mask = np.logical_and(np.logical_not(self.getSNeNameMask(IIbnames[outliers_mask])), IIbMask)
-            #IIb_no_out_mask = np.logical_and(self.getSNeNameMask(IIbnames[outliers_mask]), IIbMask)
-
-            Ibnames = names[IbMask]
-            dist_x = np.power(x[IbMask] - Ibxmean, 2)/np.power(2*Ib_rad_x, 2)
-            dist_y = np.power(y[IbMask] - Ibymean, 2)/np.power(2*Ib_rad_y, 2)
-            Ib_outliers_mask = dist_x + dist_y >= 1
-            #print('Ib 2std outliers: ', Ibnames[outliers_mask])
-            #Ib_out_only_mask = np.logical_and(np.logical_not(self.getSNeNameMask(Ibnames[outliers_mask])), IbMask)
-            #Ib_no_out_mask = np.logical_and(self.getSNeNameMask(Ibnames[outliers_mask]), IbMask)
-           
-            Icnames = names[IcMask]
-            dist_x = np.power(x[IcMask] - Icxmean, 2)/np.power(2*Ic_rad_x, 2)
-            dist_y = np.power(y[IcMask] - Icymean, 2)/np.power(2*Ic_rad_y, 2)
-            Ic_outliers_mask = dist_x + dist_y >= 1
-            #print('Ic 2std outliers: ', Icnames[outliers_mask])
-            #Ic_out_only_mask = np.logical_and(np.logical_not(self.getSNeNameMask(Icnames[outliers_mask])), IcMask)
-            #Ic_no_out_mask = np.logical_and(self.getSNeNameMask(Icnames[outliers_mask]), IcMask)
-
-            IcBLnames = names[IcBLMask]
-            dist_x = np.power(x[IcBLMask] - IcBLxmean, 2)/np.power(2*IcBL_rad_x, 2)
-            dist_y = np.power(y[IcBLMask] - IcBLymean, 2)/np.power(2*IcBL_rad_y, 2)
-            IcBL_outliers_mask = dist_x + dist_y >= 1
-            #print('IcBL 2std outliers: ', IcBLnames[outliers_mask])
-            #IcBL_out_only_mask = np.logical_and(np.logical_not(self.getSNeNameMask(IcBLnames[outliers_mask])), IcBLMask)
-            #IcBL_no_out_mask = np.logical_and(self.getSNeNameMask(IcBLnames[outliers_mask]), IcBLMask)
-
-
-            ellipse_IIb = mpatches.Ellipse((IIbxmean, IIbymean),2*IIb_rad_x,2*IIb_rad_y, \
-                                            color=self.IIb_ellipse_color, alpha=0.1/alphaell, fill=False, edgecolor=self.IIb_color, linewidth=4.0)
-            ellipse_Ib = mpatches.Ellipse((Ibxmean, Ibymean),2*Ib_rad_x,2*Ib_rad_y, color=self.Ib_color,\
-                                           alpha=0.1/alphaell, fill=False, edgecolor=self.Ib_color, linewidth=4.0)
-            ellipse_Ic = mpatches.Ellipse((Icxmean, Icymean),2*Ic_rad_x,2*Ic_rad_y, color=self.Ic_color,\
-                                           alpha=0.1/alphaell, fill=False, edgecolor=self.Ic_color, linewidth=4.0)
-            ellipse_IcBL = mpatches.Ellipse((IcBLxmean, IcBLymean),2*IcBL_rad_x,2*IcBL_rad_y, color=self.IcBL_ellipse_color,\
-                                             alpha=0.1/alphaell,fill=False, edgecolor=self.IcBL_color, linewidth=4.0)
-            ax.add_patch(ellipse_IIb)
-            ax.add_patch(ellipse_Ib)
-            ax.add_patch(ellipse_Ic)
-            ax.add_patch(ellipse_IcBL)
+            ellipseColors = [self.IIb_ellipse_color, self.Ib_color, self.Ic_color, self.IcBL_ellipse_color]
+            edgeColors = [self.IIb_color, self.Ib_color, self.Ic_color, self.IcBL_color]
+            for centroid, rad, c, ec in zip(regions.centroids, regions.radii, ellipseColors, edgeColors):
+                ellipse = mpatches.Ellipse(centroid, 2*rad[0], 2*rad[1], color=c, alpha=0.1/alphaell,
+                                           fill=False, edgecolor=ec, linewidth=4.0)
+                ax.add_patch(ellipse)
 
         if markOutliers:
-
-            ax.scatter(x[IIbMask][np.logical_not(IIb_outliers_mask)], y[IIbMask][np.logical_not(IIb_outliers_mask)], color=self.IIb_color, edgecolors='k',s=200,alpha=1,linewidth=2.0)
-            ax.scatter(x[IbMask][np.logical_not(Ib_outliers_mask)], y[IbMask][np.logical_not(Ib_outliers_mask)], color=self.Ib_color, edgecolors='k',s=200,alpha=1, linewidth=2.0)
-            ax.scatter(x[IcMask][np.logical_not(Ic_outliers_mask)], y[IcMask][np.logical_not(Ic_outliers_mask)], color=self.Ic_color, edgecolors='k',s=200,alpha=1, linewidth=2.0)
-            ax.scatter(x[IcBLMask][np.logical_not(IcBL_outliers_mask)], y[IcBLMask][np.logical_not(IcBL_outliers_mask)], color=self.IcBL_color, edgecolors='k',s=200,alpha=1, linewidth=2.0)
-
-
-            ax.scatter(x[IIbMask][IIb_outliers_mask], y[IIbMask][IIb_outliers_mask], color=self.IIb_color, edgecolors='k',s=400,alpha=1,linewidth=2.0, marker='*')
-            ax.scatter(x[IbMask][Ib_outliers_mask], y[IbMask][Ib_outliers_mask], color=self.Ib_color, edgecolors='k',s=400,alpha=1, linewidth=2.0, marker='*')
-            ax.scatter(x[IcMask][Ic_outliers_mask], y[IcMask][Ic_outliers_mask], color=self.Ic_color, edgecolors='k',s=400,alpha=1, linewidth=2.0, marker='*')
-            ax.scatter(x[IcBLMask][IcBL_outliers_mask], y[IcBLMask][IcBL_outliers_mask], color=self.IcBL_color, edgecolors='k',s=400,alpha=1, linewidth=2.0, marker='*')
-
+            for i, c in enumerate([self.IIb_color, self.Ib_color, self.Ic_color, self.IcBL_color]):
+                msk = truth == i
+                ax.scatter(x[msk & np.logical_not(outliers)], y[msk & np.logical_not(outliers)], color=c,
+                           edgecolors='k', s=200, alpha=1, linewidth=2.0)
+                ax.scatter(x[msk & outliers], y[msk & outliers], color=c, edgecolors='k', s=400, alpha=1,
+                           linewidth=2.0, marker='*')
         else:
             ax.scatter(x[IIbMask], y[IIbMask], color=self.IIb_color, edgecolors='k',s=200,alpha=1,linewidth=2.0)
             ax.scatter(x[IbMask], y[IbMask], color=self.Ib_color, edgecolors='k',s=200,alpha=1, linewidth=2.0)
@@ -762,8 +1441,6 @@ class SNePCA:
         ax.set_ylabel('PCA Comp %d'%(pcay),fontsize=20)
         ax.set_xlabel('PCA Comp %d'%(pcax), fontsize=20)
         if svm:
-            avgsc = np.mean(np.array(ncv_scores))
-            stdsc = np.std(np.array(ncv_scores))
             ax.legend(handles=[Ic_patch, IcBL_patch, IIb_patch, Ib_patch],\
                             title='SVM Test Score = %.2f'%(avgsc), loc='upper right', ncol=1,fancybox=True, prop={'size':30},fontsize=30)
         else:
@@ -779,46 +1456,93 @@ class SNePCA:
 
 
 
+    def typeTruth(self):
+        """
+        Returns
+        -------
+        typeNames : list
+            the 4 major SESN types, in the order of getSNeTypeMasks.
+        truth : np.array
+            index into typeNames of the type of every spectrum, -1 for
+            other types.
+
+        """
+        masks = self.getSNeTypeMasks()
+        truth = -1 * np.ones(len(self.pcaNames), dtype=int)
+        for i, msk in enumerate(masks):
+            truth[msk] = i
+        return ['IIb', 'Ib', 'Ic', 'IcBL'], truth
+
+    def typeRegions(self, components, std_rad=1.0, radius='std', excludeSNe=[], outlierRadius=2.0):
+        """
+        Calculates the regions of the 4 major SESN types for any set of
+        PCA components in one vectorized pass, and scores all spectra
+        against them.
+
+        Parameters
+        ----------
+        components : list
+            eigenspectrum numbers (starting at 1).
+        std_rad : float
+            region size in units of the radius below.
+        radius : string
+            'std' -- ellipse with radii std_rad standard deviations, as
+            drawn by pcaPlot.
+            'purity' -- ellipse with radii of the mean plus std_rad
+            standard deviations of the absolute distances from the
+            centroid, as used by purityEllipse.
+            'mahalanobis' -- Mahalanobis distance with the type covariance,
+            scaled by std_rad**2.
+        excludeSNe : list
+            SNe not used for the centroids and radii.
+        outlierRadius : float
+            see TypeRegions.evaluate. pcaPlot marks spectra outside twice
+            the drawn ellipse.
+
+        Returns
+        -------
+        regions : TypeRegions
+        result : dict
+            see TypeRegions.evaluate.
+
+        """
+        typeNames, truth = self.typeTruth()
+        coeffs = self.pcaCoeffMatrix[:,np.array(components) - 1]
+        use = self.getSNeNameMask(excludeSNe)
+        members = [coeffs[(truth == i) & use] for i in range(len(typeNames))]
+        centroids = np.array([np.mean(mem, axis=0) for mem in members])
+
+        if radius == 'mahalanobis':
+            covariances = np.array([np.atleast_2d(np.cov(mem, rowvar=False)) for mem in members]) * std_rad**2
+            regions = TypeRegions(typeNames, components, centroids, covariances=covariances)
+        elif radius == 'purity':
+            absdist = [np.abs(mem - c) for mem, c in zip(members, centroids)]
+            radii = np.array([np.mean(d, axis=0) + std_rad * np.std(d, axis=0) for d in absdist])
+            regions = TypeRegions(typeNames, components, centroids, radii=radii)
+        elif radius == 'std':
+            radii = np.array([np.std(mem, axis=0) for mem in members]) * std_rad
+            regions = TypeRegions(typeNames, components, centroids, radii=radii)
+        else:
+            raise ValueError("radius must be 'std', 'purity' or 'mahalanobis'")
+        return regions, regions.evaluate(coeffs, truth, outlierRadius)
+
     def purityEllipse(self, std_rad, ncomp_array):
         """
-        Calculates the purity of the SESN regions
+        Returns the spread of the SESN types. The purity and completeness
+        of the regions are calculated by typeRegions(radius='purity').
 
         Returns
         -------
+        keys : list
+            SN types
+        purity_rad_arr : list
+            standard deviations of the coefficients of each type.
 
         """
-        ncomp_array = np.array(ncomp_array) - 1
-        IIbMask, IbMask, IcMask, IcBLMask = self.getSNeTypeMasks()
-        maskDict = {'IIb':IIbMask, 'Ib':IbMask, 'IcBL':IcBLMask, 'Ic':IcMask}
+        typeNames, truth = self.typeTruth()
+        coeffs = self.pcaCoeffMatrix[:,np.array(ncomp_array) - 1]
         keys = ['IIb', 'Ib', 'IcBL', 'Ic']
-        masks = [IIbMask, IbMask, IcBLMask, IcMask]
-        purity_rad_arr = []
-        for key,msk in zip(keys,masks):
-            centroid = np.mean(self.pcaCoeffMatrix[:,ncomp_array][msk], axis=0)
-            std = np.std(self.pcaCoeffMatrix[:,ncomp_array][msk], axis=0)
-            print('centroid', centroid)
-            dist_from_centroid = np.abs(self.pcaCoeffMatrix[:,ncomp_array][msk] - centroid)
-            mean_dist_from_centroid = np.mean(dist_from_centroid, axis=0)
-            print('mean dist from centroid: ', mean_dist_from_centroid)
-            std_dist_all_components = np.std(dist_from_centroid, axis=0)
-            print('std dist from centroid: ', std_dist_all_components)
-            purity_rad_all = mean_dist_from_centroid + std_rad * std_dist_all_components
-            print('purity rad all components: ', purity_rad_all)
-            purity_rad_arr.append(std)
-
-
-            ellipse_cond = np.sum(np.power((self.pcaCoeffMatrix[:,ncomp_array] - centroid), 2)/\
-                                  np.power(purity_rad_all, 2), axis=1)
-            print('ellipse condition: ', ellipse_cond)
-            purity_msk = ellipse_cond < 1
-
-            print(key)
-            print('purity radius: ', purity_rad_all)
-            print('# of SNe within purity ellipse for type '+key+': ',np.sum(purity_msk))
-            names_within_purity_rad = self.pcaNames[purity_msk]
-            correct_names = self.pcaNames[msk]
-            correct_msk = np.isin(names_within_purity_rad, correct_names)
-            print('# of correct SNe '+key+': ', np.sum(correct_msk))
+        purity_rad_arr = [np.std(coeffs[truth == typeNames.index(key)], axis=0) for key in keys]
         return keys, purity_rad_arr
 
 
@@ -977,9 +1701,11 @@ class SNePCA:
         fig = go.Figure(data=data, layout=layout)
         return fig
 
-    def cornerplotPCA(self, ncomp, figsize, svm=False, ncv=1):
+    def cornerplotPCA(self, ncomp, figsize, svm=False, ncv=1, seed=None, groupSNe=False, stratify=False):
         """
         Plots the 2D marginalizations of the PCA decomposition in a corner plot.
+        See SNeCV.pairwiseScoreTables for computing the SVM score tables
+        without plotting.
 
         Parameters
         ----------
@@ -990,6 +1716,13 @@ class SNePCA:
             Calculates SVM scores if True
         ncv : int
             Number of cross validation runs
+        seed : int
+            Seed for the cross validation splits. None gives unseeded
+            splits.
+        groupSNe : Boolean
+            Keeps all spectra of a SN on the same side of every split.
+        stratify : Boolean
+            Keeps the type fractions in every test set.
 
         Returns
         -------
@@ -1024,7 +1757,6 @@ class SNePCA:
             for j in range(ncomp):
                 if i > j:
                     plotNumber = ncomp * i + j + 1
-                    print(plotNumber)
                     plt.subplot(ncomp, ncomp, plotNumber)
                     y = self.pcaCoeffMatrix[:,i]
                     x = self.pcaCoeffMatrix[:,j]
@@ -1047,15 +1779,9 @@ class SNePCA:
                         truth = 1*IIbMask + 2*IbMask + 3*IcMask + 4*IcBLMask
                         dat = np.column_stack((x,y))
 
-                        ncv_scores=[]
-                        for cvit in range(ncv):
-                            trainX, testX, trainY, testY = train_test_split(dat, truth, test_size=0.3)
-                            linsvm = LinearSVC()
-                            linsvm.fit(trainX, trainY)
-                            score = linsvm.score(testX, testY)
-                            ncv_scores.append(score)
-                        score = np.mean(ncv_scores)
-                        std = np.std(ncv_scores)
+                        _, score, std, _ = SNeCV.cross_validate_svm(dat, truth, ncv=ncv, test_size=0.3, seed=seed,
+                                                                    groups=self.pcaNames if groupSNe else None,
+                                                                    stratify=stratify)
                         means_table[j,i] = score
                         means_table[i,j] = score
                         std_table[j,i] = std
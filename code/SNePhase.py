@@ -0,0 +1,469 @@
+import SNIDdataset as snid
+import SNePCA
+
+import numpy as np
+import os
+
+
+# Phase ranges from Williamson et al. (2019). Each entry is the pickled
+# dataset in Data/DataProducts and the (phasemin, phasemax) it covers.
+PHASE_WINDOWS = [('dataset0.pickle', -5, 5),
+                 ('dataset5.pickle', 0, 10),
+                 ('dataset10.pickle', 5, 15),
+                 ('dataset15.pickle', 10, 20)]
+
+
+def peakSigns(evecs):
+    """
+    Returns the signs that make the largest amplitude pixel of every
+    eigenspectrum positive. Used as the default sign convention for the
+    reference phase range, since the signs returned by the SVD depend
+    on the numpy/sklearn version.
+
+    Parameters
+    ----------
+    evecs : np.array
+        (ncomp, nwvlbins) eigenspectra
+
+    Returns
+    -------
+    signs : np.array
+
+    """
+    peaks = evecs[np.arange(len(evecs)), np.argmax(np.abs(evecs), axis=1)]
+    signs = np.where(peaks < 0, -1.0, 1.0)
+    return signs
+
+def featureSigns(evecs, wavelengths, refFeatures):
+    """
+    Returns the signs that make the mean of each eigenspectrum over a
+    reference wavelength range have the requested sign, e.g. so that
+    an eigenspectrum matches the H or He absorption in the mean spectra.
+
+    Parameters
+    ----------
+    evecs : np.array
+        (ncomp, nwvlbins) eigenspectra
+    wavelengths : np.array
+    refFeatures : dict
+        {component index: (wvlmin, wvlmax, sign)}. Components that are
+        not listed fall back to peakSigns.
+
+    Returns
+    -------
+    signs : np.array
+
+    """
+    signs = peakSigns(evecs)
+    for comp, (wvlmin, wvlmax, sgn) in refFeatures.items():
+        wvlmsk = np.logical_and(wavelengths >= wvlmin, wavelengths <= wvlmax)
+        featureMean = np.mean(evecs[comp][wvlmsk])
+        signs[comp] = 1.0 if featureMean * sgn >= 0 else -1.0
+    return signs
+
+def alignSigns(evecs, refEvecs):
+    """
+    Returns the signs that make each eigenspectrum point in the same
+    direction as the corresponding reference eigenspectrum.
+
+    Parameters
+    ----------
+    evecs : np.array
+        (ncomp, nwvlbins) eigenspectra to align
+    refEvecs : np.array
+        (ncomp_ref, nwvlbins) reference eigenspectra on the same wavelengths
+
+    Returns
+    -------
+    signs : np.array
+
+    """
+    n = min(len(evecs), len(refEvecs))
+    signs = np.ones(len(evecs))
+    dots = np.sum(evecs[:n] * refEvecs[:n], axis=1)
+    signs[:n] = np.where(dots < 0, -1.0, 1.0)
+    return signs
+
+def _fitWindow(pcaobj):
+    pcaobj.snidPCA()
+    return pcaobj.evecs, pcaobj.evals
+
+
+class PhaseBundle:
+    """
+    Fits SNePCA models for several phase ranges from a single load of the
+    pickled datasets, and chooses the arbitrary eigenspectra signs so that
+    they are consistent across phases.
+    """
+
+    def __init__(self, datadir, windows=PHASE_WINDOWS):
+        """
+        Parameters
+        ----------
+        datadir : string
+            directory containing the pickled datasets.
+        windows : list
+            list of (dataset filename, phasemin, phasemax) tuples.
+
+        """
+        self.datadir = datadir
+        self.windows = list(windows)
+        self.datasets = [snid.loadPickle(os.path.join(datadir, fname)) for fname, _, _ in self.windows]
+        self.pcas = [SNePCA.SNePCA(dataset, phmin, phmax) for dataset, (_, phmin, phmax)
+                     in zip(self.datasets, self.windows)]
+        self.signs = None
+        return
+
+    def __len__(self):
+        return len(self.pcas)
+
+    def __iter__(self):
+        return iter(self.pcas)
+
+    def __getitem__(self, ind):
+        return self.pcas[ind]
+
+    def cachePath(self, cachedir, reference, refFeatures, chain):
+        """
+        Returns the cache file path for the fit. The key combines the
+        content hash of every dataset with the phase ranges and the sign
+        alignment options.
+
+        """
+        hashes = tuple(snid.datasetHash(dataset) for dataset in self.datasets)
+        bounds = tuple((phmin, phmax) for _, phmin, phmax in self.windows)
+        features = None if refFeatures is None else tuple(sorted(refFeatures.items()))
+        key = snid.cacheKey(hashes, bounds, reference, features, chain)
+        return os.path.join(cachedir, 'phasebundle_%s.pickle'%(key))
+
+    def alignAll(self, evecsList, reference=0, refFeatures=None, chain=True):
+        """
+        Calculates the eigenspectra signs for every phase range.
+
+        Parameters
+        ----------
+        evecsList : list
+            eigenspectra of every phase range.
+        reference : int
+            index of the reference phase range.
+        refFeatures : dict
+            {component index: (wvlmin, wvlmax, sign)} sign convention for
+            the reference phase range. See featureSigns.
+        chain : Boolean
+            If True each phase range is aligned to its aligned neighbour
+            towards the reference, otherwise directly to the reference.
+
+        Returns
+        -------
+        signs : list
+            sign arrays for every phase range.
+
+        """
+        ref = evecsList[reference]
+        signs = [None] * len(evecsList)
+        if refFeatures is None:
+            signs[reference] = peakSigns(ref)
+        else:
+            signs[reference] = featureSigns(ref, self.pcas[reference].wavelengths, refFeatures)
+
+        order = list(range(reference + 1, len(evecsList))) + list(range(reference - 1, -1, -1))
+        for ind in order:
+            if chain:
+                nbr = ind - 1 if ind > reference else ind + 1
+            else:
+                nbr = reference
+            alignedNbr = evecsList[nbr] * signs[nbr][:,None]
+            signs[ind] = alignSigns(evecsList[ind], alignedNbr)
+        return signs
+
+    def fit(self, reference=0, refFeatures=None, chain=True, n_jobs=-1, cachedir=None):
+        """
+        Fits the PCA of every phase range in parallel, aligns the
+        eigenspectra signs and calculates the PCA coefficients. If cachedir
+        is given the aligned eigenspectra are memoized there, keyed by the
+        dataset contents, so later calls skip the fit.
+
+        Parameters
+        ----------
+        reference : int
+            index of the reference phase range for sign alignment.
+        refFeatures : dict
+            {component index: (wvlmin, wvlmax, sign)} sign convention for
+            the reference phase range.
+        chain : Boolean
+            Align each phase range to its neighbour if True, otherwise
+            to the reference directly.
+        n_jobs : int
+            Number of worker processes, -1 uses all cores.
+        cachedir : string
+            Directory for the on disk cache. No caching if None.
+
+        Returns
+        -------
+
+        """
+        path = None
+        if cachedir is not None:
+            path = self.cachePath(cachedir, reference, refFeatures, chain)
+        if path is not None and os.path.exists(path):
+            fits = snid.loadPickle(path)
+        else:
+            results = snid.parallelMap(_fitWindow, self.pcas, n_jobs=n_jobs)
+            evecsList = [evecs for evecs, _ in results]
+            signs = self.alignAll(evecsList, reference, refFeatures, chain)
+            fits = [(evecs * sgn[:,None], evals, sgn) for (evecs, evals), sgn in zip(results, signs)]
+            if path is not None:
+                if not os.path.isdir(cachedir):
+                    os.makedirs(cachedir)
+                snid.savePickle(path, fits)
+
+        self.signs = []
+        for pcaobj, (evecs, evals, sgn) in zip(self.pcas, fits):
+            pcaobj.evecs = evecs
+            pcaobj.evals = evals
+            pcaobj.evals_cs = evals.cumsum()
+            pcaobj.calcPCACoeffs()
+            self.signs.append(sgn)
+        return
+
+
+def windowSelection(names, phases, center, width, uniquePhase=True):
+    """
+    Returns the indices of the spectra that fall in the phase window
+    (center - width/2, center + width/2). If uniquePhase is True only the
+    spectrum closest to the window center is kept for each SN, matching
+    SNIDdataset.filterPhases with uniquePhaseFlag=True, except that the
+    chosen spectrum must lie inside the window.
+
+    Parameters
+    ----------
+    names : np.array
+        SN name of each spectrum
+    phases : np.array
+        phase of each spectrum
+    center : float
+    width : float
+    uniquePhase : Boolean
+
+    Returns
+    -------
+    rows : np.array
+        sorted indices of the selected spectra.
+
+    """
+    dist = np.abs(phases - center)
+    rows = np.where(dist < width/2.0)[0]
+    if uniquePhase and len(rows) > 0:
+        order = rows[np.lexsort((dist[rows], names[rows]))]
+        _, first = np.unique(names[order], return_index=True)
+        rows = np.sort(order[first])
+    return rows
+
+def _subspaceIteration(Xc, start, ncomp, maxiter, tol):
+    """
+    Right singular vectors of Xc by subspace iteration, warm started from
+    the rows of start. Converged when the relative eigen-residual of the top
+    ncomp Ritz vectors is below tol. Returns None if that does not happen
+    within maxiter iterations.
+
+    """
+    Q = np.linalg.qr(start.T)[0]
+    for it in range(maxiter):
+        # Rayleigh-Ritz step to rotate the subspace onto the singular vectors
+        _, sv, vt = np.linalg.svd(np.dot(Xc, Q), full_matrices=False)
+        ritz = np.dot(vt, Q.T)
+        top = ritz[:ncomp].T
+        resid = np.dot(Xc.T, np.dot(Xc, top)) - top * sv[:ncomp]**2
+        if np.all(np.linalg.norm(resid, axis=0) <= tol * sv[:ncomp]**2):
+            return ritz, sv
+        Q = np.linalg.qr(np.dot(Xc.T, np.dot(Xc, ritz.T)))[0]
+    return None
+
+def _fitWindowBlock(task):
+    """
+    Fits the PCA of a contiguous block of phase windows. The first window
+    is fit with a full SVD, and each following window is warm started from
+    the basis of its neighbour.
+
+    """
+    specMatrix, selections, ncomp, oversample, maxiter, tol = task
+    nwvl = specMatrix.shape[1]
+    evecs = np.nan * np.ones((len(selections), ncomp, nwvl))
+    evals = np.nan * np.ones((len(selections), ncomp))
+    means = np.nan * np.ones((len(selections), nwvl))
+    warm = np.zeros(len(selections), dtype=bool)
+
+    prev = None
+    for i, rows in enumerate(selections):
+        if len(rows) < 2:
+            prev = None
+            continue
+        X = specMatrix[rows]
+        mean = np.mean(X, axis=0)
+        Xc = X - mean
+        totvar = np.sum(Xc**2)
+        nvec = min(ncomp + oversample, len(rows) - 1, nwvl)
+        nkeep = min(ncomp, nvec)
+
+        fit = None
+        if prev is not None and len(prev) >= nvec:
+            fit = _subspaceIteration(Xc, prev[:nvec], nkeep, maxiter, tol)
+        if fit is None:
+            _, sv, vt = np.linalg.svd(Xc, full_matrices=False)
+            fit = vt[:nvec], sv[:nvec]
+        else:
+            warm[i] = True
+        basis, sv = fit
+        prev = basis
+
+        evecs[i,:nkeep] = basis[:nkeep]
+        evals[i,:nkeep] = sv[:nkeep]**2 / totvar
+        means[i] = mean
+    return evecs, evals, means, warm
+
+
+class PhaseStack:
+    """
+    Phase indexed stack of PCA fits on a grid of sliding phase windows,
+    returned by slidingWindowPCA.
+    """
+
+    def __init__(self, centers, width, wavelengths, evecs, evals, means, nspec, warm):
+        self.centers = centers
+        self.width = width
+        self.wavelengths = wavelengths
+        self.evecs = evecs
+        self.evals = evals
+        self.evals_cs = np.cumsum(evals, axis=1)
+        self.means = means
+        self.nspec = nspec
+        self.warm = warm
+        return
+
+    def windowIndex(self, phases):
+        """
+        Returns the index of the fitted window whose center is closest to
+        each phase. Windows with too few spectra to fit are skipped.
+
+        Parameters
+        ----------
+        phases : float or np.array
+
+        Returns
+        -------
+        inds : np.array
+
+        """
+        valid = np.where(np.isfinite(self.evals[:,0]))[0]
+        phases = np.atleast_1d(phases)
+        closest = np.argmin(np.abs(self.centers[valid][None,:] - phases[:,None]), axis=1)
+        return valid[closest]
+
+    def project(self, spectra, phases, ncomp=None):
+        """
+        Calculates the PCA coefficients of spectra using the eigenspectra of
+        the window closest to each spectrum's phase. As in
+        SNePCA.calcPCACoeffs the spectra are not mean subtracted.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes on self.wavelengths
+        phases : np.array
+            phase of each spectrum
+        ncomp : int
+            number of coefficients to return. Defaults to all.
+
+        Returns
+        -------
+        pcaCoeffs : np.array
+            (nspec, ncomp) coefficients
+
+        Raises
+        ------
+        ValueError
+            if a window used has fewer than ncomp eigenspectra, e.g. when
+            it holds fewer than ncomp+1 spectra.
+
+        """
+        spectra = np.atleast_2d(spectra)
+        inds = self.windowIndex(phases)
+        evecs = self.evecs[inds, :ncomp]
+        nfit = np.sum(np.isfinite(self.evals[inds, :ncomp]), axis=1)
+        short = nfit < evecs.shape[1]
+        if np.any(short):
+            raise ValueError('windows centered at %s have fewer than %d eigenspectra'
+                             % (np.unique(self.centers[inds[short]]), evecs.shape[1]))
+        return np.einsum('nkw,nw->nk', evecs, spectra)
+
+
+def slidingWindowPCA(dataset, phasemin, phasemax, step=2.0, width=10.0, ncomp=10,
+                     uniquePhase=True, oversample=5, maxiter=50, tol=1e-6, n_jobs=-1):
+    """
+    Fits PCA models on a grid of sliding phase windows in one job. The
+    spectra are collected into one matrix once and every window selects its
+    rows from it. The grid is split into contiguous blocks that are fit in
+    parallel. Inside a block each window is warm started from the basis of
+    its neighbour by subspace iteration, falling back to a full SVD if it
+    does not converge, and the eigenspectra signs are chained across the
+    whole grid.
+
+    Parameters
+    ----------
+    dataset : SNIDdataset object
+        preprocessed dataset containing spectra at all phases.
+    phasemin : float
+        center of the first window
+    phasemax : float
+        center of the last window
+    step : float
+        spacing between window centers (days)
+    width : float
+        full width of each window (days)
+    ncomp : int
+        number of eigenspectra kept per window
+    uniquePhase : Boolean
+        keep only the spectrum closest to the window center for each SN.
+    oversample : int
+        extra basis vectors carried between windows to speed up convergence.
+    maxiter : int
+        maximum number of subspace iterations per warm started window.
+    tol : float
+        convergence tolerance on the relative eigen-residual
+        |X^T X v - s^2 v| / s^2 of each kept eigenspectrum v.
+    n_jobs : int
+        Number of worker processes, -1 uses all cores.
+
+    Returns
+    -------
+    stack : PhaseStack
+
+    """
+    specMatrix, names, _, phases = snid.datasetSpecMatrix(dataset)
+    wavelengths = dataset[list(dataset.keys())[0]].wavelengths
+    centers = np.arange(phasemin, phasemax + step/2.0, step)
+    selections = [windowSelection(names, phases, c, width, uniquePhase) for c in centers]
+
+    nblocks = max(1, min(snid.numWorkers(n_jobs), len(centers)))
+    blocks = np.array_split(np.arange(len(centers)), nblocks)
+    tasks = [(specMatrix, [selections[i] for i in blk], ncomp, oversample, maxiter, tol)
+             for blk in blocks]
+    results = snid.parallelMap(_fitWindowBlock, tasks, n_jobs=n_jobs)
+
+    evecs = np.concatenate([res[0] for res in results])
+    evals = np.concatenate([res[1] for res in results])
+    means = np.concatenate([res[2] for res in results])
+    warm = np.concatenate([res[3] for res in results])
+
+    # chain the eigenspectra signs along the whole grid, across block boundaries
+    prev = None
+    for i in range(len(centers)):
+        nkeep = np.sum(np.isfinite(evals[i]))
+        if nkeep == 0:
+            continue
+        if prev is not None:
+            sgn = alignSigns(evecs[i,:nkeep], np.nan_to_num(evecs[prev]))
+            evecs[i,:nkeep] = evecs[i,:nkeep] * sgn[:,None]
+        prev = i
+    nspec = np.array([len(rows) for rows in selections])
+    return PhaseStack(centers, width, wavelengths, evecs, evals, means, nspec, warm)
@@ -0,0 +1,367 @@
+import SNIDsn
+import SNIDdataset as snid
+import SESNClassifier
+
+import numpy as np
+import argparse
+import asyncio
+import collections
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def preprocessLnw(lnwtext, minwvl=4000, maxwvl=7000, velcut=3000):
+    """
+    Preprocesses the spectra of an uploaded SNID .lnw template for
+    SESNClassifier.classify: gaps are flagged with NaN, and the spectra are
+    cut to (minwvl, maxwvl) and smoothed as in
+    Classify_New_SN_Tutorial.ipynb. Unlike the tutorial the gaps are not
+    interpolated and no phase is dropped, since classify fits only the
+    observed pixels. The smoothing needs every pixel, so gaps are bridged
+    linearly for it and flagged with NaN again afterwards.
+
+    Parameters
+    ----------
+    lnwtext : string
+        contents of the .lnw file.
+    minwvl : float
+    maxwvl : float
+    velcut : float
+        velocity cut for the smoothing (km/s)
+
+    Returns
+    -------
+    snname : string
+    spectra : np.array
+        (nphases, nwvlbins) preprocessed fluxes, NaN in gaps
+    phases : np.array
+    wavelengths : np.array
+
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.lnw', delete=False) as lnw:
+        lnw.write(lnwtext)
+    try:
+        snobj = SNIDsn.SNIDsn()
+        snobj.loadSNIDlnw(lnw.name)
+    finally:
+        os.remove(lnw.name)
+    snname = snobj.header['SN']
+    dataset = collections.OrderedDict([(snname, snobj)])
+    snid.snidsetNAN(dataset)
+    snid.datasetWavelengthRange(dataset, minwvl, maxwvl)
+    cols = snobj.getSNCols()
+    for phk in cols:
+        missing = ~np.isfinite(snobj.data[phk])
+        if np.all(missing):
+            continue
+        if np.any(missing):
+            wvl = snobj.wavelengths
+            snobj.data[phk] = np.interp(wvl, wvl[~missing], snobj.data[phk][~missing])
+        snobj.smoothSpectrum(phk, velcut)
+        snobj.data[phk][missing] = np.nan
+    spectra = np.array([snobj.data[phk] for phk in cols], dtype=float)
+    return snname, spectra, np.asarray(snobj.phases, dtype=float), np.asarray(snobj.wavelengths, dtype=float)
+
+
+class ServerStats:
+    """
+    Request, batch, latency and throughput counters of a
+    ClassificationServer. Latencies of the most recent requests are kept.
+    """
+
+    def __init__(self, window=1000):
+        self.start = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.spectra = 0
+        self.batches = 0
+        self.latencies = collections.deque(maxlen=window)
+        return
+
+    def addRequest(self, nspec, latency):
+        """
+        Records a served classification request of nspec spectra.
+        """
+        self.requests += 1
+        self.spectra += nspec
+        self.latencies.append(latency)
+        return
+
+    def summary(self):
+        """
+        Returns
+        -------
+        stats : dict
+            counters, mean batch size, spectra per second since the
+            server started, and latency percentiles in ms.
+
+        """
+        uptime = time.time() - self.start
+        stats = {'uptime_s':uptime, 'requests':self.requests, 'errors':self.errors,
+                 'spectra':self.spectra, 'batches':self.batches,
+                 'mean_batch_size':self.spectra / float(max(self.batches, 1)),
+                 'spectra_per_s':self.spectra / max(uptime, 1e-9)}
+        if len(self.latencies) > 0:
+            lat = 1e3 * np.array(self.latencies)
+            stats['latency_ms'] = {'mean':float(np.mean(lat)), 'p50':float(np.percentile(lat, 50)),
+                                   'p95':float(np.percentile(lat, 95)), 'max':float(np.max(lat))}
+        return stats
+
+
+class ClassificationServer:
+    """
+    Long running local classification service. The SESNClassifier is
+    loaded once, and requests are served over HTTP on a localhost TCP port
+    or a Unix socket. Concurrent requests are micro-batched: spectra that
+    arrive within maxDelay seconds of each other are classified together
+    with one SESNClassifier.classify call. .lnw uploads are preprocessed in
+    a pool of worker processes.
+
+    Endpoints
+    ---------
+    POST /classify
+        JSON body {"spectra": [[...], ...], "phases": [...]}, with the
+        spectra preprocessed on the classifier wavelength grid and NaN
+        where missing.
+    POST /classify/lnw
+        body is the text of a SNID .lnw template. Every phase that
+        SESNClassifier.usableSpectra accepts is classified.
+    GET /stats
+        ServerStats.summary
+    GET /health
+    """
+
+    def __init__(self, clf, maxBatch=256, maxDelay=0.005, n_jobs=None, lnwOptions=None):
+        """
+        Parameters
+        ----------
+        clf : SESNClassifier
+        maxBatch : int
+            maximum number of spectra per batch.
+        maxDelay : float
+            seconds to wait for more requests before running a batch.
+        n_jobs : int
+            Number of processes for .lnw preprocessing, see
+            SNIDdataset.numWorkers.
+        lnwOptions : dict
+            keyword arguments of preprocessLnw.
+
+        """
+        self.clf = clf
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.lnwOptions = {} if lnwOptions is None else lnwOptions
+        self.pool = ProcessPoolExecutor(max_workers=snid.numWorkers(n_jobs))
+        self.stats = ServerStats()
+        self.queue = None
+        self.servers = []
+        return
+
+    async def classify(self, spectra, phases):
+        """
+        Queues spectra for the next batch and waits for their result.
+
+        Returns
+        -------
+        types : np.array
+        probs : np.array
+
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((np.atleast_2d(np.asarray(spectra, dtype=float)),
+                              np.atleast_1d(np.asarray(phases, dtype=float)), future))
+        return await future
+
+    async def batcher(self):
+        """
+        Collects queued requests into batches of at most maxBatch spectra
+        and classifies every batch with one call.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            items = [await self.queue.get()]
+            nspec = len(items[0][0])
+            deadline = loop.time() + self.maxDelay
+            while nspec < self.maxBatch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                nspec += len(item[0])
+
+            try:
+                types, probs = self.clf.classify(np.vstack([item[0] for item in items]),
+                                                 np.concatenate([item[1] for item in items]))
+            except Exception as err:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(err)
+                continue
+            self.stats.batches += 1
+            start = 0
+            for spectra, _, future in items:
+                # the future of a disconnected client is already cancelled
+                if not future.done():
+                    future.set_result((types[start:start + len(spectra)], probs[start:start + len(spectra)]))
+                start += len(spectra)
+
+    async def route(self, method, path, body):
+        """
+        Handles one request.
+
+        Returns
+        -------
+        status : int
+        payload : dict
+
+        """
+        if method == 'GET' and path == '/health':
+            return 200, {'status':'ok'}
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats.summary()
+        if method == 'POST' and path == '/classify':
+            request = json.loads(body.decode())
+            spectra = np.atleast_2d(np.asarray(request['spectra'], dtype=float))
+            phases = np.atleast_1d(np.asarray(request['phases'], dtype=float))
+            if spectra.ndim != 2 or spectra.shape[1] != len(self.clf.wavelengths):
+                return 400, {'error':'spectra must have %d wavelength bins'%(len(self.clf.wavelengths))}
+            if phases.ndim != 1 or len(phases) != len(spectra):
+                return 400, {'error':'%d phases given for %d spectra'%(phases.size, len(spectra))}
+            _, usable = self.clf.usableSpectra(spectra, phases)
+            if not np.all(usable):
+                return 400, {'error':'spectra %s are outside every phase window or have too few observed pixels'
+                                     %(np.flatnonzero(~usable).tolist())}
+            types, probs = await self.classify(spectra, phases)
+            return 200, {'types':types.tolist(), 'probs':probs.tolist(),
+                         'typeNames':self.clf.typeNames.tolist()}
+        if method == 'POST' and path == '/classify/lnw':
+            loop = asyncio.get_event_loop()
+            snname, spectra, phases, wavelengths = await loop.run_in_executor(
+                self.pool, _preprocessLnwTask, (body.decode(), self.lnwOptions))
+            if len(spectra) > 0 and len(wavelengths) != len(self.clf.wavelengths):
+                return 400, {'error':'preprocessed spectra do not match the classifier wavelengths'}
+            # phases outside every window, or with too few observed pixels, are skipped
+            if len(spectra) > 0:
+                _, usable = self.clf.usableSpectra(spectra, phases)
+                spectra, phases = spectra[usable], phases[usable]
+            if len(spectra) == 0:
+                return 200, {'sn':snname, 'phases':[], 'types':[], 'probs':[],
+                             'typeNames':self.clf.typeNames.tolist()}
+            types, probs = await self.classify(spectra, phases)
+            return 200, {'sn':snname, 'phases':phases.tolist(), 'types':types.tolist(),
+                         'probs':probs.tolist(), 'typeNames':self.clf.typeNames.tolist()}
+        return 404, {'error':'unknown endpoint %s %s'%(method, path)}
+
+    async def handle(self, reader, writer):
+        """
+        Serves HTTP/1.1 requests on one connection until it is closed.
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path = requestLine.decode().split()[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode().partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                start = time.time()
+                try:
+                    status, payload = await self.route(method, path, body)
+                except Exception as err:
+                    status, payload = 500, {'error':repr(err)}
+                if status == 200 and 'types' in payload:
+                    self.stats.addRequest(len(payload['types']), time.time() - start)
+                elif status != 200:
+                    self.stats.errors += 1
+
+                data = json.dumps(payload).encode()
+                reason = {200:'OK', 400:'Bad Request', 404:'Not Found', 500:'Internal Server Error'}[status]
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                              'Content-Length: %d\r\n\r\n'%(status, reason, len(data))).encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+        return
+
+    async def start(self, host='127.0.0.1', port=8765, unixPath=None):
+        """
+        Starts listening on host:port, or on the Unix socket unixPath if
+        given, and starts the batcher.
+        """
+        self.queue = asyncio.Queue()
+        self.batchTask = asyncio.ensure_future(self.batcher())
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unixPath)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        self.servers.append(server)
+        return server
+
+    async def stop(self):
+        """
+        Stops listening and shuts down the batcher and worker pool.
+        """
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.batchTask.cancel()
+        self.pool.shutdown()
+        return
+
+    def serveForever(self, host='127.0.0.1', port=8765, unixPath=None):
+        """
+        Runs the server in a new event loop until interrupted.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self.start(host, port, unixPath))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.stop())
+            loop.close()
+        return
+
+
+def _preprocessLnwTask(task):
+    """
+    Worker for .lnw uploads in ClassificationServer.
+    """
+    lnwtext, options = task
+    return preprocessLnw(lnwtext, **options)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SESN classification server.')
+    parser.add_argument('classifier', help='SESNClassifier .npz file, see SNeCV.trainClassifier')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='serve on this Unix socket path instead of TCP')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay', type=float, default=0.005, help='seconds')
+    parser.add_argument('--n-jobs', type=int, default=None, help='processes for .lnw preprocessing')
+    args = parser.parse_args()
+
+    clf = SESNClassifier.SESNClassifier.load(args.classifier)
+    server = ClassificationServer(clf, maxBatch=args.max_batch, maxDelay=args.max_delay, n_jobs=args.n_jobs)
+    server.serveForever(args.host, args.port, args.unix)
@@ -0,0 +1,379 @@
+import SNIDdataset as snid
+import SNIDsn
+
+import numpy as np
+import os
+import scipy.stats as st
+
+
+def datasetChunks(dataset, chunksize):
+    """
+    Yields the spectra of a SNIDdataset in chunks of at most chunksize rows.
+
+    Parameters
+    ----------
+    dataset : SNIDdataset object
+    chunksize : int
+
+    Returns
+    -------
+    chunk : np.array
+        (nchunk, nwvlbins) fluxes
+
+    """
+    chunk = []
+    for snname in list(dataset.keys()):
+        snobj = dataset[snname]
+        for phk in snobj.getSNCols():
+            chunk.append(np.asarray(snobj.data[phk], dtype=float))
+            if len(chunk) == chunksize:
+                yield np.array(chunk)
+                chunk = []
+    if len(chunk) > 0:
+        yield np.array(chunk)
+
+def pickleChunks(paths, chunksize):
+    """
+    Yields the spectra of a list of pickled SNIDdatasets in chunks. Only
+    one pickle is held in memory at a time.
+
+    Parameters
+    ----------
+    paths : list
+        paths to pickled SNIDdataset objects.
+    chunksize : int
+
+    Returns
+    -------
+    chunk : np.array
+
+    """
+    for path in paths:
+        dataset = snid.loadPickle(path)
+        for chunk in datasetChunks(dataset, chunksize):
+            yield chunk
+        del dataset
+
+def lnwChunks(pathdir, filenames, chunksize, prep=None):
+    """
+    Yields the spectra of SNID .lnw templates in chunks, loading one template
+    at a time. The templates must share a wavelength grid after prep.
+
+    Parameters
+    ----------
+    pathdir : string
+        path to the SNID template directory.
+    filenames : list
+        .lnw file names in pathdir. Uses every .lnw file if None.
+    chunksize : int
+    prep : function
+        Called on every loaded SNIDsn object before its spectra are used,
+        e.g. to apply the snidNAN, gap interpolation, wavelength cut and
+        smoothing steps.
+
+    Returns
+    -------
+    chunk : np.array
+
+    """
+    if filenames is None:
+        filenames = sorted(fname for fname in os.listdir(pathdir) if fname.endswith('.lnw'))
+    chunk = []
+    for fname in filenames:
+        snobj = SNIDsn.SNIDsn()
+        snobj.loadSNIDlnw(os.path.join(pathdir, fname))
+        if prep is not None:
+            prep(snobj)
+        for phk in snobj.getSNCols():
+            chunk.append(np.asarray(snobj.data[phk], dtype=float))
+            if len(chunk) == chunksize:
+                yield np.array(chunk)
+                chunk = []
+    if len(chunk) > 0:
+        yield np.array(chunk)
+
+def memmapChunks(path, chunksize):
+    """
+    Yields row chunks of a (nspec, nwvlbins) spectra matrix stored as a .npy
+    file, which is memory mapped rather than read into memory.
+
+    Parameters
+    ----------
+    path : string
+        path to .npy file
+    chunksize : int
+
+    Returns
+    -------
+    chunk : np.array
+
+    """
+    store = np.load(path, mmap_mode='r')
+    for start in range(0, store.shape[0], chunksize):
+        yield np.array(store[start:start + chunksize], dtype=float)
+
+
+class StreamingPCA:
+    """
+    Out-of-core PCA. Spectra are streamed in chunks and only the running
+    mean and the (nwvlbins, nwvlbins) cross product matrix are kept, so peak
+    memory is bounded by the chunk size rather than the library size. The
+    fitted attributes mirror SNePCA.snidPCA.
+    """
+
+    def __init__(self):
+        self.nspec = 0
+        self.shift = None
+        self.sum = None
+        self.crossprod = None
+        self.mean = None
+        self.evecs = None
+        self.evals = None
+        self.evals_cs = None
+        self.variances = None
+        return
+
+    def partialFit(self, chunk):
+        """
+        Adds a chunk of spectra to the running sums.
+
+        Parameters
+        ----------
+        chunk : np.array
+            (nchunk, nwvlbins) fluxes
+
+        Returns
+        -------
+
+        """
+        chunk = np.atleast_2d(np.asarray(chunk, dtype=float))
+        if self.shift is None:
+            # accumulate about the first chunk mean to limit cancellation
+            nwvl = chunk.shape[1]
+            self.shift = np.mean(chunk, axis=0)
+            self.sum = np.zeros(nwvl)
+            self.crossprod = np.zeros((nwvl, nwvl))
+        shifted = chunk - self.shift
+        self.nspec = self.nspec + len(chunk)
+        self.sum += np.sum(shifted, axis=0)
+        self.crossprod += np.dot(shifted.T, shifted)
+        return
+
+    def finalize(self):
+        """
+        Calculates the eigenspectra from the accumulated sums and stores
+        them in self.evecs, with the explained variance ratios in
+        self.evals and the variances in self.variances. As with
+        sklearn.decomposition.PCA, min(nspec, nwvlbins) components are
+        kept, and each eigenspectrum is signed so that its largest
+        amplitude pixel is positive.
+
+        Returns
+        -------
+
+        """
+        shiftedMean = self.sum / self.nspec
+        self.mean = self.shift + shiftedMean
+        cov = (self.crossprod - self.nspec * np.outer(shiftedMean, shiftedMean)) / (self.nspec - 1)
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1][:min(self.nspec, len(eigvals))]
+        evecs = eigvecs[:, order].T
+        peaks = evecs[np.arange(len(evecs)), np.argmax(np.abs(evecs), axis=1)]
+        self.evecs = evecs * np.where(peaks < 0, -1.0, 1.0)[:,None]
+        self.variances = np.clip(eigvals[order], 0, None)
+        self.evals = self.variances / np.sum(np.clip(eigvals, 0, None))
+        self.evals_cs = self.evals.cumsum()
+        return
+
+    def fit(self, chunks):
+        """
+        Streams all chunks through partialFit and calculates the eigenspectra.
+
+        Parameters
+        ----------
+        chunks : iterable
+            chunks of spectra, e.g. from pickleChunks, lnwChunks or memmapChunks.
+
+        Returns
+        -------
+
+        """
+        for chunk in chunks:
+            self.partialFit(chunk)
+        self.finalize()
+        return
+
+    def transform(self, chunks, ncomp=None):
+        """
+        Calculates the PCA coefficients of streamed spectra. As in
+        SNePCA.calcPCACoeffs the spectra are not mean subtracted.
+
+        Parameters
+        ----------
+        chunks : iterable
+        ncomp : int
+            number of coefficients. Defaults to all.
+
+        Returns
+        -------
+        coeffs : np.array
+            one coefficient chunk per input chunk
+
+        """
+        for chunk in chunks:
+            yield np.dot(chunk, self.evecs[:ncomp].T)
+
+
+class AnomalyScorer:
+    """
+    Flags spectra that are poorly described by a PCA model. Two
+    statistics are computed for every spectrum: the Q statistic, the
+    squared residual norm after projecting the mean subtracted spectrum
+    onto the first ncomp eigenspectra, and Hotelling's T^2, the squared
+    length of the projection in units of the component standard
+    deviations. A large Q means the spectrum has structure the
+    eigenspectra do not describe, and a large T^2 means it is described but
+    lies far from the bulk of the library. Spectra are scored chunk by
+    chunk, e.g. from memmapChunks, so libraries of any size can be scored.
+    Scorers are built with SNePCA.anomalyScorer or fromStreamingPCA.
+    """
+
+    def __init__(self, mean, evecs, variances, ncomp, nspec):
+        """
+        Parameters
+        ----------
+        mean : np.array
+            (nwvlbins,) mean spectrum of the training set.
+        evecs : np.array
+            (>= ncomp, nwvlbins) orthonormal eigenspectra.
+        variances : np.array
+            variances of the training set along all eigenspectra, in
+            decreasing order.
+        ncomp : int
+            Number of eigenspectra of the model.
+        nspec : int
+            Number of training spectra.
+
+        """
+        self.mean = np.asarray(mean, dtype=float)
+        self.evecs = np.asarray(evecs, dtype=float)[:ncomp]
+        self.variances = np.asarray(variances, dtype=float)
+        self.ncomp = ncomp
+        self.nspec = nspec
+        self.qLimit = None
+        self.t2Limit = None
+        return
+
+    @classmethod
+    def fromStreamingPCA(cls, stream, ncomp):
+        """
+        Builds a scorer from a fitted StreamingPCA.
+        """
+        return cls(stream.mean, stream.evecs, stream.variances, ncomp, stream.nspec)
+
+    def scores(self, spectra):
+        """
+        Calculates the Q and T^2 statistics of a batch of spectra.
+
+        Parameters
+        ----------
+        spectra : np.array
+            (nspec, nwvlbins) fluxes.
+
+        Returns
+        -------
+        Q : np.array
+            (nspec,) squared residual norms.
+        T2 : np.array
+            (nspec,) Hotelling's T^2.
+
+        """
+        centered = np.atleast_2d(np.asarray(spectra, dtype=float)) - self.mean
+        coeffs = np.dot(centered, self.evecs.T)
+        # the eigenspectra are orthonormal, so the projection removes
+        # exactly sum(coeffs**2) from the squared norm
+        sqcoeffs = coeffs**2
+        Q = np.clip(np.einsum('ij,ij->i', centered, centered) - np.sum(sqcoeffs, axis=1), 0, None)
+        T2 = np.dot(sqcoeffs, 1.0 / self.variances[:self.ncomp])
+        return Q, T2
+
+    def scoreChunks(self, chunks):
+        """
+        Scores streamed spectra, e.g. memmapChunks of a .npy store.
+
+        Parameters
+        ----------
+        chunks : iterable
+
+        Returns
+        -------
+        Q : np.array
+        T2 : np.array
+
+        """
+        Qs = []
+        T2s = []
+        for chunk in chunks:
+            Q, T2 = self.scores(chunk)
+            Qs.append(Q)
+            T2s.append(T2)
+        return np.concatenate(Qs), np.concatenate(T2s)
+
+    def calibrate(self, chunks=None, alpha=0.01, method='empirical'):
+        """
+        Sets the thresholds self.qLimit and self.t2Limit, which a fraction
+        alpha of normal spectra are expected to exceed.
+
+        Parameters
+        ----------
+        chunks : iterable
+            training spectra, required for method='empirical'.
+        alpha : float
+        method : string
+            'empirical' takes the 1 - alpha quantiles of the statistics of
+            the training spectra. These are scored by the model fit to
+            them, so the Q limit is somewhat optimistic. 'parametric' uses
+            the scaled chi^2 approximation of Box (1954) for Q, which
+            matches the first two moments given by the variances of the
+            discarded components, and the F distribution of T^2 for new
+            spectra. Box's approximation is used rather than Jackson &
+            Mudholkar (1979), which breaks down for the few and steeply
+            falling discarded variances of small libraries.
+
+        Returns
+        -------
+
+        Raises
+        ------
+        ValueError
+            for an unknown method, or method='empirical' without chunks.
+
+        """
+        if method == 'empirical':
+            if chunks is None:
+                raise ValueError("method='empirical' needs the training spectra as chunks")
+            Q, T2 = self.scoreChunks(chunks)
+            self.qLimit = np.percentile(Q, 100 * (1 - alpha))
+            self.t2Limit = np.percentile(T2, 100 * (1 - alpha))
+        elif method == 'parametric':
+            theta1 = np.sum(self.variances[self.ncomp:])
+            theta2 = np.sum(self.variances[self.ncomp:]**2)
+            self.qLimit = theta2 / theta1 * st.chi2.ppf(1 - alpha, theta1**2 / theta2)
+            n, k = self.nspec, self.ncomp
+            self.t2Limit = k * (n - 1) * (n + 1) / float(n * (n - k)) * st.f.ppf(1 - alpha, k, n - k)
+        else:
+            raise ValueError("method must be 'empirical' or 'parametric'")
+        return
+
+    def flags(self, Q, T2):
+        """
+        Returns
+        -------
+        qFlag : np.array
+            spectra above the Q limit.
+        t2Flag : np.array
+            spectra above the T^2 limit.
+
+        """
+        return Q > self.qLimit, T2 > self.t2Limit
+
@@ -0,0 +1,321 @@
+import SNIDdataset as snid
+import SESNClassifier
+import SNeServer
+
+import numpy as np
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+def watchFolder(dropdir, done=(), pollInterval=2.0, once=False, suffix='.lnw'):
+    """
+    Polls dropdir for new files and yields them in batches, oldest first.
+    A file is only yielded once its size is unchanged between two polls,
+    so files that are still being written are not picked up. An empty
+    batch is yielded after every poll without new files, so that consumers
+    can do other work while waiting.
+
+    Parameters
+    ----------
+    dropdir : string
+    done : iterable
+        file names that were already processed, e.g. from a log.
+    pollInterval : float
+        seconds between polls.
+    once : Boolean
+        If True, stops after the files present at the first poll (still
+        waiting for their sizes to settle).
+    suffix : string
+
+    Returns
+    -------
+    batch : list
+        paths of new files
+
+    """
+    seen = set(done)
+    sizes = {}
+    first = True
+    while True:
+        names = [fname for fname in os.listdir(dropdir) if fname.endswith(suffix) and fname not in seen]
+        if first and once:
+            pending = set(names)
+        stamps = []
+        for fname in names:
+            # files removed since the listing are skipped
+            try:
+                path = os.path.join(dropdir, fname)
+                stamps.append((os.path.getmtime(path), os.path.getsize(path), fname))
+            except OSError:
+                sizes.pop(fname, None)
+                if once:
+                    pending.discard(fname)
+        batch = []
+        for _, size, fname in sorted(stamps):
+            if sizes.get(fname) == size:
+                seen.add(fname)
+                del sizes[fname]
+                batch.append(os.path.join(dropdir, fname))
+            else:
+                sizes[fname] = size
+        yield batch
+        if once:
+            pending.difference_update(os.path.basename(path) for path in batch)
+            if not first and len(pending) == 0:
+                return
+        first = False
+        time.sleep(pollInterval)
+
+
+def selectPhases(phases, windows, uniquePhase=True):
+    """
+    Selects the phases that fall in one of the classifier phase windows.
+    If uniquePhase is True only the phase closest to each window center is
+    kept, as with SNIDdataset.filterPhases(uniquePhaseFlag=True).
+
+    Parameters
+    ----------
+    phases : np.array
+    windows : np.array
+        (nwindows, 2) phase ranges
+    uniquePhase : Boolean
+
+    Returns
+    -------
+    inds : list
+        (phase index, window index) pairs
+
+    """
+    phases = np.asarray(phases, dtype=float)
+    inds = []
+    for w, (phmin, phmax) in enumerate(windows):
+        inWindow = np.where((phases >= phmin) & (phases <= phmax))[0]
+        if len(inWindow) == 0:
+            continue
+        if uniquePhase:
+            inWindow = [inWindow[np.argmin(np.abs(phases[inWindow] - (phmin + phmax) / 2.0))]]
+        inds.extend((i, w) for i in inWindow)
+    return inds
+
+
+def _preprocessFile(task):
+    """
+    Worker for classifyStream. Reads and preprocesses one .lnw file.
+    """
+    path, options = task
+    with open(path) as lnw:
+        lnwtext = lnw.read()
+    return SNeServer.preprocessLnw(lnwtext, **options)
+
+
+def classifyStream(batches, clf, n_jobs=None, maxPending=None, uniquePhase=True, lnwOptions=None):
+    """
+    Pipeline stage that preprocesses streamed .lnw files in a pool of
+    worker processes and classifies the selected phases. At most
+    maxPending files are in flight, so memory stays bounded however many
+    files arrive. Records are yielded as files complete, which may differ
+    from the input order.
+
+    Parameters
+    ----------
+    batches : iterable
+        batches of file paths, e.g. from watchFolder.
+    clf : SESNClassifier
+    n_jobs : int
+        Number of worker processes, see SNIDdataset.numWorkers.
+    maxPending : int
+        Maximum number of files in flight. Defaults to twice the number
+        of workers.
+    uniquePhase : Boolean
+        see selectPhases.
+    lnwOptions : dict
+        keyword arguments of SNeServer.preprocessLnw.
+
+    Returns
+    -------
+    record : dict
+        file, sn, status ('ok', 'no phases' or 'error'), time, and one
+        result per selected phase with enough observed pixels (see
+        SESNClassifier.usableSpectra) with its phase, the window whose SVM
+        ensemble classified it (the one with the closest center, see
+        SESNClassifier.windowIndex), type and vote fractions per type.
+
+    """
+    nworkers = snid.numWorkers(n_jobs)
+    if maxPending is None:
+        maxPending = 2 * nworkers
+    options = {} if lnwOptions is None else lnwOptions
+
+    def record(path, future):
+        rec = {'file':os.path.basename(path), 'time':time.time()}
+        try:
+            snname, spectra, phases, wavelengths = future.result()
+        except Exception as err:
+            rec.update({'status':'error', 'error':repr(err)})
+            return rec
+        rec['sn'] = snname
+        # a phase selected for several overlapping windows is classified once
+        rows = sorted(set(i for i, _ in selectPhases(phases, clf.windows, uniquePhase)))
+        if len(rows) == 0:
+            rec['status'] = 'no phases'
+            return rec
+        if len(wavelengths) != len(clf.wavelengths):
+            rec.update({'status':'error', 'error':'spectra do not match the classifier wavelengths'})
+            return rec
+        # the window whose ensemble classify uses; phases with too few
+        # observed pixels are skipped
+        windows, usable = clf.usableSpectra(spectra[rows], phases[rows])
+        rows, windows = np.asarray(rows)[usable], windows[usable]
+        if len(rows) == 0:
+            rec['status'] = 'no phases'
+            return rec
+        types, probs = clf.classify(spectra[rows], phases[rows])
+        rec['status'] = 'ok'
+        rec['results'] = [{'phase':float(phases[i]), 'window':clf.windows[w].tolist(), 'type':str(tp),
+                           'probs':dict(zip(clf.typeNames.tolist(), prob.tolist()))}
+                          for i, w, tp, prob in zip(rows, windows, types, probs)]
+        return rec
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=nworkers) as pool:
+        for batch in batches:
+            for path in batch:
+                while len(pending) >= maxPending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        yield record(pending.pop(future), future)
+                pending[pool.submit(_preprocessFile, (path, options))] = path
+            finished = [future for future in pending if future.done()]
+            for future in finished:
+                yield record(pending.pop(future), future)
+        for future in list(pending):
+            yield record(pending.pop(future), future)
+
+
+class JSONLLog:
+    """
+    Append-only JSON lines result log. Every processed file has one line,
+    which also serves as the checkpoint of the pipeline.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        return
+
+    def done(self):
+        """
+        Returns the set of file names already in the log.
+        """
+        names = set()
+        if os.path.exists(self.path):
+            with open(self.path) as log:
+                for line in log:
+                    try:
+                        names.add(json.loads(line)['file'])
+                    except ValueError:
+                        # a line cut short by an interrupted write
+                        continue
+        return names
+
+    def append(self, rec):
+        """
+        Appends a record and flushes it to disk.
+        """
+        with open(self.path, 'a') as log:
+            log.write(json.dumps(rec) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+        return
+
+
+class SQLiteLog:
+    """
+    Result log in a SQLite table (file, sn, status, time, record), with
+    the full record stored as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results '
+                          '(file TEXT PRIMARY KEY, sn TEXT, status TEXT, time REAL, record TEXT)')
+        self.conn.commit()
+        return
+
+    def done(self):
+        """
+        Returns the set of file names already in the log.
+        """
+        return set(row[0] for row in self.conn.execute('SELECT file FROM results'))
+
+    def append(self, rec):
+        """
+        Inserts a record and commits it.
+        """
+        self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                          (rec['file'], rec.get('sn'), rec['status'], rec['time'], json.dumps(rec)))
+        self.conn.commit()
+        return
+
+
+def openLog(path):
+    """
+    Returns a SQLiteLog for .sqlite or .db paths and a JSONLLog otherwise.
+    """
+    if os.path.splitext(path)[1] in ('.sqlite', '.db'):
+        return SQLiteLog(path)
+    return JSONLLog(path)
+
+
+def runPipeline(dropdir, clf, logpath, n_jobs=None, pollInterval=2.0, once=False, uniquePhase=True,
+                lnwOptions=None):
+    """
+    Watches dropdir and classifies every new .lnw file, appending the
+    results to the log at logpath. Files already in the log are skipped,
+    so a restarted pipeline resumes where it stopped.
+
+    Parameters
+    ----------
+    dropdir : string
+    clf : SESNClassifier
+    logpath : string
+        .jsonl, or .sqlite/.db for a SQLite log.
+    n_jobs : int
+    pollInterval : float
+    once : Boolean
+        Process the files currently in dropdir and stop.
+    uniquePhase : Boolean
+    lnwOptions : dict
+
+    Returns
+    -------
+    record : dict
+        every logged record, see classifyStream.
+
+    """
+    log = openLog(logpath)
+    batches = watchFolder(dropdir, done=log.done(), pollInterval=pollInterval, once=once)
+    for rec in classifyStream(batches, clf, n_jobs=n_jobs, uniquePhase=uniquePhase, lnwOptions=lnwOptions):
+        log.append(rec)
+        yield rec
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify .lnw files dropped into a directory.')
+    parser.add_argument('dropdir')
+    parser.add_argument('classifier', help='SESNClassifier .npz file, see SNeCV.trainClassifier')
+    parser.add_argument('--log', default='classifications.jsonl', help='.jsonl, or .sqlite/.db')
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--poll', type=float, default=2.0, help='seconds between polls')
+    parser.add_argument('--once', action='store_true', help='process the current files and stop')
+    args = parser.parse_args()
+
+    clf = SESNClassifier.SESNClassifier.load(args.classifier)
+    for rec in runPipeline(args.dropdir, clf, args.log, n_jobs=args.n_jobs, pollInterval=args.poll,
+                           once=args.once):
+        summary = ', '.join('%.1f d %s'%(res['phase'], res['type']) for res in rec.get('results', []))
+        print('%s %s %s'%(rec['file'], rec['status'], summary))